@@ -0,0 +1,244 @@
+import argparse
+import json
+import statistics
+import sys
+import tracemalloc
+
+from dataclasses import asdict
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from pathlib import Path
+from time import perf_counter
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from pyfriends.core import ParserEngine
+from pyfriends.core import SceneCategory
+from pyfriends.core import _classify_line
+from pyfriends.core import _define_category
+from pyfriends.core import _parse_episode_file
+from pyfriends.core import _read_episode_document
+from pyfriends.core import _retrieve_parser_engine
+from pyfriends.core import folder_seasons
+from pyfriends.core import retrieve_episode_details
+from pyfriends.text_utils import clean_line
+
+# Machine-specific, so it's kept out of git. Each machine saves its own with --save-baseline
+default_baseline_path = Path(__file__).parent.parent.joinpath("benchmarks", "parser-baseline.json")
+# Files with so few paragraphs that the parser splits them by blank lines instead
+fallback_episode_files = ["0212-0213.html", "0915.html", "0204.html"]
+# Files which aren't episodes at all, thus only reading them is measured
+irregular_files = ["0423uncut.html", "07outtakes.html"]
+
+
+@dataclass(frozen=True)
+class BenchmarkCase:
+    name: str
+    # When it returns an int, that's how many items, such as lines, it handled and throughput is reported
+    function: Callable[[], object]
+    rounds: int
+
+
+@dataclass(frozen=True)
+class BenchmarkResult:
+    name: str
+    # Seconds of the fastest and of the median round, the fastest one is what is compared against baselines
+    best_time: float
+    median_time: float
+    # Bytes allocated by Python at most at once during one more round, traced on its own
+    peak_memory: int
+    rounds: int
+    items: int = 0
+
+    @property
+    def throughput(self) -> float:
+        # Items per second in the fastest round
+        return self.items / self.best_time
+
+
+@dataclass(frozen=True)
+class Regression:
+    name: str
+    metric: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline
+
+
+def parser_cases(engine: Optional[ParserEngine] = None, rounds: int = 3) -> List[BenchmarkCase]:
+    # Nothing comes from the cache, the parser itself is what is measured
+    engine = _retrieve_parser_engine(engine)
+
+    def parse_seasons(*seasons: int) -> Callable[[], object]:
+        return lambda: [list(retrieve_episode_details(season, use_cache=False, engine=engine)) for season in seasons]
+
+    cases = [BenchmarkCase("corpus", parse_seasons(*range(1, 11)), max(1, rounds // 2))]
+    cases.extend(BenchmarkCase(f"season-{season:02}", parse_seasons(season), rounds) for season in range(1, 11))
+    for file_name in fallback_episode_files:
+        episode_path = folder_seasons.joinpath(file_name)
+        function = lambda episode_path=episode_path: _parse_episode_file(episode_path, False, engine)
+        cases.append(BenchmarkCase(f"file-{episode_path.stem}", function, rounds * 4))
+    for file_name in irregular_files:
+        file_path = folder_seasons.joinpath(file_name).absolute()
+        function = lambda file_path=file_path: list(_read_episode_document(file_path, engine).paragraphs)
+        cases.append(BenchmarkCase(f"read-{file_path.stem}", function, rounds * 4))
+    cases.append(BenchmarkCase("define-category", _define_category_case(engine), rounds * 4))
+    cases.append(BenchmarkCase("classify-lines", _classify_lines_case(engine), rounds * 4))
+    return cases
+
+
+def _define_category_case(engine: ParserEngine) -> Callable[[], object]:
+    # Every paragraph of season 1 as the parser hands it over, so only categorizing them is measured
+    # They're read on the first call, which is the warm-up round, so selecting other cases costs nothing
+    arguments: List[Tuple[Optional[SceneCategory], str, SceneCategory]] = []
+
+    def define_categories():
+        if not arguments:
+            for episode_path in sorted(folder_seasons.glob("01*.html")):
+                for paragraph in _read_episode_document(episode_path.absolute(), engine).paragraphs:
+                    text = paragraph.text.strip()
+                    if text:
+                        arguments.append((paragraph.look_back_category, text, SceneCategory.MAIN))
+        for look_back_category, text, current_category in arguments:
+            _define_category(look_back_category, text, current_category)
+
+    return define_categories
+
+
+def _classify_lines_case(engine: ParserEngine) -> Callable[[], int]:
+    # Every paragraph of the corpus as it comes out of the documents, cleaned and classified as the parser does
+    # Like in define-category, they're read on the warm-up round
+    lines: List[str] = []
+
+    def classify_lines() -> int:
+        if not lines:
+            for episode_path in sorted(folder_seasons.glob("*.html")):
+                lines.extend(
+                    paragraph.text for paragraph in _read_episode_document(episode_path.absolute(), engine).paragraphs
+                )
+        for line in lines:
+            _classify_line(clean_line(line))
+        return len(lines)
+
+    return classify_lines
+
+
+def run_benchmarks(cases: Sequence[BenchmarkCase]) -> List[BenchmarkResult]:
+    results = []
+    for case in cases:
+        # One round to warm up, so imports and caches of the interpreter don't count
+        items = case.function()
+        times = []
+        for _ in range(case.rounds):
+            started_at = perf_counter()
+            case.function()
+            times.append(perf_counter() - started_at)
+        # Tracing allocations slows everything down, so memory is measured in a round of its own
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        memory_before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        case.function()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        if not was_tracing:
+            tracemalloc.stop()
+        results.append(
+            BenchmarkResult(
+                case.name,
+                min(times),
+                statistics.median(times),
+                peak_memory - memory_before,
+                case.rounds,
+                items if type(items) is int else 0,
+            )
+        )
+    return results
+
+
+def save_baseline(results: Sequence[BenchmarkResult], path: Path = default_baseline_path) -> None:
+    # Cases which weren't run this time keep their previous baseline
+    baseline = load_baseline(path)
+    baseline.update({result.name: result for result in results})
+    path.parent.mkdir(parents=True, exist_ok=True)
+    content = {name: asdict(result) for name, result in sorted(baseline.items())}
+    path.write_text(json.dumps(content, indent=2) + "\n")
+
+
+def load_baseline(path: Path = default_baseline_path) -> Dict[str, BenchmarkResult]:
+    if not path.exists():
+        return {}
+    return {name: BenchmarkResult(**result) for name, result in json.loads(path.read_text()).items()}
+
+
+def find_regressions(
+    results: Sequence[BenchmarkResult],
+    baseline: Dict[str, BenchmarkResult],
+    time_threshold: float = 0.2,
+    memory_threshold: float = 0.2,
+) -> List[Regression]:
+    # A threshold of 0.2 tolerates up to 20% more than the baseline. Cases without baseline are never regressions
+    regressions = []
+    for result in results:
+        baseline_result = baseline.get(result.name)
+        if baseline_result is None:
+            continue
+        if result.best_time > baseline_result.best_time * (1 + time_threshold):
+            regressions.append(Regression(result.name, "time", baseline_result.best_time, result.best_time))
+        if baseline_result.peak_memory and result.peak_memory > baseline_result.peak_memory * (1 + memory_threshold):
+            regressions.append(Regression(result.name, "memory", baseline_result.peak_memory, result.peak_memory))
+    return regressions
+
+
+def format_results(results: Sequence[BenchmarkResult], baseline: Dict[str, BenchmarkResult]) -> str:
+    lines = [f"{'Case':<20}{'Best':>12}{'Median':>12}{'Peak memory':>14}{'Throughput':>16}{'vs baseline':>13}"]
+    for result in results:
+        baseline_result = baseline.get(result.name)
+        comparison = f"{result.best_time / baseline_result.best_time:.2f}x" if baseline_result else "-"
+        best_time = f"{result.best_time * 1000:.2f} ms"
+        median_time = f"{result.median_time * 1000:.2f} ms"
+        peak_memory = f"{result.peak_memory / 1024 ** 2:.2f} MiB"
+        throughput = f"{result.throughput:,.0f}/s" if result.items else "-"
+        lines.append(
+            f"{result.name:<20}{best_time:>12}{median_time:>12}{peak_memory:>14}{throughput:>16}{comparison:>13}"
+        )
+    return "\n".join(lines)
+
+
+def main(arguments: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m pyfriends.benchmark", description="Measures the raw layer parser and compares it to a baseline"
+    )
+    parser.add_argument("--cases", nargs="+", default=["*"], help="Patterns of the cases to run, like season-*")
+    parser.add_argument("--engine", choices=[engine.value for engine in ParserEngine], help="Parser engine")
+    parser.add_argument("--rounds", type=int, default=3, help="Measured rounds of each season")
+    parser.add_argument("--baseline", type=Path, default=default_baseline_path, help="Where the baseline is kept")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--time-threshold", type=float, default=0.2, help="Tolerated slowdown, 0.2 is 20%%")
+    parser.add_argument("--memory-threshold", type=float, default=0.2, help="Tolerated growth of peak memory")
+    options = parser.parse_args(arguments)
+
+    cases = parser_cases(options.engine, options.rounds)
+    cases = [case for case in cases if any(fnmatch(case.name, pattern) for pattern in options.cases)]
+    results = run_benchmarks(cases)
+    baseline = load_baseline(options.baseline)
+    print(format_results(results, baseline))
+    if options.save_baseline:
+        save_baseline(results, options.baseline)
+        print(f"Baseline saved at {options.baseline} 📌")
+        return 0
+    regressions = find_regressions(results, baseline, options.time_threshold, options.memory_threshold)
+    for regression in regressions:
+        print(f"Regression in {regression.name}: {regression.metric} is {regression.ratio:.2f}x its baseline 🐢")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
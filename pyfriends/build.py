@@ -0,0 +1,75 @@
+import argparse
+
+from contextlib import nullcontext
+from pathlib import Path
+from typing import List
+from typing import Optional
+
+from pyfriends.core import ParserEngine
+from pyfriends.database_utils import generate_connection
+from pyfriends.integration_layer_utils import ParquetOptions
+from pyfriends.integration_layer_utils import integration_layer_folder
+from pyfriends.integration_layer_utils import load_manifest
+from pyfriends.integration_layer_utils import rebuild_integration_layer
+from pyfriends.pipeline import StageReport
+from pyfriends.pipeline import run_pipeline
+
+
+def main(arguments: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m pyfriends.build", description="Builds the integration layer out of the raw layer"
+    )
+    parser.add_argument("--seasons", type=int, nargs="+", default=list(range(1, 11)), help="Seasons to be built")
+    parser.add_argument("--output", type=Path, default=integration_layer_folder, help="Where parquet files go")
+    parser.add_argument("--engine", choices=[engine.value for engine in ParserEngine], help="Parser engine")
+    parser.add_argument("--max-workers", type=int, help="Number of processes which parse episodes")
+    parser.add_argument(
+        "--compression", default="zstd", choices=["none", "snappy", "gzip", "brotli", "lz4", "zstd"], help="Codec"
+    )
+    parser.add_argument("--compression-level", type=int, help="Level of the compression codec")
+    parser.add_argument("--row-group-size", type=int, default=128 * 1024, help="Maximum rows per row group")
+    parser.add_argument("--skip-database", action="store_true", help="Build only the parquet files")
+    parser.add_argument("--enrich", action="store_true", help="Enrich episodes with details from TVMaze")
+    parser.add_argument(
+        "--incremental", action="store_true", help="Build only episodes whose transcripts have changed since last time"
+    )
+    options = parser.parse_args(arguments)
+    parquet_options = ParquetOptions(options.compression, options.compression_level, options.row_group_size)
+
+    database_connection = nullcontext() if options.skip_database else generate_connection()
+    with database_connection as connection:
+        if options.incremental and load_manifest(options.output):
+            print("Rebuilding only what has changed 🔁")
+            changes = rebuild_integration_layer(
+                options.output,
+                connection,
+                max_workers=options.max_workers,
+                engine=options.engine,
+                options=parquet_options,
+            )
+            print(f"{len(changes.changed_entries)} episodes rebuilt and {len(changes.removed_entries)} removed")
+            return
+        print("Building the whole integration layer 🏗")
+        reports = run_pipeline(
+            options.seasons,
+            options.output,
+            connection,
+            max_workers=options.max_workers,
+            engine=options.engine,
+            enrich_episodes=options.enrich,
+            parquet_options=parquet_options,
+        )
+    print(format_reports(reports))
+
+
+def format_reports(reports: List[StageReport]) -> str:
+    lines = [f"{'Stage':<10}{'Wall time':>12}{'Peak memory':>14}"]
+    for report in reports:
+        wall_time = f"{report.wall_time:.2f} s"
+        peak_memory = f"{report.peak_memory / 1024 ** 2:.1f} MiB"
+        lines.append(f"{report.name:<10}{wall_time:>12}{peak_memory:>14}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    main()
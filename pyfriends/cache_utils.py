@@ -0,0 +1,37 @@
+import hashlib
+import os
+import tempfile
+
+from pathlib import Path
+from typing import Optional
+
+cache_folder = Path(os.getenv("PYFRIENDS_CACHE_FOLDER", Path.home().joinpath(".cache", "pyfriends")))
+
+
+def content_digest(*contents: bytes) -> str:
+    digest = hashlib.sha256()
+    for content in contents:
+        digest.update(content)
+    return digest.hexdigest()
+
+
+def read_from_cache(namespace: str, key: str) -> Optional[bytes]:
+    entry_path = cache_folder.joinpath(namespace, key)
+    try:
+        return entry_path.read_bytes()
+    except OSError:
+        return None
+
+
+def write_to_cache(namespace: str, key: str, value: bytes) -> None:
+    namespace_folder = cache_folder.joinpath(namespace)
+    namespace_folder.mkdir(parents=True, exist_ok=True)
+    # Writing to a temporary file first means concurrent readers (like worker processes) never see half an entry
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=namespace_folder, suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb") as temporary_file:
+            temporary_file.write(value)
+        os.replace(temporary_path, namespace_folder.joinpath(key))
+    except BaseException:
+        Path(temporary_path).unlink(missing_ok=True)
+        raise
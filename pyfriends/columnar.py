@@ -0,0 +1,179 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from pyfriends.core import ParserEngine
+from pyfriends.core import SceneCategory
+from pyfriends.core import _parse_episode_file
+from pyfriends.core import _retrieve_episode_paths
+from pyfriends.core import _retrieve_parser_engine
+
+main_characters = ["CHANDLER", "JOEY", "MONICA", "PHOEBE", "RACHEL", "ROSS"]
+
+episode_schema = pa.schema(
+    [
+        ("SEASON_NUMBER", pa.int64()),
+        ("NUMBER", pa.string()),
+        ("TITLE", pa.string()),
+        ("TWO_PART_EPISODE", pa.bool_()),
+        ("TOTAL_SCENES", pa.int64()),
+        ("HAS_BEFORE_OPENING", pa.bool_()),
+        ("HAS_AFTER_CLOSING_CREDITS", pa.bool_()),
+    ]
+)
+dialogue_schema = pa.schema(
+    [
+        ("SEASON_NUMBER", pa.int64()),
+        ("EPISODE_NUMBER", pa.string()),
+        ("CHARACTER_NAME", pa.string()),
+        ("TRANSCRIPTION_ORDER", pa.int64()),
+        ("TRANSCRIPTION_ORDER_PER_SCENE", pa.int64()),
+        ("TRANSCRIPTION_LINE", pa.string()),
+        ("SCENE_DESCRIPTION", pa.string()),
+        ("SCENE_CATEGORY", pa.string()),
+        ("SCENE_ORDER", pa.int64()),
+    ]
+)
+scene_schema = pa.schema(
+    [
+        ("SEASON_NUMBER", pa.int64()),
+        ("EPISODE_NUMBER", pa.string()),
+        ("SCENE_DESCRIPTION", pa.string()),
+        ("SCENE_CATEGORY", pa.string()),
+        ("SCENE_ORDER", pa.int64()),
+    ]
+)
+character_schema = pa.schema([("NAME", pa.string()), ("IS_MAIN", pa.bool_())])
+
+
+@dataclass(frozen=True)
+class CorpusTables:
+    episode: pa.Table
+    dialogue: pa.Table
+    scene: pa.Table
+    character: pa.Table
+
+
+@dataclass(frozen=True)
+class CorpusFrames:
+    episode: pd.DataFrame
+    dialogue: pd.DataFrame
+    scene: pd.DataFrame
+    character: pd.DataFrame
+
+
+def retrieve_corpus_tables(
+    seasons: Iterable[int] = range(1, 11),
+    main_character_names: Optional[List[str]] = None,
+    max_workers: Optional[int] = None,
+    use_cache: bool = True,
+    engine: Optional[Union[ParserEngine, str]] = None,
+) -> CorpusTables:
+    episode_paths = [episode_path for season in seasons for episode_path in sorted(_retrieve_episode_paths(season))]
+    return retrieve_episode_tables(episode_paths, main_character_names, max_workers, use_cache, engine)
+
+
+def retrieve_episode_tables(
+    episode_paths: List[Path],
+    main_character_names: Optional[List[str]] = None,
+    max_workers: Optional[int] = None,
+    use_cache: bool = True,
+    engine: Optional[Union[ParserEngine, str]] = None,
+) -> CorpusTables:
+    # Each worker process turns its episode into record batches, so no row is ever kept as a Python object here 🏹
+    retrieve_episode_batches = partial(
+        _retrieve_episode_batches, use_cache=use_cache, engine=_retrieve_parser_engine(engine)
+    )
+    episode_batches, dialogue_batches, scene_batches = [], [], []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for batches in executor.map(retrieve_episode_batches, episode_paths):
+            if batches:
+                episode_batch, dialogue_batch, scene_batch = batches
+                episode_batches.append(episode_batch)
+                dialogue_batches.append(dialogue_batch)
+                scene_batches.append(scene_batch)
+    dialogue = pa.Table.from_batches(dialogue_batches, schema=dialogue_schema)
+    return CorpusTables(
+        pa.Table.from_batches(episode_batches, schema=episode_schema),
+        dialogue,
+        pa.Table.from_batches(scene_batches, schema=scene_schema),
+        retrieve_character_table(dialogue["CHARACTER_NAME"], main_character_names),
+    )
+
+
+def retrieve_character_table(
+    character_names: Union[pa.Array, pa.ChunkedArray], main_character_names: Optional[List[str]] = None
+) -> pa.Table:
+    main_character_names = main_characters if main_character_names is None else main_character_names
+    # Characters are listed in the order they first speak
+    unique_character_names = pc.unique(character_names)
+    is_main = pc.is_in(unique_character_names, value_set=pa.array(main_character_names, pa.string()))
+    return pa.Table.from_arrays([unique_character_names, is_main], schema=character_schema)
+
+
+def retrieve_corpus_frames(tables: CorpusTables) -> CorpusFrames:
+    return CorpusFrames(
+        tables.episode.to_pandas(), tables.dialogue.to_pandas(), tables.scene.to_pandas(), tables.character.to_pandas()
+    )
+
+
+def _retrieve_episode_batches(
+    episode_path: Path, use_cache: bool = True, engine: ParserEngine = ParserEngine.STREAMING
+) -> Optional[Tuple[pa.RecordBatch, pa.RecordBatch, pa.RecordBatch]]:
+    episode = _parse_episode_file(episode_path, use_cache, engine)
+    if not episode:
+        return None
+    season_number = int(episode_path.stem[:2])
+    scene_categories = [scene.category for scene in episode.scenes]
+    episode_batch = pa.record_batch(
+        [
+            [season_number],
+            [episode.number],
+            [episode.title],
+            ["/" in episode.number],
+            [len(episode.scenes)],
+            [SceneCategory.BEFORE_OPENING in scene_categories],
+            [SceneCategory.AFTER_CLOSING_CREDITS in scene_categories],
+        ],
+        schema=episode_schema,
+    )
+    # Each column is filled scene by scene, values shared by a whole scene are just repeated
+    dialogue_columns = {name: [] for name in dialogue_schema.names}
+    scene_columns = {name: [] for name in scene_schema.names}
+    for scene_order, scene in enumerate(episode.scenes, start=1):
+        number_of_transcriptions = len(scene.transcriptions)
+        # Scenes without a single transcription aren't part of the integration layer
+        if not number_of_transcriptions:
+            continue
+        first_transcription_order = len(dialogue_columns["TRANSCRIPTION_ORDER"]) + 1
+        scene_values = {
+            "SEASON_NUMBER": season_number,
+            "EPISODE_NUMBER": episode.number,
+            "SCENE_DESCRIPTION": scene.description,
+            "SCENE_CATEGORY": scene.category.name,
+            "SCENE_ORDER": scene_order,
+        }
+        for name, value in scene_values.items():
+            scene_columns[name].append(value)
+            dialogue_columns[name].extend([value] * number_of_transcriptions)
+        dialogue_columns["CHARACTER_NAME"].extend(
+            transcription.character.upper() for transcription in scene.transcriptions
+        )
+        dialogue_columns["TRANSCRIPTION_ORDER"].extend(
+            range(first_transcription_order, first_transcription_order + number_of_transcriptions)
+        )
+        dialogue_columns["TRANSCRIPTION_ORDER_PER_SCENE"].extend(range(1, number_of_transcriptions + 1))
+        dialogue_columns["TRANSCRIPTION_LINE"].extend(transcription.line for transcription in scene.transcriptions)
+    dialogue_batch = pa.record_batch(list(dialogue_columns.values()), schema=dialogue_schema)
+    scene_batch = pa.record_batch(list(scene_columns.values()), schema=scene_schema)
+    return episode_batch, dialogue_batch, scene_batch
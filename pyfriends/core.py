@@ -1,24 +1,73 @@
+import os
+import pickle
 import re
+import sys
+import zlib
 
+from collections import Counter
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
 from dataclasses import dataclass
 from dataclasses import field
+from dataclasses import fields
 from enum import Enum
+from functools import lru_cache
+from functools import partial
+from html.parser import HTMLParser
+from itertools import chain
+from itertools import islice
 from pathlib import Path
+from time import perf_counter
+from typing import Dict
 from typing import Generator
+from typing import Iterable
+from typing import Iterator
 from typing import List
 from typing import Optional
+from typing import Tuple
+from typing import Union
 
 from bs4 import BeautifulSoup
+from bs4 import CData
+from bs4 import NavigableString
 from bs4 import Tag
 
+from pyfriends import text_utils
+from pyfriends.cache_utils import content_digest
+from pyfriends.cache_utils import read_from_cache
+from pyfriends.cache_utils import write_to_cache
+from pyfriends.text_utils import clean_line
 from pyfriends.text_utils import newline_or_nbsp_to_space
 from pyfriends.text_utils import strip_left_and_right_sides
 
 folder_seasons = Path(__file__).parent.joinpath("raw_layer")
 
 regex_episode_number = re.compile(r"^\d{2}(\d{2})(-\d{2}(\d{2}))?$", re.IGNORECASE)
-regex_scene_details = re.compile(r"^\[Scene: (.+)\]$", re.IGNORECASE)
-regex_transcription_line = re.compile(r"(.+?): ?(.+)", re.IGNORECASE)
+# Lines with any of them are skipped
+disallowed_keys = ["written by", "transcribed by", "teleplay by"]
+# A single match tells scene details from dialogue, scene details win when both would match
+regex_line = re.compile(r"\[Scene: (?P<description>.+)\]$|(?P<character>.+?): ?(?P<phrase>.+)", re.IGNORECASE)
+
+# How many elements before a paragraph are looked at when its category is defined
+look_back_size = 7
+opening_keys = ["opening credits", "opening titles"]
+ending_keys = ["ending credits", "closing credits"]
+longest_key_length = max(len(key) for key in opening_keys + ending_keys)
+# The streaming engine reads episode files piece by piece
+reading_chunk_size = 64 * 1024
+# Where the time of parsing an episode goes, in the order it happens. Soup and find_all are only seen with html.parser
+parse_phases = ["read", "soup", "find_all", "fallback", "categorize", "lines"]
+parse_counters = [
+    "paragraphs",
+    "fallback_lines",
+    "empty",
+    "disallowed",
+    "look_back",
+    "descriptions",
+    "transcriptions",
+    "rejected",
+]
 
 
 class SceneCategory(Enum):
@@ -27,19 +76,70 @@ class SceneCategory(Enum):
     AFTER_CLOSING_CREDITS = "after closing credits"
 
 
+class LineKind(Enum):
+    EMPTY = "empty"
+    DISALLOWED = "disallowed"
+    SCENE_DETAILS = "scene details"
+    DIALOGUE = "dialogue"
+    # A dialogue whose character can't be one, like a transcriber's note
+    REJECTED = "rejected"
+    OTHER = "other"
+
+
+# Counter of parse_counters each kind of line adds up to, other lines aren't counted
+line_kind_counters = {
+    LineKind.EMPTY: "empty",
+    LineKind.DISALLOWED: "disallowed",
+    LineKind.SCENE_DETAILS: "descriptions",
+    LineKind.DIALOGUE: "transcriptions",
+    LineKind.REJECTED: "rejected",
+}
+
+
+class ParserEngine(Enum):
+    HTML_PARSER = "html.parser"
+    STREAMING = "streaming"
+
+
+def _with_slots(cls):
+    # The same as dataclass(slots=True), which is only available from Python 3.10 onwards
+    # Tens of thousands of instances are created for the whole show, so each one without a __dict__ saves a lot
+    field_names = tuple(data_field.name for data_field in fields(cls))
+    namespace = {
+        name: value
+        for name, value in cls.__dict__.items()
+        if name not in field_names and name not in ("__dict__", "__weakref__")
+    }
+    namespace["__slots__"] = field_names
+    # Pickle (used by worker processes, for instance) builds instances through __init__, even for frozen ones
+    namespace["__reduce__"] = lambda self: (type(self), tuple(getattr(self, name) for name in field_names))
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+
+@_with_slots
 @dataclass(frozen=True)
 class Transcription:
     character: str
     line: str
 
+    def __post_init__(self):
+        # Character names repeat all over the show, so they're shared through the interpreter's symbol table
+        object.__setattr__(self, "character", sys.intern(self.character))
+
 
+@_with_slots
 @dataclass
 class Scene:
     category: SceneCategory
     description: Optional[str] = None
     transcriptions: List[Transcription] = field(default_factory=list)
 
+    def __post_init__(self):
+        if self.description is not None:
+            self.description = sys.intern(self.description)
 
+
+@_with_slots
 @dataclass(frozen=True)
 class Episode:
     number: str
@@ -47,125 +147,756 @@ class Episode:
     scenes: List[Scene] = field(default_factory=list)
 
 
-def retrieve_episode_details(season: int, episode: Optional[int] = None) -> Generator[Episode, None, None]:
+@dataclass(frozen=True)
+class MemoryReport:
+    episodes: int
+    scenes: int
+    transcriptions: int
+    # Bytes taken by the episodes as they are, counting shared objects once
+    compact_size: int
+    # Bytes the same episodes would take if each instance had its own __dict__ and its own copy of every string
+    expanded_size: int
+
+
+@dataclass(frozen=True)
+class Paragraph:
+    text: str
+    # Category told by the closest tag among the elements right before the paragraph, if any
+    look_back_category: Optional[SceneCategory] = None
+
+
+@dataclass(frozen=True)
+class EpisodeDocument:
+    title: str
+    # Might be a generator, so it should be iterated only once
+    paragraphs: Iterable[Paragraph]
+
+
+@dataclass
+class EpisodeParseProfile:
+    file_name: str
+    engine: ParserEngine
+    # Seconds spent in each phase of parse_phases, and in the whole parsing
+    timings: Dict[str, float] = field(default_factory=dict)
+    total_time: float = 0.0
+    # Lines skipped by the disallow list, look-back categories used and so on, named as in parse_counters
+    counters: Counter = field(default_factory=Counter)
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+
+class ParseProfiler:
+    # Episodes parsed within `with ParseProfiler() as profiler:` are profiled, then exported with profiler.table() 🔬
+    # Out of it, the parser checks whether a profile is on once per line, and once more when the line isn't skipped.
+    # Episodes coming from the cache or parsed by worker processes aren't profiled, so use retrieve_episode_details
+    # with use_cache=False
+    def __init__(self):
+        self.profiles: List[EpisodeParseProfile] = []
+        self._previous: Optional[ParseProfiler] = None
+
+    def __enter__(self) -> "ParseProfiler":
+        global _active_profiler
+        self._previous, _active_profiler = _active_profiler, self
+        return self
+
+    def __exit__(self, *exception_details) -> None:
+        global _active_profiler
+        _active_profiler = self._previous
+
+    def start_episode(self, episode_path: Path, engine: ParserEngine) -> EpisodeParseProfile:
+        profile = EpisodeParseProfile(episode_path.name, engine)
+        self.profiles.append(profile)
+        return profile
+
+    def rows(self) -> List[Dict[str, Union[str, float, int]]]:
+        # One row for each episode, like records for pd.DataFrame
+        rows = []
+        for profile in self.profiles:
+            row = {"file": profile.file_name, "engine": profile.engine.value}
+            row.update({phase: profile.timings.get(phase, 0.0) for phase in parse_phases})
+            row["total"] = profile.total_time
+            row.update({counter: profile.counters[counter] for counter in parse_counters})
+            rows.append(row)
+        return rows
+
+    def table(self) -> str:
+        # Times are in milliseconds, the last row sums up every episode
+        columns = [*parse_phases, "total", *parse_counters]
+        rows = self.rows()
+        total_row = {"file": "all", **{column: sum(row[column] for row in rows) for column in columns}}
+        lines = ["".join([f"{'file':<16}", *(f"{column:>{max(len(column), 8) + 2}}" for column in columns)])]
+        for row in [*rows, total_row]:
+            values = [f"{row[column] * 1000:.1f}" for column in [*parse_phases, "total"]]
+            values += [str(row[column]) for column in parse_counters]
+            cells = [f"{value:>{max(len(column), 8) + 2}}" for column, value in zip(columns, values)]
+            lines.append("".join([f"{row['file']:<16}", *cells]))
+        return "\n".join(lines)
+
+
+_active_profiler: Optional[ParseProfiler] = None
+
+
+def _timed_paragraphs(
+    paragraphs: Iterator[Paragraph], profile: EpisodeParseProfile, phase: str = "read"
+) -> Iterator[Paragraph]:
+    # Streamed documents read their file while paragraphs are taken, so that time belongs to reading
+    while True:
+        started_at = perf_counter()
+        paragraph = next(paragraphs, None)
+        profile.add(phase, perf_counter() - started_at)
+        if paragraph is None:
+            return
+        profile.counters["paragraphs"] += 1
+        yield paragraph
+
+
+def retrieve_episode_details(
+    season: int,
+    episode: Optional[int] = None,
+    use_cache: bool = True,
+    engine: Optional[Union[ParserEngine, str]] = None,
+) -> Generator[Episode, None, None]:
+    engine = _retrieve_parser_engine(engine)
+    for episode_path in _retrieve_episode_paths(season, episode):
+        episode_details = _parse_episode_file(episode_path, use_cache, engine)
+        if episode_details:
+            yield episode_details
+
+
+def retrieve_episode_details_in_parallel(
+    season: int,
+    episode: Optional[int] = None,
+    max_workers: Optional[int] = None,
+    ordered: bool = True,
+    use_cache: bool = True,
+    engine: Optional[Union[ParserEngine, str]] = None,
+) -> Generator[Episode, None, None]:
+    # Same as `retrieve_episode_details`, but each episode file is parsed by a worker process 🏎
+    # If order doesn't matter, episodes are yielded as soon as their workers finish them
+    episode_paths = _retrieve_episode_paths(season, episode)
+    parse_episode_file = partial(_parse_episode_file, use_cache=use_cache, engine=_retrieve_parser_engine(engine))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        if ordered:
+            parsed_episodes = executor.map(parse_episode_file, episode_paths)
+        else:
+            futures = [executor.submit(parse_episode_file, episode_path) for episode_path in episode_paths]
+            parsed_episodes = (future.result() for future in as_completed(futures))
+        for episode_details in parsed_episodes:
+            if episode_details:
+                yield episode_details
+
+
+def memory_report(episodes: Iterable[Episode]) -> MemoryReport:
+    def instances_of(episode: Episode):
+        yield episode
+        for scene in episode.scenes:
+            yield scene
+            yield from scene.transcriptions
+
+    counted_objects = set()
+    number_of_instances = Counter()
+    compact_size, expanded_size = 0, 0
+    for episode in episodes:
+        for instance in instances_of(episode):
+            number_of_instances[type(instance)] += 1
+            values = [getattr(instance, name) for name in instance.__slots__]
+            # Categories are shared anyway
+            values = [value for value in values if value is not None and not isinstance(value, SceneCategory)]
+            for value in [instance, *values]:
+                if id(value) not in counted_objects:
+                    counted_objects.add(id(value))
+                    compact_size += sys.getsizeof(value)
+            expanded_size += _expanded_instance_size(type(instance)) + sum(sys.getsizeof(value) for value in values)
+    return MemoryReport(
+        number_of_instances[Episode],
+        number_of_instances[Scene],
+        number_of_instances[Transcription],
+        compact_size,
+        expanded_size,
+    )
+
+
+def _retrieve_episode_paths(season: int, episode: Optional[int] = None) -> List[Path]:
     # Configure glob pattern
     season_number = str(season).rjust(2, "0")
     episode_number = str(episode).rjust(2, "0") if episode else None
     glob_pattern = f"{season_number}*.html" if not episode_number else f"{season_number}{episode_number}*.html"
 
-    for episode_path in folder_seasons.glob(glob_pattern):
-        with open(episode_path.absolute(), mode="r", encoding="iso-8859-1") as episode_file:
-            soup = BeautifulSoup(episode_file, "html.parser")
-        # Episode's metadata
+    return list(folder_seasons.glob(glob_pattern))
+
+
+def retrieve_two_part_episode_numbers() -> List[Tuple[int, str]]:
+    # (season, number) of episodes whose two parts share one transcript, like (2, "12/13") for 0212-0213.html
+    two_part_numbers = []
+    for episode_path in sorted(folder_seasons.glob("*.html")):
         match = regex_episode_number.match(episode_path.stem)
-        if not match:
-            continue
-        episodes_groups = match.groups()
-        number_1, _, number_2 = episodes_groups
-        episode_number = number_1 if number_2 is None else f"{number_1}/{number_2}"
-        title = soup.find("title").text
-        title = strip_left_and_right_sides(title.split(" - ")[-1])
-        episode = Episode(episode_number, title)
-        # Let's get all transcription and extract what we need
-        scene = Scene(SceneCategory.BEFORE_OPENING)
-        all_transcriptions = soup.find_all("p")
-        # Some files don't follow the pattern that can be found to the most, so we need to circumvent with a strategy
-        can_be_analyzed_normally = len(all_transcriptions) > 10
-        all_lines = all_transcriptions
-        if not can_be_analyzed_normally:
-            all_lines = []
-            for transcription_line in all_transcriptions:
-                cleared_text = strip_left_and_right_sides(transcription_line.text)
-                if "written by" in cleared_text or "end" == cleared_text.lower():
-                    continue
-                # To keep the same logic during the for loop below 😏
-                dirty_lines = cleared_text.split("\n\n")
-                for line in dirty_lines:
-                    tag_p = soup.new_tag("p")
-                    tag_p.string = line
-                    all_lines.append(tag_p)
-        # If something is wrong, we should know upfront
-        generic_error_message = f"episode {episode.number} from {season_number} has to be analysed"
-        assert len(all_lines) > 50, f"{generic_error_message}: it has {len(all_lines)} lines"
-
-        for transcription_line in all_lines:
-            text = strip_left_and_right_sides(newline_or_nbsp_to_space(transcription_line.text))
-            lowercase_text = text.lower()
-            disallow_list = ["written by", "transcribed by", "teleplay by"]
-            if not text or any(deny_item in lowercase_text for deny_item in disallow_list):
-                continue
-            # As text has content, we can do what we want 👀
-            # Basic stuff to define the scene 🎬
-            scene_category = _define_category(transcription_line, text, scene.category)
-            must_create_new_scene = scene.category != scene_category
-            if must_create_new_scene:
-                current_is_before_opening = scene.category == SceneCategory.BEFORE_OPENING
-                if current_is_before_opening and len(scene.transcriptions) == 0:
-                    scene = Scene(scene_category)
-                else:
-                    episode.scenes.append(scene)
-                    # Sometimes an episode might not have anything before the opening credits
-                    # Like episode 1 from season 1 😀
-                    if current_is_before_opening and scene_category == SceneCategory.AFTER_CLOSING_CREDITS:
-                        for stored_scene in episode.scenes:
-                            stored_scene.category = SceneCategory.MAIN
-                    scene = Scene(scene_category)
-            scene_details_line = regex_scene_details.match(text)
-            if scene_details_line:
-                description = scene_details_line.groups()[0]
-                if not scene.description:
-                    scene.description = description
-                else:
-                    episode.scenes.append(scene)
-                    scene = Scene(scene_category, description)
+        if match and match.group(2):
+            two_part_numbers.append((int(episode_path.stem[:2]), _retrieve_episode_number(match)))
+    return two_part_numbers
+
+
+@lru_cache(maxsize=None)
+def _expanded_instance_size(cls: type) -> int:
+    # An instance of a regular class with the same attributes, plus its __dict__
+    expanded_instance = type(f"Expanded{cls.__name__}", (), {})()
+    for name in cls.__slots__:
+        setattr(expanded_instance, name, None)
+    return sys.getsizeof(expanded_instance) + sys.getsizeof(expanded_instance.__dict__)
+
+
+def _retrieve_parser_engine(engine: Optional[Union[ParserEngine, str]] = None) -> ParserEngine:
+    # When not explicitly chosen, the engine can be configured through an environment variable
+    if engine is None:
+        engine = os.getenv("PYFRIENDS_PARSER_ENGINE", ParserEngine.STREAMING.value)
+    return ParserEngine(engine)
+
+
+def _parse_episode_file(
+    episode_path: Path, use_cache: bool = True, engine: ParserEngine = ParserEngine.STREAMING
+) -> Optional[Episode]:
+    # Episode's metadata
+    match = regex_episode_number.match(episode_path.stem)
+    if not match:
+        return None
+    if not use_cache:
+        return _parse_episode(episode_path, match, engine)
+    # The same file parsed by the same parser always gives the same episode, so it's worth keeping it on disk 💾
+    # The episode number comes from the name of the file, so two files with the same content are still two entries
+    cache_key = content_digest(episode_path.name.encode(), b"\0", episode_path.read_bytes())
+    cache_namespace = _parse_cache_namespace(engine)
+    cached_episode = read_from_cache(cache_namespace, cache_key)
+    if cached_episode:
+        try:
+            return _episode_from_bytes(cached_episode)
+        except (zlib.error, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+            pass
+    episode = _parse_episode(episode_path, match, engine)
+    try:
+        write_to_cache(cache_namespace, cache_key, _episode_to_bytes(episode))
+    except OSError:
+        pass
+    return episode
+
+
+@lru_cache(maxsize=None)
+def _parse_cache_namespace(engine: ParserEngine) -> str:
+    # Any change in the parser's source code, including how episodes are stored, produces a new namespace per engine,
+    # thus old entries are never read again
+    parser_sources = [Path(__file__), Path(text_utils.__file__)]
+    parser_version = content_digest(*[source.read_bytes() for source in parser_sources])
+    return f"raw_layer-{engine.name.lower()}-{parser_version}"
+
+
+def _episode_to_bytes(episode: Episode) -> bytes:
+    scenes = [
+        (
+            scene.category.value,
+            scene.description,
+            [(transcription.character, transcription.line) for transcription in scene.transcriptions],
+        )
+        for scene in episode.scenes
+    ]
+    return zlib.compress(pickle.dumps((episode.number, episode.title, scenes), protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _episode_from_bytes(value: bytes) -> Episode:
+    number, title, scenes = pickle.loads(zlib.decompress(value))
+    episode = Episode(number, title)
+    for category, description, transcriptions in scenes:
+        transcriptions = [Transcription(character, line) for character, line in transcriptions]
+        episode.scenes.append(Scene(SceneCategory(category), description, transcriptions))
+    return episode
+
+
+def _parse_episode(episode_path: Path, match: re.Match, engine: ParserEngine = ParserEngine.STREAMING) -> Episode:
+    # Nothing is measured unless a ParseProfiler is active
+    profile = _active_profiler.start_episode(episode_path, engine) if _active_profiler is not None else None
+    if profile is None:
+        return _parse_episode_document(episode_path, match, engine)
+    started_at = perf_counter()
+    episode = _parse_episode_document(episode_path, match, engine, profile)
+    profile.total_time = perf_counter() - started_at
+    # Whatever isn't in the other phases is spent on lines: matching them, building scenes and transcriptions
+    profile.add("lines", profile.total_time - sum(profile.timings.values()))
+    return episode
+
+
+def _parse_episode_document(
+    episode_path: Path, match: re.Match, engine: ParserEngine, profile: Optional[EpisodeParseProfile] = None
+) -> Episode:
+    season_number = episode_path.stem[:2]
+    started_at = perf_counter() if profile is not None else 0.0
+    document = _read_episode_document(episode_path.absolute(), engine, profile)
+    episode_number = _retrieve_episode_number(match)
+    title = document.title
+    title = strip_left_and_right_sides(title.split(" - ")[-1])
+    episode = Episode(episode_number, title)
+    # Let's get all transcription and extract what we need
+    scene = Scene(SceneCategory.BEFORE_OPENING)
+    all_transcriptions = iter(document.paragraphs)
+    if profile is not None:
+        # Reading was timed up to here, except what soup and find_all took on their own
+        profile.add("read", perf_counter() - started_at - sum(profile.timings.values()))
+        all_transcriptions = _timed_paragraphs(all_transcriptions, profile)
+    # Some files don't follow the pattern that can be found to the most, so we need to circumvent with a strategy
+    # Paragraphs might be streamed, so only the first ones are taken to know which case it is
+    first_transcriptions = list(islice(all_transcriptions, 11))
+    can_be_analyzed_normally = len(first_transcriptions) > 10
+    all_lines = chain(first_transcriptions, all_transcriptions)
+    if not can_be_analyzed_normally:
+        started_at = perf_counter() if profile is not None else 0.0
+        all_lines = []
+        for transcription_line in first_transcriptions:
+            cleared_text = strip_left_and_right_sides(transcription_line.text)
+            if "written by" in cleared_text or "end" == cleared_text.lower():
                 continue
-            # If the code is running here, then it will fill up the scene 🎞
-            match_character_line = regex_transcription_line.match(text)
-            if match_character_line:
-                character = match_character_line.groups()[0]
-                phrase = match_character_line.groups()[1]
-                lowercase_character = character.lower()
-                invalid_character_case_1 = len(character) > 40
-                invalid_character_case_2 = "transcriber" in lowercase_character and "note" in lowercase_character
-                if invalid_character_case_1 or invalid_character_case_2:
-                    continue
-                transcription = Transcription(character.capitalize(), phrase)
-                scene.transcriptions.append(transcription)
-        # Another sanity check
-        assert episode.scenes, f"{generic_error_message}: has no scenes"
-        last_included_scene_is_different = episode.scenes[-1] != scene
-        scene_has_transcriptions = len(scene.transcriptions) > 0
-        scene_after_closing = scene.category == SceneCategory.AFTER_CLOSING_CREDITS
-        # Episode 0109 has a scene after closing with no transcriptions
-        if last_included_scene_is_different and (scene_has_transcriptions or scene_after_closing):
-            episode.scenes.append(scene)
-        # The entire defined episode
-        yield episode
+            # To keep the same logic during the for loop below 😏
+            dirty_lines = cleared_text.split("\n\n")
+            all_lines.extend(Paragraph(line) for line in dirty_lines)
+        if profile is not None:
+            profile.add("fallback", perf_counter() - started_at)
+            profile.counters["fallback_lines"] += len(all_lines)
+    generic_error_message = f"episode {episode.number} from {season_number} has to be analysed"
+
+    number_of_lines = 0
+    for transcription_line in all_lines:
+        number_of_lines += 1
+        text = clean_line(transcription_line.text)
+        line_kind, line_match = _classify_line(text)
+        if profile is not None and line_kind is not LineKind.OTHER:
+            profile.counters[line_kind_counters[line_kind]] += 1
+        if line_kind is LineKind.EMPTY or line_kind is LineKind.DISALLOWED:
+            continue
+        # As text has content, we can do what we want 👀
+        # Basic stuff to define the scene 🎬
+        if profile is None:
+            scene_category = _define_category(transcription_line.look_back_category, text, scene.category)
+        else:
+            started_at = perf_counter()
+            scene_category = _define_category(transcription_line.look_back_category, text, scene.category)
+            profile.add("categorize", perf_counter() - started_at)
+            profile.counters["look_back"] += transcription_line.look_back_category is not None
+        must_create_new_scene = scene.category != scene_category
+        if must_create_new_scene:
+            current_is_before_opening = scene.category == SceneCategory.BEFORE_OPENING
+            if current_is_before_opening and len(scene.transcriptions) == 0:
+                scene = Scene(scene_category)
+            else:
+                episode.scenes.append(scene)
+                # Sometimes an episode might not have anything before the opening credits
+                # Like episode 1 from season 1 😀
+                if current_is_before_opening and scene_category == SceneCategory.AFTER_CLOSING_CREDITS:
+                    for stored_scene in episode.scenes:
+                        stored_scene.category = SceneCategory.MAIN
+                scene = Scene(scene_category)
+        if line_kind is LineKind.SCENE_DETAILS:
+            description = sys.intern(line_match.group("description"))
+            if not scene.description:
+                scene.description = description
+            else:
+                episode.scenes.append(scene)
+                scene = Scene(scene_category, description)
+            continue
+        # If the code is running here, then it will fill up the scene 🎞
+        if line_kind is LineKind.DIALOGUE:
+            transcription = Transcription(line_match.group("character").capitalize(), line_match.group("phrase"))
+            scene.transcriptions.append(transcription)
+    # If something is wrong, we should know
+    assert number_of_lines > 50, f"{generic_error_message}: it has {number_of_lines} lines"
+    # Another sanity check
+    assert episode.scenes, f"{generic_error_message}: has no scenes"
+    last_included_scene_is_different = episode.scenes[-1] != scene
+    scene_has_transcriptions = len(scene.transcriptions) > 0
+    scene_after_closing = scene.category == SceneCategory.AFTER_CLOSING_CREDITS
+    # Episode 0109 has a scene after closing with no transcriptions
+    if last_included_scene_is_different and (scene_has_transcriptions or scene_after_closing):
+        episode.scenes.append(scene)
+    # The entire defined episode
+    return episode
+
+
+def _retrieve_episode_number(match: re.Match) -> str:
+    # Two-part episodes share the same file, like 0212-0213.html
+    number_1, _, number_2 = match.groups()
+    return number_1 if number_2 is None else f"{number_1}/{number_2}"
 
 
-def _define_category(transcription_line: Tag, text: str, current_category: SceneCategory):
-    def retrieve_category_if_possible(text_to_evaluate) -> Optional[SceneCategory]:
-        opening_keys = ["opening credits", "opening titles"]
-        after_opening = any(key == text_to_evaluate for key in opening_keys)
-        if after_opening:
-            return SceneCategory.MAIN
-        ending_keys = ["ending credits", "closing credits"]
-        after_closing = any(key == text_to_evaluate for key in ending_keys)
-        if after_closing:
-            return SceneCategory.AFTER_CLOSING_CREDITS
+def _classify_line(text: str) -> Tuple[LineKind, Optional[re.Match]]:
+    # The text is expected to be clean already, see clean_line
+    if not text:
+        return LineKind.EMPTY, None
+    # Plain substring checks beat any regex here: re has no fast path for case-insensitive alternations
+    lowercase_text = text.lower()
+    written_by, transcribed_by, teleplay_by = disallowed_keys
+    if written_by in lowercase_text or transcribed_by in lowercase_text or teleplay_by in lowercase_text:
+        return LineKind.DISALLOWED, None
+    match = regex_line.match(text)
+    if match is None:
+        return LineKind.OTHER, None
+    if match.lastgroup == "description":
+        return LineKind.SCENE_DETAILS, match
+    character = match.group("character")
+    lowercase_character = character.lower()
+    if len(character) > 40 or ("transcriber" in lowercase_character and "note" in lowercase_character):
+        return LineKind.REJECTED, match
+    return LineKind.DIALOGUE, match
 
+
+def _define_category(look_back_category: Optional[SceneCategory], text: str, current_category: SceneCategory):
     # The tag might have previous elements
-    for count, previous_element in enumerate(transcription_line.previous_elements):
-        if isinstance(previous_element, Tag):
-            lowercase_text = previous_element.text.lower()
-            text_from_previous = strip_left_and_right_sides(newline_or_nbsp_to_space(lowercase_text))
-            category = retrieve_category_if_possible(text_from_previous)
-            if category:
-                return category
-        # We don't need to traverse all
-        if count > 5:
-            break
+    if look_back_category:
+        return look_back_category
 
     # If the above wasn't executed, then we can analyse the provided text
-    category = retrieve_category_if_possible(text.lower())
+    category = _retrieve_category_if_possible(text.lower())
     return category if category else current_category
+
+
+def _retrieve_category_if_possible(text_to_evaluate: str) -> Optional[SceneCategory]:
+    after_opening = text_to_evaluate in opening_keys
+    if after_opening:
+        return SceneCategory.MAIN
+    after_closing = text_to_evaluate in ending_keys
+    if after_closing:
+        return SceneCategory.AFTER_CLOSING_CREDITS
+
+
+def _retrieve_category_from_tag_text(tag_text: str) -> Optional[SceneCategory]:
+    # Even if each character were a "\r\n", a longer text couldn't be normalized into a key
+    if len(tag_text.strip(" \t\r\n\xa0")) > 2 * longest_key_length:
+        return None
+    lowercase_text = tag_text.lower()
+    return _retrieve_category_if_possible(strip_left_and_right_sides(newline_or_nbsp_to_space(lowercase_text)))
+
+
+def _read_episode_document(
+    episode_path: Path, engine: ParserEngine, profile: Optional[EpisodeParseProfile] = None
+) -> EpisodeDocument:
+    if engine == ParserEngine.HTML_PARSER:
+        return _read_with_beautiful_soup(episode_path, profile)
+    return _read_with_streaming_parser(episode_path)
+
+
+def _read_with_beautiful_soup(episode_path: Path, profile: Optional[EpisodeParseProfile] = None) -> EpisodeDocument:
+    with open(episode_path, mode="r", encoding="iso-8859-1") as episode_file:
+        content = episode_file.read()
+    started_at = perf_counter() if profile is not None else 0.0
+    soup = BeautifulSoup(content, "html.parser")
+    if profile is not None:
+        profile.add("soup", perf_counter() - started_at)
+        started_at = perf_counter()
+    # Only a tag holding a string that is a piece of a key can have a key as its text, so just these are evaluated
+    category_by_tag: Dict[int, SceneCategory] = {}
+    evaluated_tags = set()
+    for element in soup.descendants:
+        if type(element) not in (NavigableString, CData) or not _is_key_fragment(element):
+            continue
+        for tag in element.parents:
+            if id(tag) in evaluated_tags:
+                break
+            evaluated_tags.add(id(tag))
+            tag_text = _retrieve_short_text(tag)
+            # Its parents have an even longer text
+            if tag_text is None:
+                break
+            category = _retrieve_category_from_tag_text(tag_text)
+            if category:
+                category_by_tag[id(tag)] = category
+
+    def retrieve_look_back_category(tag: Tag) -> Optional[SceneCategory]:
+        previous_element = tag.previous_element
+        for _ in range(look_back_size):
+            if previous_element is None:
+                return None
+            category = category_by_tag.get(id(previous_element))
+            if category:
+                return category
+            previous_element = previous_element.previous_element
+
+    paragraphs = [Paragraph(tag.text, retrieve_look_back_category(tag)) for tag in soup.find_all("p")]
+    if profile is not None:
+        # Finding look-back categories is part of it, as they're only needed for paragraphs
+        profile.add("find_all", perf_counter() - started_at)
+    return EpisodeDocument(soup.find("title").text, paragraphs)
+
+
+def _is_key_fragment(string: str) -> bool:
+    fragment = string.strip(" \t\r\n\xa0")
+    if not fragment or len(fragment) > 2 * longest_key_length:
+        return False
+    fragment = newline_or_nbsp_to_space(fragment.lower())
+    return any(fragment in key for key in opening_keys + ending_keys)
+
+
+def _retrieve_short_text(tag: Tag) -> Optional[str]:
+    # Same as the tag text, but None as soon as it gets too long to be a key
+    short_text = ""
+    for string in tag.strings:
+        short_text = _append_short_text(short_text, string)
+        if short_text is None:
+            return None
+    return short_text
+
+
+def _append_short_text(short_text: Optional[str], text: Optional[str]) -> Optional[str]:
+    # The text is kept only while it might be a key, otherwise it becomes None
+    if short_text is None or text is None:
+        return None
+    short_text += text
+    if len(short_text.strip(" \t\r\n\xa0")) > 2 * longest_key_length:
+        return None
+    return short_text
+
+
+def _read_with_streaming_parser(episode_path: Path) -> EpisodeDocument:
+    parser = _StreamingEpisodeParser()
+    # The title comes before the paragraphs, so it's known without reading the whole file
+    with open(episode_path, mode="r", encoding="iso-8859-1") as episode_file:
+        for chunk in iter(partial(episode_file.read, reading_chunk_size), ""):
+            parser.feed(chunk)
+            if parser.title is not None:
+                break
+        title_end = episode_file.tell()
+
+    def stream_paragraphs() -> Iterator[Paragraph]:
+        # The rest is read only once paragraphs are asked for, so a caller who never asks leaves no file open
+        with open(episode_path, mode="r", encoding="iso-8859-1") as episode_file:
+            episode_file.seek(title_end)
+            yield from parser.take_ready_paragraphs()
+            for chunk in iter(partial(episode_file.read, reading_chunk_size), ""):
+                parser.feed(chunk)
+                yield from parser.take_ready_paragraphs()
+        parser.close()
+        yield from parser.take_ready_paragraphs()
+
+    return EpisodeDocument(parser.title or "", stream_paragraphs())
+
+
+class _Element:
+    __slots__ = ("name", "start", "end", "category", "is_resolved")
+
+    def __init__(self, name: str, start: int):
+        self.name = name
+        # Range of the document's strings which belong to this element
+        self.start = start
+        self.end: Optional[int] = None
+        # Whether its text is one of the keys which tell a category
+        self.category: Optional[SceneCategory] = None
+        self.is_resolved = False
+
+
+class _StreamingEpisodeParser(HTMLParser):
+    # Follows the same rules BeautifulSoup uses to build its tree out of html.parser events, though no tree is built.
+    # A paragraph is handed over as soon as its text and the category told by its look-back window are known,
+    # then its strings are released, so memory doesn't grow with the size of the document
+    empty_element_tags = {
+        "area",
+        "base",
+        "basefont",
+        "bgsound",
+        "br",
+        "col",
+        "command",
+        "embed",
+        "frame",
+        "hr",
+        "image",
+        "img",
+        "input",
+        "isindex",
+        "keygen",
+        "link",
+        "menuitem",
+        "meta",
+        "nextid",
+        "param",
+        "source",
+        "spacer",
+        "track",
+        "wbr",
+    }
+    # Strings inside these tags are not part of the text of any other tag
+    string_container_tags = {"rp", "rt", "script", "style", "template"}
+    preserve_whitespace_tags = {"pre", "textarea"}
+    ascii_spaces = "\x20\x0a\x09\x0c\x0d"
+    # Characters which might be stripped once the text is normalized
+    strippable_characters_removal = str.maketrans("", "", " \t\r\n\xa0")
+    # Strings are released in batches, not one by one
+    release_threshold = 512
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        # Only the strings which might still be needed are kept, `strings_offset` tells how many were released
+        self.strings: List[str] = []
+        self.strings_offset = 0
+        self.next_release_size = self.release_threshold
+        self.current_data: List[str] = []
+        self.open_elements: List[_Element] = []
+        self.open_element_names = Counter()
+        self.already_closed_empty_elements = Counter()
+        self.string_containers = 0
+        self.whitespace_preservers = 0
+        self.title_element: Optional[_Element] = None
+        self.title: Optional[str] = None
+        self.pending_paragraphs = deque()
+        self.ready_paragraphs: List[Paragraph] = []
+        # Elements and strings alike, though strings are represented by None as their text is never needed
+        self.previous_nodes = deque(maxlen=look_back_size)
+
+    def handle_starttag(self, tag, attrs):
+        self._start_element(tag)
+        if tag in self.empty_element_tags:
+            self._end_element(tag)
+            self.already_closed_empty_elements[tag] += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self._start_element(tag)
+        self._end_element(tag)
+
+    def handle_endtag(self, tag):
+        if self.already_closed_empty_elements[tag]:
+            self.already_closed_empty_elements[tag] -= 1
+        else:
+            self._end_element(tag)
+
+    def handle_data(self, data):
+        self.current_data.append(data)
+
+    def handle_comment(self, data):
+        self._end_data()
+        self._add_ignored_node()
+
+    def handle_decl(self, decl):
+        self._end_data()
+        self._add_ignored_node()
+
+    def handle_pi(self, data):
+        self._end_data()
+        self._add_ignored_node()
+
+    def unknown_decl(self, data):
+        self._end_data()
+        if data.upper().startswith("CDATA["):
+            self.current_data.append(data[len("CDATA[") :])
+            self._end_data()
+        else:
+            self._add_ignored_node()
+
+    def close(self):
+        super().close()
+        self._end_data()
+        while self.open_elements:
+            self._pop_element()
+        self._hand_over_paragraphs()
+
+    def take_ready_paragraphs(self) -> List[Paragraph]:
+        ready_paragraphs = self.ready_paragraphs
+        self.ready_paragraphs = []
+        return ready_paragraphs
+
+    def _start_element(self, name: str):
+        self._end_data()
+        element = _Element(name, self.strings_offset + len(self.strings))
+        if name == "p":
+            look_back = tuple(node for node in reversed(self.previous_nodes) if node)
+            self.pending_paragraphs.append((element, look_back))
+        elif name == "title" and not self.title_element:
+            self.title_element = element
+        self.previous_nodes.append(element)
+        self.open_elements.append(element)
+        self.open_element_names[name] += 1
+        if name in self.string_container_tags:
+            self.string_containers += 1
+        if name in self.preserve_whitespace_tags:
+            self.whitespace_preservers += 1
+
+    def _end_element(self, name: str):
+        self._end_data()
+        # Like BeautifulSoup, an end tag closes everything opened after its start tag, or nothing if it's not open
+        if self.open_element_names[name]:
+            while self._pop_element().name != name:
+                pass
+            self._hand_over_paragraphs()
+
+    def _pop_element(self) -> _Element:
+        element = self.open_elements.pop()
+        element.end = self.strings_offset + len(self.strings)
+        self.open_element_names[element.name] -= 1
+        if element.name in self.string_container_tags:
+            self.string_containers -= 1
+        if element.name in self.preserve_whitespace_tags:
+            self.whitespace_preservers -= 1
+        if element is self.title_element:
+            self.title = self._text(element)
+        return element
+
+    def _end_data(self):
+        if not self.current_data:
+            return
+        data = "".join(self.current_data)
+        self.current_data = []
+        if not self.whitespace_preservers and not data.strip(self.ascii_spaces):
+            data = "\n" if "\n" in data else " "
+        if not self.string_containers:
+            self.strings.append(data)
+        self.previous_nodes.append(None)
+
+    def _add_ignored_node(self):
+        self.previous_nodes.append(None)
+
+    def _text(self, element: _Element) -> str:
+        start = element.start - self.strings_offset
+        end = element.end - self.strings_offset if element.end is not None else len(self.strings)
+        return "".join(self.strings[start:end])
+
+    def _resolve(self, element: _Element) -> bool:
+        if not element.is_resolved:
+            if element.end is not None:
+                element.category = _retrieve_category_from_tag_text(self._text(element))
+                element.is_resolved = True
+            elif self._has_too_long_text(element):
+                # Whatever comes next, its text is already too long to be a key
+                element.is_resolved = True
+        return element.is_resolved
+
+    def _has_too_long_text(self, element: _Element) -> bool:
+        non_space_length = 0
+        for index in range(element.start - self.strings_offset, len(self.strings)):
+            non_space_length += len(self.strings[index].translate(self.strippable_characters_removal))
+            if non_space_length > longest_key_length:
+                return True
+        return False
+
+    def _hand_over_paragraphs(self):
+        # Paragraphs are handed over in the same order they start, like BeautifulSoup's `find_all`
+        while self.pending_paragraphs:
+            paragraph, look_back = self.pending_paragraphs[0]
+            if paragraph.end is None:
+                break
+            look_back_category = None
+            for element in look_back:
+                if not self._resolve(element):
+                    return
+                if element.category:
+                    look_back_category = element.category
+                    break
+            self.ready_paragraphs.append(Paragraph(self._text(paragraph), look_back_category))
+            self.pending_paragraphs.popleft()
+        if len(self.strings) > self.next_release_size:
+            self._release_strings()
+
+    def _release_strings(self):
+        needed_elements = [node for node in self.previous_nodes if node and not self._resolve(node)]
+        for paragraph, look_back in self.pending_paragraphs:
+            needed_elements.append(paragraph)
+            needed_elements.extend(element for element in look_back if not element.is_resolved)
+        if self.title_element and self.title is None:
+            needed_elements.append(self.title_element)
+        first_needed = min((element.start for element in needed_elements), default=None)
+        if first_needed is None:
+            first_needed = self.strings_offset + len(self.strings)
+        del self.strings[: first_needed - self.strings_offset]
+        self.strings_offset = first_needed
+        # Some strings might still be needed for a while, like the ones from an unclosed paragraph
+        self.next_release_size = len(self.strings) + self.release_threshold
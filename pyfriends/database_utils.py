@@ -1,38 +1,114 @@
+import os
+import threading
+import weakref
+
 from contextlib import contextmanager
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
 from typing import List
+from typing import Optional
+from typing import Sequence
 from typing import Tuple
 
 import psycopg2
+import pyarrow as pa
 
 from sqlalchemy import create_engine
 from sqlalchemy import text
+from sqlalchemy.engine import Engine
 
 _database_name = "postgres"
 _host = "db"
 _port = 5432
 _user = "postgres"
 _password = None
+_pool_size = 5
+_pool_max_overflow = 5
+_pool_pre_ping = True
+_pool_recycle = 30 * 60
+# One pooled engine per database and pool configuration, shared by every thread of the process
+_shared_engines: Dict[Tuple, Engine] = {}
+_shared_engines_lock = threading.Lock()
+# Pools inherited from the parent process, which only it may use or close
+_inherited_pools: List[Any] = []
+# Names of the statements prepared by each psycopg2 connection, forgotten as soon as the connection is gone
+_prepared_statements: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+# Special characters of the text format of COPY
+_copy_escapes = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
 
 
 @contextmanager
 def generate_connection(database_name=_database_name, host=_host, port=_port, user=_user, password=_password):
-    connection_string = f"dbname={database_name} user={user} password={password} host={host} port={port}"
-    connection = None
+    # A psycopg2 connection is borrowed from the shared pool and given back when the block ends, so it stays warm
+    engine = retrieve_shared_engine(database_name, host, port, user, password)
+    pooled_connection = engine.raw_connection()
     try:
-        connection = psycopg2.connect(connection_string)
-        yield connection
+        yield pooled_connection.connection
     finally:
-        if connection:
-            connection.close()
+        # Whatever was not committed is rolled back by the pool
+        pooled_connection.close()
 
 
 def retrieve_engine(database_name=_database_name, host=_host, port=_port, user=_user, password=_password):
-    connection_string = (
-        f"postgresql://{user}:{password}@{host}:{port}/{database_name}"
+    return create_engine(_retrieve_connection_string(database_name, host, port, user, password))
+
+
+def retrieve_shared_engine(
+    database_name=_database_name,
+    host=_host,
+    port=_port,
+    user=_user,
+    password=_password,
+    pool_size=_pool_size,
+    max_overflow=_pool_max_overflow,
+    pool_pre_ping=_pool_pre_ping,
+    pool_recycle=_pool_recycle,
+) -> Engine:
+    key = (database_name, host, port, user, password, pool_size, max_overflow, pool_pre_ping, pool_recycle)
+    with _shared_engines_lock:
+        engine = _shared_engines.get(key)
+        if engine is None:
+            engine = create_engine(
+                _retrieve_connection_string(database_name, host, port, user, password),
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                pool_pre_ping=pool_pre_ping,
+                pool_recycle=pool_recycle,
+            )
+            _shared_engines[key] = engine
+        return engine
+
+
+def dispose_shared_engines() -> None:
+    with _shared_engines_lock:
+        for engine in _shared_engines.values():
+            engine.dispose()
+        _shared_engines.clear()
+
+
+def _retrieve_connection_string(database_name, host, port, user, password) -> str:
+    return (
+        f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{database_name}"
         if password
-        else f"postgresql://{user}@{host}:{port}/{database_name}"
+        else f"postgresql+psycopg2://{user}@{host}:{port}/{database_name}"
     )
-    return create_engine(connection_string)
+
+
+def _forget_shared_engines_after_fork() -> None:
+    # Sockets inherited from the parent process must not be used nor closed by the child one
+    # Each engine gets an empty pool, while the inherited one is kept referenced so its connections aren't closed
+    global _shared_engines_lock
+    _shared_engines_lock = threading.Lock()
+    for engine in _shared_engines.values():
+        _inherited_pools.append(engine.pool)
+        engine.pool = engine.pool.recreate()
+    _shared_engines.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_shared_engines_after_fork)
 
 
 def execute_query(raw_query: str, engine=None, connection=None, data=None) -> List[Tuple]:
@@ -46,12 +122,109 @@ def execute_query(raw_query: str, engine=None, connection=None, data=None) -> Li
     if connection:
         return execute(connection, query_statement)
     else:
-        provided_engine = engine is not None
-        engine = engine if provided_engine else retrieve_engine()
-
-        try:
-            with engine.connect() as connection:
-                return execute(connection, query_statement)
-        finally:
-            if not provided_engine:
-                engine.dispose()
+        # Without an engine, a warm connection is borrowed from the shared pool
+        engine = engine if engine is not None else retrieve_shared_engine()
+        with engine.connect() as connection:
+            return execute(connection, query_statement)
+
+
+def stream_query(raw_query: str, engine=None, data=None, batch_size: int = 10_000) -> Iterator[List[Tuple]]:
+    # A server-side cursor hands rows over in batches, so a whole table such as dialogue is never in memory at once 🌊
+    with _open_streaming_result(raw_query, engine, data, batch_size) as result:
+        yield from result.partitions(batch_size)
+
+
+def stream_query_rows(raw_query: str, engine=None, data=None, batch_size: int = 10_000) -> Iterator[Tuple]:
+    for rows in stream_query(raw_query, engine, data, batch_size):
+        yield from rows
+
+
+def stream_query_record_batches(
+    raw_query: str, engine=None, data=None, batch_size: int = 10_000, schema: Optional[pa.Schema] = None
+) -> Iterator[pa.RecordBatch]:
+    # Without a schema, column names come from the query and Arrow infers their types batch by batch
+    with _open_streaming_result(raw_query, engine, data, batch_size) as result:
+        column_names = list(result.keys())
+        for rows in result.partitions(batch_size):
+            columns = [list(column) for column in zip(*rows)]
+            if schema is None:
+                yield pa.record_batch(columns, names=column_names)
+            else:
+                yield pa.record_batch(columns, schema=schema)
+
+
+@contextmanager
+def _open_streaming_result(raw_query: str, engine, data, batch_size: int):
+    engine = engine if engine is not None else retrieve_shared_engine()
+    with engine.connect() as connection:
+        streaming_connection = connection.execution_options(stream_results=True, max_row_buffer=batch_size)
+        yield streaming_connection.execute(text(raw_query), data or {})
+
+
+def copy_rows(cursor, table_name: str, column_names: List[str], rows: Iterable[Sequence[Any]]) -> None:
+    # A single COPY FROM STDIN replaces one INSERT per row 🚚
+    statement = f"COPY {table_name} ({', '.join(column_names)}) FROM STDIN"
+    cursor.copy_expert(statement, _CopyRowsFile(rows))
+
+
+def reserve_identifiers(cursor, table_name: str, quantity: int) -> List[int]:
+    # Keys are taken from the identity sequence of the table, so rows can be referenced before they are copied
+    cursor.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)", (table_name, quantity)
+    )
+    return [identifier for (identifier,) in cursor.fetchall()]
+
+
+def execute_prepared(
+    cursor, statement_name: str, parameter_types: List[str], statement: str, parameters: Sequence[Any]
+) -> List[Tuple]:
+    # The statement is prepared once per connection, then the server reuses its plan on every execution
+    prepared_statements = _prepared_statements.setdefault(cursor.connection, set())
+    if statement_name not in prepared_statements:
+        cursor.execute(f"PREPARE {statement_name} ({', '.join(parameter_types)}) AS {statement}")
+        prepared_statements.add(statement_name)
+    cursor.execute(f"EXECUTE {statement_name} ({', '.join(['%s'] * len(parameters))})", parameters)
+    return cursor.fetchall()
+
+
+def retrieve_season_ids(cursor, season_numbers: Iterable[int]) -> Dict[int, int]:
+    rows = execute_prepared(
+        cursor,
+        "retrieve_season_ids",
+        ["SMALLINT[]"],
+        "SELECT number, id FROM season WHERE number = ANY($1)",
+        [list(season_numbers)],
+    )
+    return dict(rows)
+
+
+def retrieve_character_ids(cursor, short_names: Iterable[str]) -> Dict[str, int]:
+    rows = execute_prepared(
+        cursor,
+        "retrieve_character_ids",
+        ["VARCHAR[]"],
+        "SELECT short_name, id FROM character WHERE short_name = ANY($1)",
+        [list(short_names)],
+    )
+    return dict(rows)
+
+
+class _CopyRowsFile:
+    # File-like object read by COPY, rows are formatted only when PostgreSQL asks for more data
+    def __init__(self, rows: Iterable[Sequence[Any]]):
+        self._lines = (_format_copy_line(row) for row in rows)
+        self._pending = ""
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._pending) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._pending += line
+        data, self._pending = (self._pending, "") if size < 0 else (self._pending[:size], self._pending[size:])
+        return data
+
+
+def _format_copy_line(row: Sequence[Any]) -> str:
+    values = ("\\N" if value is None else str(value).translate(_copy_escapes) for value in row)
+    return "\t".join(values) + "\n"
@@ -1,38 +1,527 @@
+import asyncio
+import json
+import os
+import random
+import ssl
+import threading
+import time
+
 from contextlib import contextmanager
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any
+from typing import Dict
 from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from urllib.parse import urlsplit
 
+from requests import PreparedRequest
+from requests import RequestException
+from requests import Response
 from requests import Session
+from requests import Timeout
+from requests.adapters import DEFAULT_POOLSIZE
 from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.structures import CaseInsensitiveDict
+from requests.utils import DEFAULT_CA_BUNDLE_PATH
+from requests.utils import get_encoding_from_headers
 from urllib3 import Retry
 
+from pyfriends.cache_utils import content_digest
+from pyfriends.cache_utils import read_from_cache
+from pyfriends.cache_utils import write_to_cache
+
+# Only answers which will be the same next time are kept
+cacheable_status_codes = {200, 404}
+# What a cached answer must have besides its body
+cache_metadata_fields = ("status_code", "reason", "headers", "stored_at")
+# Answers saying the server is busy, so the same request is tried again a bit later
+retryable_status_codes = {429, 500, 502, 503, 504}
+
+
+@dataclass(frozen=True)
+class HTTPCache:
+    # Entries younger than ttl seconds are used as they are, older ones are revalidated with ETag/Last-Modified
+    # When offline, only the cache answers, no matter how old its entries are
+    ttl: float = 7 * 24 * 60 * 60
+    offline: bool = False
+    namespace: str = "http"
+
+
+def http_cache_from_environment() -> Optional[HTTPCache]:
+    # PYFRIENDS_HTTP_CACHE is either on (the default), off or offline
+    mode = os.getenv("PYFRIENDS_HTTP_CACHE", "on").lower()
+    if mode == "off":
+        return None
+    return HTTPCache(offline=mode == "offline")
+
+
+class RateLimiter:
+    # Token bucket: up to capacity requests go at once, then rate requests per second 🪣
+    # One instance can be shared by many sessions, threads and tasks, all of them take tokens from the same bucket
+    # Busy answers (429/5xx) are retried up to max_retries times, waiting what Retry-After says or a jittered backoff
+    def __init__(
+        self,
+        rate: float,
+        capacity: int,
+        max_retries: int = 5,
+        backoff_factor: float = 0.5,
+        max_backoff: float = 60.0,
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        # How many requests had to wait for a token, and how many were sent again
+        self.throttled = 0
+        self.retried = 0
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        wait_time = self._reserve()
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    async def acquire_async(self) -> None:
+        wait_time = self._reserve()
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+
+    def pause(self, seconds: float) -> None:
+        # Nobody gets a token during the next seconds, as the server asked everybody to slow down
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens = min(self._tokens, 0.0)
+            self._updated_at = max(self._updated_at, now + seconds)
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        # Full jitter, so requests which failed together don't come back together
+        with self._lock:
+            self.retried += 1
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2**attempt))
+
+    def _reserve(self) -> float:
+        # The token is taken right away, even if it only exists in the future, so waiting is fair among callers
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            wait_time = self._updated_at - now + max(0.0, -self._tokens) / self.rate
+            if wait_time > 0:
+                self.throttled += 1
+            return wait_time
+
+    def _refill(self, now: float) -> None:
+        # While paused, _updated_at is in the future and nothing is refilled until then
+        elapsed = max(0.0, now - self._updated_at)
+        self._tokens = min(float(self.capacity), self._tokens + elapsed * self.rate)
+        self._updated_at = max(self._updated_at, now)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # Retry-After comes either as seconds or as an HTTP date
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
 
 class CustomHTTPAdapter(HTTPAdapter):
-    def __init__(self, max_retries: Retry, timeout: int, stream: bool):
-        super(CustomHTTPAdapter, self).__init__(max_retries=max_retries)
+    def __init__(
+        self,
+        max_retries: Retry,
+        timeout: int,
+        stream: bool,
+        pool_connections: int = DEFAULT_POOLSIZE,
+        pool_maxsize: int = DEFAULT_POOLSIZE,
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
+        super(CustomHTTPAdapter, self).__init__(
+            max_retries=max_retries, pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
         self.timeout = timeout
         self.stream = stream
+        self.rate_limiter = rate_limiter
 
     def send(self, *args, **kwargs):
         kwargs["timeout"] = self.timeout
         kwargs["stream"] = self.stream
-        return super(CustomHTTPAdapter, self).send(*args, **kwargs)
+        if self.rate_limiter is None:
+            return super(CustomHTTPAdapter, self).send(*args, **kwargs)
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            response = super(CustomHTTPAdapter, self).send(*args, **kwargs)
+            if response.status_code not in retryable_status_codes or attempt >= self.rate_limiter.max_retries:
+                return response
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            delay = self.rate_limiter.backoff(attempt, retry_after)
+            response.close()
+            if response.status_code == 429:
+                # The limit is for everybody, thus every request sharing the limiter waits
+                self.rate_limiter.pause(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+
+
+class CachingHTTPAdapter(CustomHTTPAdapter):
+    # GET responses are kept on disk, so the same request made by another run doesn't go to the network 💾
+    def __init__(
+        self,
+        max_retries: Retry,
+        timeout: int,
+        stream: bool,
+        pool_connections: int = DEFAULT_POOLSIZE,
+        pool_maxsize: int = DEFAULT_POOLSIZE,
+        cache: HTTPCache = HTTPCache(),
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
+        # Cached answers don't take tokens from the rate limiter, only requests going to the network do
+        super(CachingHTTPAdapter, self).__init__(
+            max_retries, timeout, stream, pool_connections, pool_maxsize, rate_limiter
+        )
+        self.cache = cache
+
+    def send(self, request: PreparedRequest, *args, **kwargs) -> Response:
+        if request.method != "GET":
+            return super(CachingHTTPAdapter, self).send(request, *args, **kwargs)
+        key = content_digest(request.url.encode())
+        entry = _load_cache_entry(self.cache, key)
+        if entry:
+            metadata, body = entry
+            if self.cache.offline or time.time() - metadata["stored_at"] < self.cache.ttl:
+                return self._build_response(request, metadata, body)
+            # Stale entries are still good if the server says nothing has changed since then
+            if metadata["headers"].get("ETag"):
+                request.headers["If-None-Match"] = metadata["headers"]["ETag"]
+            if metadata["headers"].get("Last-Modified"):
+                request.headers["If-Modified-Since"] = metadata["headers"]["Last-Modified"]
+        elif self.cache.offline:
+            raise OfflineCacheMissException(f"There is no cached response for {request.url}", request=request)
+        response = super(CachingHTTPAdapter, self).send(request, *args, **kwargs)
+        if entry and response.status_code == 304:
+            response.close()
+            metadata["stored_at"] = time.time()
+            _save_cache_entry(self.cache, key, metadata, body)
+            return self._build_response(request, metadata, body)
+        if response.status_code in cacheable_status_codes:
+            metadata = {
+                "status_code": response.status_code,
+                "reason": response.reason,
+                "headers": dict(response.headers),
+                "stored_at": time.time(),
+            }
+            _save_cache_entry(self.cache, key, metadata, response.content)
+        return response
+
+    def _build_response(self, request: PreparedRequest, metadata: dict, body: bytes) -> Response:
+        response = Response()
+        response.status_code = metadata["status_code"]
+        response.reason = metadata["reason"]
+        response.headers = CaseInsensitiveDict(metadata["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response._content = body
+        return response
+
+
+def _load_cache_entry(cache: HTTPCache, key: str) -> Optional[Tuple[dict, bytes]]:
+    value = read_from_cache(cache.namespace, key)
+    if value is None:
+        return None
+    # Metadata goes in the first line, the body as it came in the rest
+    raw_metadata, _, body = value.partition(b"\n")
+    # A corrupted entry (like one whose writing was killed) is as good as a missing one
+    try:
+        metadata = json.loads(raw_metadata)
+    except ValueError:
+        return None
+    if not isinstance(metadata, dict) or any(name not in metadata for name in cache_metadata_fields):
+        return None
+    return metadata, body
+
+
+def _save_cache_entry(cache: HTTPCache, key: str, metadata: dict, body: bytes) -> None:
+    write_to_cache(cache.namespace, key, json.dumps(metadata).encode() + b"\n" + body)
+
+
+class OfflineCacheMissException(RequestException):
+    pass
 
 
 @contextmanager
 def requests_session(retries=3, backoff_factor=0.1, timeout=35, stream=False, **kwargs) -> Iterator[Session]:
+    session = create_session(retries, backoff_factor, timeout, stream, **kwargs)
+
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def create_session(
+    retries=3,
+    backoff_factor=0.1,
+    timeout=35,
+    stream=False,
+    pool_connections=DEFAULT_POOLSIZE,
+    pool_maxsize=DEFAULT_POOLSIZE,
+    cache: Optional[HTTPCache] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    **kwargs,
+) -> Session:
+    # The caller owns the session, thus its connections are kept alive until it is closed
+    # pool_maxsize is how many connections to the same host are kept, so it should match the number of threads
     session = Session()
 
+    if rate_limiter is not None:
+        # Otherwise urllib3 would retry 429/503 on its own, behind the back of the rate limiter and its counters
+        kwargs.setdefault("respect_retry_after_header", False)
     max_retries = Retry(
         total=retries,
         backoff_factor=backoff_factor,
         **kwargs,
     )
-    adapter = CustomHTTPAdapter(max_retries, timeout, stream)
+    if cache is None:
+        adapter = CustomHTTPAdapter(max_retries, timeout, stream, pool_connections, pool_maxsize, rate_limiter)
+    else:
+        adapter = CachingHTTPAdapter(max_retries, timeout, stream, pool_connections, pool_maxsize, cache, rate_limiter)
 
     session.mount("https://", adapter)
     session.mount("http://", adapter)
 
-    try:
-        yield session
-    finally:
-        session.close()
+    return session
+
+
+@dataclass(frozen=True)
+class AsyncResponse:
+    url: str
+    status_code: int
+    reason: str
+    headers: CaseInsensitiveDict
+    content: bytes
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+
+class AsyncHTTPClient:
+    # GET requests written and read through asyncio streams, so waiting for a server never blocks the event loop 🌀
+    # Connections are kept alive and reused per host, up to pool_maxsize idle ones. Like create_session, busy answers
+    # are retried through the rate limiter, if any, and responses are kept in the same cache when one is given
+    # Connections belong to the event loop which opened them, so a client is used and closed within a single one
+    def __init__(
+        self,
+        retries=3,
+        backoff_factor=0.1,
+        timeout=35,
+        pool_maxsize=DEFAULT_POOLSIZE,
+        cache: Optional[HTTPCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self._ssl_context: Optional[ssl.SSLContext] = None
+        self._idle_connections: Dict[Tuple[str, str, int], List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]] = {}
+
+    async def __aenter__(self) -> "AsyncHTTPClient":
+        return self
+
+    async def __aexit__(self, *exception_details) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        writers = [writer for connections in self._idle_connections.values() for _, writer in connections]
+        self._idle_connections.clear()
+        for writer in writers:
+            writer.close()
+        # Closing is best effort, a server which already went away is fine
+        await asyncio.gather(*(writer.wait_closed() for writer in writers), return_exceptions=True)
+
+    async def get(self, url: str) -> AsyncResponse:
+        if self.cache is None:
+            return await self._send(url, {})
+        headers = {}
+        key = content_digest(url.encode())
+        entry = _load_cache_entry(self.cache, key)
+        if entry:
+            metadata, body = entry
+            if self.cache.offline or time.time() - metadata["stored_at"] < self.cache.ttl:
+                return self._build_response(url, metadata, body)
+            # Stale entries are still good if the server says nothing has changed since then
+            if metadata["headers"].get("ETag"):
+                headers["If-None-Match"] = metadata["headers"]["ETag"]
+            if metadata["headers"].get("Last-Modified"):
+                headers["If-Modified-Since"] = metadata["headers"]["Last-Modified"]
+        elif self.cache.offline:
+            raise OfflineCacheMissException(f"There is no cached response for {url}")
+        response = await self._send(url, headers)
+        if entry and response.status_code == 304:
+            metadata["stored_at"] = time.time()
+            _save_cache_entry(self.cache, key, metadata, body)
+            return self._build_response(url, metadata, body)
+        if response.status_code in cacheable_status_codes:
+            metadata = {
+                "status_code": response.status_code,
+                "reason": response.reason,
+                "headers": dict(response.headers),
+                "stored_at": time.time(),
+            }
+            _save_cache_entry(self.cache, key, metadata, response.content)
+        return response
+
+    async def _send(self, url: str, headers: Dict[str, str]) -> AsyncResponse:
+        # Same as CustomHTTPAdapter.send, only awaiting instead of sleeping
+        if self.rate_limiter is None:
+            return await self._send_once(url, headers)
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire_async()
+            response = await self._send_once(url, headers)
+            if response.status_code not in retryable_status_codes or attempt >= self.rate_limiter.max_retries:
+                return response
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            delay = self.rate_limiter.backoff(attempt, retry_after)
+            if response.status_code == 429:
+                # The limit is for everybody, thus every request sharing the limiter waits
+                self.rate_limiter.pause(delay)
+            else:
+                await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _send_once(self, url: str, headers: Dict[str, str]) -> AsyncResponse:
+        # Connections which broke or timed out are retried up to retries times, a GET can always be sent again
+        parts = urlsplit(url)
+        origin = parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        attempt = 0
+        while True:
+            connection = self._take_idle_connection(origin)
+            # A kept-alive connection might have been closed by the server meanwhile, which isn't worth waiting for
+            reused = connection is not None
+            keep_alive = False
+            try:
+                if connection is None:
+                    connection = await asyncio.wait_for(self._open_connection(*origin), self.timeout)
+                exchange = self._exchange(connection, url, parts.netloc, target, headers)
+                response, keep_alive = await asyncio.wait_for(exchange, self.timeout)
+                return response
+            except (OSError, EOFError, ValueError, asyncio.LimitOverrunError, asyncio.TimeoutError) as e:
+                error = e
+            finally:
+                if connection is not None:
+                    if keep_alive:
+                        self._give_back(origin, connection)
+                    else:
+                        connection[1].close()
+            if attempt >= self.retries:
+                if isinstance(error, asyncio.TimeoutError):
+                    raise Timeout(f"GET {url} timed out after {self.timeout} seconds") from error
+                raise RequestsConnectionError(f"GET {url} failed: {error!r}") from error
+            if not reused:
+                await asyncio.sleep(self.backoff_factor * 2**attempt)
+            attempt += 1
+
+    async def _open_connection(self, scheme: str, host: str, port: int):
+        if scheme != "https":
+            return await asyncio.open_connection(host, port)
+        if self._ssl_context is None:
+            # Same certificates as requests
+            self._ssl_context = ssl.create_default_context(cafile=DEFAULT_CA_BUNDLE_PATH)
+        return await asyncio.open_connection(host, port, ssl=self._ssl_context)
+
+    async def _exchange(
+        self, connection, url: str, host: str, target: str, headers: Dict[str, str]
+    ) -> Tuple[AsyncResponse, bool]:
+        # A plain HTTP/1.1 exchange, the answer tells whether the connection can be used again
+        reader, writer = connection
+        request_headers = {
+            "Host": host,
+            "User-Agent": "pyfriends",
+            "Accept": "*/*",
+            "Accept-Encoding": "identity",
+            "Connection": "keep-alive",
+            **headers,
+        }
+        request_lines = [f"GET {target} HTTP/1.1"] + [f"{name}: {value}" for name, value in request_headers.items()]
+        writer.write(("\r\n".join(request_lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+        status_line = (await reader.readuntil(b"\r\n")).decode("latin-1").strip()
+        version, status_code, *reason = status_line.split(" ", 2)
+        status_code = int(status_code)
+        response_headers = CaseInsensitiveDict()
+        while True:
+            line = (await reader.readuntil(b"\r\n")).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            name, value = name.strip(), value.strip()
+            response_headers[name] = f"{response_headers[name]}, {value}" if name in response_headers else value
+        keep_alive = version == "HTTP/1.1" and response_headers.get("Connection", "").lower() != "close"
+        if status_code in (204, 304) or 100 <= status_code < 200:
+            content = b""
+        elif "chunked" in response_headers.get("Transfer-Encoding", "").lower():
+            content = await self._read_chunks(reader)
+        elif "Content-Length" in response_headers:
+            content = await reader.readexactly(int(response_headers["Content-Length"]))
+        else:
+            # The body ends with the connection
+            content = await reader.read()
+            keep_alive = False
+        response = AsyncResponse(url, status_code, reason[0] if reason else "", response_headers, content)
+        return response, keep_alive
+
+    @staticmethod
+    async def _read_chunks(reader: asyncio.StreamReader) -> bytes:
+        chunks = []
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0].strip(), 16)
+            if size == 0:
+                # Trailers, if any, end with an empty line too
+                while await reader.readuntil(b"\r\n") != b"\r\n":
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    def _take_idle_connection(self, origin: Tuple[str, str, int]):
+        connections = self._idle_connections.get(origin, [])
+        while connections:
+            reader, writer = connections.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer
+            writer.close()
+        return None
+
+    def _give_back(self, origin: Tuple[str, str, int], connection) -> None:
+        connections = self._idle_connections.setdefault(origin, [])
+        if len(connections) < self.pool_maxsize:
+            connections.append(connection)
+        else:
+            connection[1].close()
+
+    @staticmethod
+    def _build_response(url: str, metadata: dict, body: bytes) -> AsyncResponse:
+        return AsyncResponse(
+            url, metadata["status_code"], metadata["reason"], CaseInsensitiveDict(metadata["headers"]), body
+        )
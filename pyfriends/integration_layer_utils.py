@@ -0,0 +1,379 @@
+import json
+import shutil
+
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import field
+from pathlib import Path
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+from typing import Union
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from psycopg2.extras import execute_values
+
+from pyfriends import tvmaze
+from pyfriends.cache_utils import content_digest
+from pyfriends.columnar import CorpusFrames
+from pyfriends.columnar import CorpusTables
+from pyfriends.columnar import character_schema
+from pyfriends.columnar import dialogue_schema
+from pyfriends.columnar import episode_schema
+from pyfriends.columnar import retrieve_character_table
+from pyfriends.columnar import retrieve_corpus_frames
+from pyfriends.columnar import retrieve_episode_tables
+from pyfriends.columnar import scene_schema
+from pyfriends.core import ParserEngine
+from pyfriends.core import _parse_cache_namespace
+from pyfriends.core import _retrieve_episode_number
+from pyfriends.core import _retrieve_parser_engine
+from pyfriends.core import folder_seasons
+from pyfriends.core import regex_episode_number
+from pyfriends.database_utils import copy_rows
+from pyfriends.database_utils import reserve_identifiers
+from pyfriends.database_utils import retrieve_character_ids
+from pyfriends.database_utils import retrieve_season_ids
+
+integration_layer_folder = Path(__file__).parent.joinpath("integration_layer")
+manifest_file_name = "manifest.json"
+# Tables with rows from each episode have one file per season, so only the seasons that changed are rewritten
+seasonal_tables = {
+    "episode": (episode_schema, "NUMBER", [("NUMBER", "ascending")]),
+    "scene": (scene_schema, "EPISODE_NUMBER", [("EPISODE_NUMBER", "ascending"), ("SCENE_ORDER", "ascending")]),
+    "dialogue": (
+        dialogue_schema,
+        "EPISODE_NUMBER",
+        [("EPISODE_NUMBER", "ascending"), ("TRANSCRIPTION_ORDER", "ascending")],
+    ),
+}
+# Seasonal tables are partitioned like dialogue.parquet/SEASON_NUMBER=01/part-0.parquet, thus filtering by season
+# reads only the files of that season. Zero-padded seasons keep the files in the order of the show
+season_partitioning = ds.partitioning(pa.schema([("SEASON_NUMBER", pa.int64())]), flavor="hive")
+# Repetitive columns are written as dictionaries, so they are smaller on disk and pandas reads them as categoricals
+dictionary_columns = {
+    "episode": [],
+    "scene": ["EPISODE_NUMBER", "SCENE_CATEGORY"],
+    "dialogue": ["EPISODE_NUMBER", "CHARACTER_NAME", "SCENE_DESCRIPTION", "SCENE_CATEGORY"],
+    "character": [],
+}
+
+
+@dataclass(frozen=True)
+class ParquetOptions:
+    compression: str = "zstd"
+    compression_level: Optional[int] = None
+    row_group_size: int = 128 * 1024
+
+
+@dataclass(frozen=True)
+class ManifestEntry:
+    digest: str
+    season_number: int
+    episode_number: str
+
+
+@dataclass(frozen=True)
+class Manifest:
+    # Episodes parsed by another version of the parser might not be the same
+    parser_version: str
+    # By the name of the episode file in the raw layer
+    entries: Dict[str, ManifestEntry] = field(default_factory=dict)
+    # Seasons which were built, None means all of them. Only these are compared the next time
+    seasons: Optional[List[int]] = None
+
+
+@dataclass(frozen=True)
+class ManifestChanges:
+    changed_file_names: List[str]
+    changed_entries: List[ManifestEntry]
+    removed_entries: List[ManifestEntry]
+
+    @property
+    def affected_episodes(self) -> Set[Tuple[int, str]]:
+        return {(entry.season_number, entry.episode_number) for entry in self.changed_entries + self.removed_entries}
+
+
+def retrieve_current_manifest(
+    engine: Optional[Union[ParserEngine, str]] = None, seasons: Optional[Iterable[int]] = None
+) -> Manifest:
+    seasons = sorted(set(seasons)) if seasons is not None else None
+    entries = {}
+    for episode_path in sorted(folder_seasons.glob("*.html")):
+        match = regex_episode_number.match(episode_path.stem)
+        if match and (seasons is None or int(episode_path.stem[:2]) in seasons):
+            digest = content_digest(episode_path.read_bytes())
+            entries[episode_path.name] = ManifestEntry(
+                digest, int(episode_path.stem[:2]), _retrieve_episode_number(match)
+            )
+    return Manifest(_parse_cache_namespace(_retrieve_parser_engine(engine)), entries, seasons)
+
+
+def load_manifest(folder: Path = integration_layer_folder) -> Optional[Manifest]:
+    manifest_path = folder.joinpath(manifest_file_name)
+    if not manifest_path.exists():
+        return None
+    content = json.loads(manifest_path.read_text())
+    entries = {file_name: ManifestEntry(**entry) for file_name, entry in content["entries"].items()}
+    return Manifest(content["parser_version"], entries, content.get("seasons"))
+
+
+def save_manifest(manifest: Manifest, folder: Path = integration_layer_folder) -> None:
+    folder.joinpath(manifest_file_name).write_text(json.dumps(asdict(manifest), indent=2, sort_keys=True))
+
+
+def compare_manifests(previous_manifest: Manifest, current_manifest: Manifest) -> ManifestChanges:
+    parser_has_changed = previous_manifest.parser_version != current_manifest.parser_version
+    changed_file_names = [
+        file_name
+        for file_name, entry in current_manifest.entries.items()
+        if parser_has_changed or previous_manifest.entries.get(file_name) != entry
+    ]
+    changed_entries = [current_manifest.entries[file_name] for file_name in changed_file_names]
+    removed_entries = [
+        entry for file_name, entry in previous_manifest.entries.items() if file_name not in current_manifest.entries
+    ]
+    return ManifestChanges(changed_file_names, changed_entries, removed_entries)
+
+
+def write_integration_layer(
+    tables: CorpusTables, folder: Path = integration_layer_folder, options: Optional[ParquetOptions] = None
+) -> None:
+    clear_integration_layer(folder)
+    write_season_partitions(tables, folder, options)
+    _write_table("character", tables.character, folder.joinpath("character.parquet"), options)
+
+
+def clear_integration_layer(folder: Path = integration_layer_folder) -> None:
+    # The whole layer is going to be written again, so files from seasons which no longer exist should go away
+    for table_name in seasonal_tables:
+        table_folder = folder.joinpath(f"{table_name}.parquet")
+        if table_folder.is_dir():
+            shutil.rmtree(table_folder)
+        elif table_folder.exists():
+            table_folder.unlink()
+    folder.joinpath(manifest_file_name).unlink(missing_ok=True)
+
+
+def write_season_partitions(
+    tables: CorpusTables, folder: Path = integration_layer_folder, options: Optional[ParquetOptions] = None
+) -> None:
+    for table_name in seasonal_tables:
+        table_folder = folder.joinpath(f"{table_name}.parquet")
+        table = getattr(tables, table_name)
+        for season_number in pc.unique(table["SEASON_NUMBER"]).to_pylist():
+            season_rows = table.filter(pc.equal(table["SEASON_NUMBER"], season_number))
+            _write_season_partition(table_name, table_folder, season_number, season_rows, options)
+
+
+def write_character_table(
+    folder: Path = integration_layer_folder,
+    main_character_names: Optional[List[str]] = None,
+    options: Optional[ParquetOptions] = None,
+) -> pa.Table:
+    # Who speaks first depends on all seasons, so the character table is made out of all dialogues
+    all_character_names = read_integration_table("dialogue", folder, columns=["CHARACTER_NAME"])
+    character = retrieve_character_table(all_character_names["CHARACTER_NAME"].cast(pa.string()), main_character_names)
+    _write_table("character", character, folder.joinpath("character.parquet"), options)
+    return character
+
+
+def read_integration_table(
+    table_name: str,
+    folder: Path = integration_layer_folder,
+    seasons: Optional[Iterable[int]] = None,
+    columns: Optional[List[str]] = None,
+) -> pa.Table:
+    table_path = folder.joinpath(f"{table_name}.parquet")
+    if table_name not in seasonal_tables:
+        return pq.read_table(table_path, columns=columns)
+    schema = _retrieve_stored_schema(table_name)
+    if not table_path.exists():
+        return (schema if columns is None else pa.schema([schema.field(name) for name in columns])).empty_table()
+    dataset = ds.dataset(table_path, format="parquet", partitioning=season_partitioning)
+    # Only the partitions of the requested seasons are read
+    season_filter = None if seasons is None else ds.field("SEASON_NUMBER").isin(list(seasons))
+    return dataset.to_table(columns=columns or schema.names, filter=season_filter)
+
+
+def rebuild_integration_layer(
+    folder: Path = integration_layer_folder,
+    connection=None,
+    main_character_names: Optional[List[str]] = None,
+    max_workers: Optional[int] = None,
+    engine: Optional[Union[ParserEngine, str]] = None,
+    options: Optional[ParquetOptions] = None,
+) -> ManifestChanges:
+    # Only episodes whose file has changed since the last build are parsed again 🔁
+    # Their rows replace the old ones in the parquet files of their seasons and, given a connection, in the database
+    previous_manifest = load_manifest(folder)
+    if previous_manifest is None:
+        raise FileNotFoundError(f"There is no {manifest_file_name} in {folder}, so the whole layer must be built first")
+    # Seasons which were never built stay that way, instead of being seen as new
+    current_manifest = retrieve_current_manifest(engine, previous_manifest.seasons)
+    changes = compare_manifests(previous_manifest, current_manifest)
+    if not changes.changed_entries and not changes.removed_entries:
+        return changes
+    changed_paths = [folder_seasons.joinpath(file_name) for file_name in changes.changed_file_names]
+    tables = retrieve_episode_tables(changed_paths, main_character_names, max_workers, engine=engine)
+    affected_episodes = changes.affected_episodes
+    affected_seasons = sorted({season_number for season_number, _ in affected_episodes})
+    for table_name, (schema, episode_number_column, sort_keys) in seasonal_tables.items():
+        table_folder = folder.joinpath(f"{table_name}.parquet")
+        new_rows = getattr(tables, table_name)
+        for season_number in affected_seasons:
+            previous_rows = read_integration_table(table_name, folder, [season_number]).cast(schema)
+            affected_numbers = pa.array(
+                [number for season, number in affected_episodes if season == season_number], pa.string()
+            )
+            is_affected = pc.is_in(previous_rows[episode_number_column], value_set=affected_numbers)
+            kept_rows = previous_rows.filter(pc.invert(is_affected))
+            season_rows = new_rows.filter(pc.equal(new_rows["SEASON_NUMBER"], season_number))
+            merged_rows = pa.concat_tables([kept_rows, season_rows])
+            # Table.sort_by is newer than the pyarrow pinned in Pipfile.lock
+            sorted_rows = merged_rows.take(pc.sort_indices(merged_rows, sort_keys=sort_keys))
+            _write_season_partition(table_name, table_folder, season_number, sorted_rows, options)
+    write_character_table(folder, main_character_names, options)
+    if connection is not None:
+        _update_database(connection, retrieve_corpus_frames(tables), changes)
+    # Written only at the end, thus an interrupted rebuild is simply done again next time
+    save_manifest(current_manifest, folder)
+    return changes
+
+
+def _season_partition_path(table_folder: Path, season_number: int) -> Path:
+    return table_folder.joinpath(f"SEASON_NUMBER={season_number:02}", "part-0.parquet")
+
+
+def _write_season_partition(
+    table_name: str, table_folder: Path, season_number: int, rows: pa.Table, options: Optional[ParquetOptions] = None
+) -> None:
+    partition_path = _season_partition_path(table_folder, season_number)
+    if rows.num_rows == 0:
+        if partition_path.parent.exists():
+            shutil.rmtree(partition_path.parent)
+        return
+    partition_path.parent.mkdir(parents=True, exist_ok=True)
+    # The season is already in the name of the folder
+    _write_table(table_name, rows.remove_column(rows.schema.get_field_index("SEASON_NUMBER")), partition_path, options)
+
+
+def _write_table(table_name: str, table: pa.Table, path: Path, options: Optional[ParquetOptions] = None) -> None:
+    options = ParquetOptions() if options is None else options
+    schema = seasonal_tables[table_name][0] if table_name in seasonal_tables else character_schema
+    table = table.cast(pa.schema([schema.field(name) for name in table.column_names]))
+    # Encoded one by one, as the pyarrow pinned in Pipfile.lock can't cast strings to dictionaries
+    for name in dictionary_columns[table_name]:
+        if name in table.column_names:
+            column_index = table.schema.get_field_index(name)
+            table = table.set_column(column_index, name, table[name].dictionary_encode())
+    pq.write_table(
+        table,
+        path,
+        row_group_size=options.row_group_size,
+        compression=options.compression,
+        compression_level=options.compression_level,
+        # Dictionaries of columns such as TRANSCRIPTION_LINE would be as large as the column itself
+        use_dictionary=dictionary_columns[table_name] or False,
+    )
+
+
+def _retrieve_stored_schema(table_name: str) -> pa.Schema:
+    schema = seasonal_tables[table_name][0] if table_name in seasonal_tables else character_schema
+    return pa.schema(
+        [
+            (
+                schema_field.with_type(pa.dictionary(pa.int32(), schema_field.type))
+                if schema_field.name in dictionary_columns[table_name]
+                else schema_field
+            )
+            for schema_field in schema
+        ]
+    )
+
+
+def load_corpus_frames(
+    cursor, frames: CorpusFrames, enriched_episodes: Optional[Dict[Tuple[int, str], tvmaze.Episode]] = None
+) -> None:
+    # Episodes are inserted or updated, then their scenes and dialogues replace whatever they had before
+    # Each table takes a handful of statements no matter how many episodes there are 📦
+    enriched_episodes = enriched_episodes or {}
+    character_names = frames.character["NAME"].tolist()
+    cursor.execute(
+        "INSERT INTO character (short_name) SELECT unnest(%s::VARCHAR[]) ON CONFLICT (short_name) DO NOTHING",
+        (character_names,),
+    )
+    character_ids = retrieve_character_ids(cursor, character_names)
+    season_ids = retrieve_season_ids(cursor, frames.episode["SEASON_NUMBER"].unique().tolist())
+    season_numbers = {season_id: season_number for season_number, season_id in season_ids.items()}
+    episode_rows = []
+    for episode in frames.episode.itertuples(index=False):
+        episode_details = enriched_episodes.get((episode.SEASON_NUMBER, episode.NUMBER))
+        air_date, summary = (episode_details.air_date, episode_details.summary) if episode_details else (None, None)
+        episode_rows.append((episode.NUMBER, air_date, episode.TITLE, summary, season_ids[episode.SEASON_NUMBER]))
+    # Details from TVMaze which are already there are kept if there are no new ones
+    upserted_episodes = execute_values(
+        cursor,
+        "INSERT INTO episode (number, air_date, title, summary, season_id) VALUES %s "
+        "ON CONFLICT (number, season_id) DO UPDATE SET title = EXCLUDED.title, "
+        "air_date = COALESCE(EXCLUDED.air_date, episode.air_date), "
+        "summary = COALESCE(EXCLUDED.summary, episode.summary) "
+        "RETURNING season_id, number, id",
+        episode_rows,
+        fetch=True,
+    )
+    episode_ids = {
+        (season_numbers[season_id], number): episode_id for season_id, number, episode_id in upserted_episodes
+    }
+    # Dialogues go away with their scenes
+    cursor.execute("DELETE FROM scene WHERE episode_id = ANY(%s)", (list(episode_ids.values()),))
+    # Scene keys are known beforehand, thus dialogues can point to them without reading anything back
+    scene_ids = dict(
+        zip(
+            zip(frames.scene["SEASON_NUMBER"], frames.scene["EPISODE_NUMBER"], frames.scene["SCENE_ORDER"]),
+            reserve_identifiers(cursor, "scene", len(frames.scene)),
+        )
+    )
+    scene_rows = (
+        (
+            scene_ids[(scene.SEASON_NUMBER, scene.EPISODE_NUMBER, scene.SCENE_ORDER)],
+            scene.SCENE_ORDER,
+            scene.SCENE_DESCRIPTION,
+            scene.SCENE_CATEGORY,
+            episode_ids[(scene.SEASON_NUMBER, scene.EPISODE_NUMBER)],
+        )
+        for scene in frames.scene.itertuples(index=False)
+    )
+    copy_rows(cursor, "scene", ["id", "number", "description", "category", "episode_id"], scene_rows)
+    dialogue_rows = (
+        (
+            dialogue.TRANSCRIPTION_ORDER,
+            dialogue.TRANSCRIPTION_LINE,
+            scene_ids[(dialogue.SEASON_NUMBER, dialogue.EPISODE_NUMBER, dialogue.SCENE_ORDER)],
+            character_ids[dialogue.CHARACTER_NAME],
+        )
+        for dialogue in frames.dialogue.itertuples(index=False)
+    )
+    copy_rows(cursor, "dialogue", ["number", "text", "scene_id", "character_id"], dialogue_rows)
+
+
+def _update_database(connection, frames: CorpusFrames, changes: ManifestChanges) -> None:
+    # Everything is done in one transaction
+    with connection, connection.cursor() as cursor:
+        for entry in changes.removed_entries:
+            cursor.execute(
+                "DELETE FROM episode ep USING season se WHERE se.id = ep.season_id AND se.number = %s AND ep.number = %s",
+                (entry.season_number, entry.episode_number),
+            )
+        load_corpus_frames(cursor, frames)
+        # Characters who no longer speak in any episode
+        cursor.execute(
+            "DELETE FROM character ch WHERE NOT EXISTS (SELECT 1 FROM dialogue di WHERE di.character_id = ch.id)"
+        )
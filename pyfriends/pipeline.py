@@ -0,0 +1,289 @@
+import tracemalloc
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from time import perf_counter
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from psycopg2.extras import execute_values
+
+from pyfriends import tvmaze
+from pyfriends.columnar import CorpusFrames
+from pyfriends.columnar import CorpusTables
+from pyfriends.columnar import retrieve_corpus_frames
+from pyfriends.columnar import retrieve_corpus_tables
+from pyfriends.core import ParserEngine
+from pyfriends.core import retrieve_two_part_episode_numbers
+from pyfriends.integration_layer_utils import ParquetOptions
+from pyfriends.integration_layer_utils import clear_integration_layer
+from pyfriends.integration_layer_utils import integration_layer_folder
+from pyfriends.integration_layer_utils import load_corpus_frames
+from pyfriends.integration_layer_utils import retrieve_current_manifest
+from pyfriends.integration_layer_utils import save_manifest
+from pyfriends.integration_layer_utils import write_character_table
+from pyfriends.integration_layer_utils import write_season_partitions
+
+# https://www.tvmaze.com/shows/431/friends
+friends_id = 431
+
+entire_ddl = """
+-- ---------------------------------------------
+-- CLEANING UP
+
+DROP TABLE IF EXISTS character CASCADE;
+DROP TABLE IF EXISTS dialogue CASCADE;
+DROP TABLE IF EXISTS scene CASCADE;
+DROP TABLE IF EXISTS episode CASCADE;
+DROP TABLE IF EXISTS season CASCADE;
+DROP TABLE IF EXISTS show CASCADE;
+
+-- ---------------------------------------------
+-- ALL TABLES
+
+CREATE TABLE IF NOT EXISTS show
+(
+    id        INT GENERATED ALWAYS AS IDENTITY,
+    name      VARCHAR(255) NOT NULL UNIQUE,
+    premiered DATE         NOT NULL,
+    summary   TEXT         NOT NULL,
+    network   VARCHAR(255) NOT NULL,
+    country   VARCHAR(255) NOT NULL,
+    PRIMARY KEY (id)
+);
+
+CREATE TABLE IF NOT EXISTS season
+(
+    id        INT GENERATED ALWAYS AS IDENTITY,
+    number    SMALLINT NOT NULL,
+    premiered DATE     NOT NULL,
+    end_date  DATE     NOT NULL,
+    PRIMARY KEY (id)
+);
+
+CREATE TABLE IF NOT EXISTS episode
+(
+    id               INT GENERATED ALWAYS AS IDENTITY,
+    number           VARCHAR(5)   NOT NULL,
+    air_date         DATE         NULL,
+    title            VARCHAR(255) NULL,
+    summary          TEXT         NULL,
+    PRIMARY KEY (id)
+);
+
+CREATE TABLE IF NOT EXISTS scene
+(
+    id          INT GENERATED ALWAYS AS IDENTITY,
+    number      SMALLINT     NOT NULL,
+    description TEXT         NOT NULL,
+    category    VARCHAR(255) NOT NULL,
+    PRIMARY KEY (id)
+);
+
+CREATE TABLE IF NOT EXISTS dialogue
+(
+    id     INT GENERATED ALWAYS AS IDENTITY,
+    number SMALLINT NOT NULL,
+    text   TEXT     NOT NULL,
+    PRIMARY KEY (id)
+);
+
+CREATE TABLE IF NOT EXISTS character
+(
+    id         INT GENERATED ALWAYS AS IDENTITY,
+    short_name VARCHAR(255) NOT NULL UNIQUE,
+    PRIMARY KEY (id)
+);
+
+-- ---------------------------------------------
+-- FOREIGN KEY CONSTRAINTS
+
+ALTER TABLE dialogue
+    ADD COLUMN scene_id INTEGER NOT NULL,
+    ADD COLUMN character_id INTEGER NULL;
+
+ALTER TABLE dialogue
+    ADD CONSTRAINT constraint_fk_scene
+        FOREIGN KEY (scene_id)
+            REFERENCES scene (id)
+            ON DELETE CASCADE,
+    ADD CONSTRAINT constraint_fk_character
+        FOREIGN KEY (character_id)
+            REFERENCES character (id)
+            ON DELETE CASCADE;
+
+ALTER TABLE scene
+    ADD COLUMN episode_id INTEGER NOT NULL;
+
+ALTER TABLE scene
+    ADD CONSTRAINT constraint_fk
+        FOREIGN KEY (episode_id)
+            REFERENCES episode (id)
+            ON DELETE CASCADE;
+
+ALTER TABLE episode
+    ADD COLUMN season_id INTEGER NOT NULL;
+
+ALTER TABLE episode
+    ADD CONSTRAINT constraint_fk
+        FOREIGN KEY (season_id)
+            REFERENCES season (id)
+            ON DELETE CASCADE;
+
+ALTER TABLE season
+    ADD COLUMN show_id INTEGER NOT NULL;
+
+ALTER TABLE season
+    ADD CONSTRAINT constraint_fk
+        FOREIGN KEY (show_id)
+            REFERENCES show (id)
+            ON DELETE CASCADE;
+
+-- ---------------------------------------------
+-- OTHER CONSTRAINTS APART FROM FOREIGN KEY
+
+ALTER TABLE season ADD CONSTRAINT unique_season_per_show UNIQUE (number, show_id);
+ALTER TABLE episode ADD CONSTRAINT unique_episode_per_season UNIQUE (number, season_id);
+ALTER TABLE scene ADD CONSTRAINT unique_scene_per_episode UNIQUE (number, episode_id);
+ALTER TABLE dialogue ADD CONSTRAINT unique_dialogue_per_scene_character UNIQUE(scene_id, number, character_id);
+"""
+
+
+@dataclass(frozen=True)
+class StageReport:
+    name: str
+    # Seconds spent in the stage, summed up over all the seasons which went through it
+    wall_time: float
+    # The most memory Python allocated at once during the stage, on top of what was allocated before it
+    peak_memory: int
+
+
+class StageProfiler:
+    # Memory is only measured while tracemalloc is tracing, and worker processes aren't taken into account
+    def __init__(self):
+        self._wall_times: Dict[str, float] = {}
+        self._peak_memories: Dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        memory_before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        started_at = perf_counter()
+        try:
+            yield
+        finally:
+            wall_time = perf_counter() - started_at
+            _, peak_memory = tracemalloc.get_traced_memory()
+            self._wall_times[name] = self._wall_times.get(name, 0.0) + wall_time
+            self._peak_memories[name] = max(self._peak_memories.get(name, 0), peak_memory - memory_before)
+
+    @property
+    def reports(self) -> List[StageReport]:
+        return [StageReport(name, wall_time, self._peak_memories[name]) for name, wall_time in self._wall_times.items()]
+
+
+def run_pipeline(
+    seasons: Iterable[int] = range(1, 11),
+    folder: Path = integration_layer_folder,
+    connection=None,
+    main_character_names: Optional[List[str]] = None,
+    max_workers: Optional[int] = None,
+    use_cache: bool = True,
+    engine: Optional[Union[ParserEngine, str]] = None,
+    enrich_episodes: bool = False,
+    parquet_options: Optional[ParquetOptions] = None,
+) -> List[StageReport]:
+    # Seasons go through parse → frames → parquet → DDL → load one at a time, so only one of them is in memory 🚰
+    # Without a connection, only the parquet files are built
+    seasons = list(seasons)
+    profiler = StageProfiler()
+    tracing_started_here = not tracemalloc.is_tracing()
+    if tracing_started_here:
+        tracemalloc.start()
+    try:
+        clear_integration_layer(folder)
+        database_is_ready = False
+        episode_index = None
+        for season in seasons:
+            with profiler.stage("parse"):
+                tables = parse(season, main_character_names, max_workers, use_cache, engine)
+            frames = None
+            if connection is not None:
+                with profiler.stage("frames"):
+                    frames = create_frames(tables)
+            with profiler.stage("parquet"):
+                write_parquet(tables, folder, parquet_options)
+            del tables
+            if connection is None:
+                continue
+            if not database_is_ready:
+                with profiler.stage("ddl"):
+                    create_database_tables(connection)
+                with profiler.stage("load"):
+                    load_show_and_seasons(connection)
+                    # Details of all episodes are retrieved once, then each season takes its own
+                    if enrich_episodes:
+                        episode_index = tvmaze.retrieve_episode_index(
+                            friends_id, two_part_numbers=retrieve_two_part_episode_numbers()
+                        )
+                database_is_ready = True
+            with profiler.stage("load"):
+                load(connection, frames, episode_index)
+        with profiler.stage("parquet"):
+            write_character_table(folder, main_character_names, parquet_options)
+            # From now on, only episodes whose transcripts change have to be built again
+            save_manifest(retrieve_current_manifest(engine, seasons), folder)
+    finally:
+        if tracing_started_here:
+            tracemalloc.stop()
+    return profiler.reports
+
+
+def parse(
+    season: int,
+    main_character_names: Optional[List[str]] = None,
+    max_workers: Optional[int] = None,
+    use_cache: bool = True,
+    engine: Optional[Union[ParserEngine, str]] = None,
+) -> CorpusTables:
+    return retrieve_corpus_tables([season], main_character_names, max_workers, use_cache, engine)
+
+
+def create_frames(tables: CorpusTables) -> CorpusFrames:
+    return retrieve_corpus_frames(tables)
+
+
+def write_parquet(
+    tables: CorpusTables, folder: Path = integration_layer_folder, options: Optional[ParquetOptions] = None
+) -> None:
+    write_season_partitions(tables, folder, options)
+
+
+def create_database_tables(connection) -> None:
+    with connection, connection.cursor() as cursor:
+        cursor.execute(entire_ddl)
+
+
+def load_show_and_seasons(connection, show_identifier: int = friends_id) -> None:
+    show = tvmaze.show_details(show_identifier)
+    seasons = tvmaze.all_seasons(show_identifier)
+    with connection, connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO show (name, premiered, summary, network, country) VALUES (%s, %s, %s, %s, %s) RETURNING id",
+            (show.name, show.premiered, show.summary, show.network.name, show.network.country),
+        )
+        show_id = cursor.fetchone()[0]
+        season_rows = [(season.number, season.premiered_date, season.end_date, show_id) for season in seasons]
+        execute_values(cursor, "INSERT INTO season (number, premiered, end_date, show_id) VALUES %s", season_rows)
+
+
+def load(
+    connection, frames: CorpusFrames, episode_index: Optional[Dict[Tuple[int, str], tvmaze.Episode]] = None
+) -> None:
+    with connection, connection.cursor() as cursor:
+        load_corpus_frames(cursor, frames, episode_index)
@@ -1,9 +1,38 @@
+import html
 import re
 
+# Compiled once, it is applied to every line of every transcript
+_newline_or_nbsp = re.compile("\r\n|\r|\n|\xa0")
+
 
 def strip_left_and_right_sides(value: str, rules: str = " \t\r\n") -> str:
     return value.strip(rules)
 
 
 def newline_or_nbsp_to_space(value: str) -> str:
-    return re.sub(r"(\r\n|\r|\n| )", " ", value)
+    # Most lines have none of them, and looking for each one is cheaper than a substitution
+    if "\n" not in value and "\xa0" not in value and "\r" not in value:
+        return value
+    return _newline_or_nbsp.sub(" ", value)
+
+
+def clean_line(value: str) -> str:
+    # What is done to each line of a transcript before it is classified
+    return strip_left_and_right_sides(newline_or_nbsp_to_space(value))
+
+
+# Tags and comments, quoted attribute values may have > inside them. Anything else starting with < is text
+_html_markup = re.compile(r"<!--.*?-->|</?[a-zA-Z][^\s/>]*(?:[^>\"']|\"[^\"]*\"|'[^']*')*>", re.DOTALL)
+# Only references ending with a semicolon, the ones without it are kept as they were written
+_html_character_reference = re.compile(r"&(?:#[0-9]+|#[xX][0-9a-fA-F]+|[a-zA-Z][a-zA-Z0-9]*);")
+
+
+def html_to_text(value: str) -> str:
+    # Same text as BeautifulSoup(value, "html.parser").text for well-formed snippets such as TVMaze summaries,
+    # but no tree is built, thus it's many times faster
+    if "<" not in value and "&" not in value:
+        return value
+    text = _html_markup.sub("", value)
+    if "&" not in text:
+        return text
+    return _html_character_reference.sub(lambda match: html.unescape(match.group()), text)
@@ -1,24 +1,54 @@
+import asyncio
 import logging
 import os
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from dataclasses import field
+from dataclasses import replace
 from datetime import date
+from typing import Any
+from typing import Dict
+from typing import Iterable
 from typing import List
 from typing import Optional
+from typing import Tuple
+from typing import Union
 
-from bs4 import BeautifulSoup
 from requests import RequestException
 
-from pyfriends.http_utils import requests_session
+from pyfriends.http_utils import AsyncHTTPClient
+from pyfriends.http_utils import RateLimiter
+from pyfriends.http_utils import create_session
+from pyfriends.http_utils import http_cache_from_environment
+from pyfriends.text_utils import html_to_text
 
 logger = logging.getLogger(__name__)
 
 BASE_ENDPOINT_ADDRESS = os.getenv("TVMAZE_ENDPOINT_API", "https://api.tvmaze.com")
-SHOW_INFORMATION_DETAILS = f"{BASE_ENDPOINT_ADDRESS}/shows/{{id}}"
-SHOW_SEASONS = f"{BASE_ENDPOINT_ADDRESS}/shows/{{id}}/seasons"
-SHOW_CAST = f"{BASE_ENDPOINT_ADDRESS}/shows/{{id}}/cast"
-SHOW_EPISODE_DETAILS = f"{BASE_ENDPOINT_ADDRESS}/shows/{{id}}/episodebynumber?season={{season}}&number={{episode}}"
-SHOW_EPISODES = f"{BASE_ENDPOINT_ADDRESS}/seasons/{{id}}/episodes"
+SHOW_INFORMATION_DETAILS_PATH = "/shows/{id}"
+SHOW_SEASONS_PATH = "/shows/{id}/seasons"
+SHOW_CAST_PATH = "/shows/{id}/cast"
+SHOW_EPISODE_DETAILS_PATH = "/shows/{id}/episodebynumber?season={season}&number={episode}"
+SHOW_EPISODES_PATH = "/seasons/{id}/episodes"
+SHOW_INFORMATION_DETAILS = f"{BASE_ENDPOINT_ADDRESS}{SHOW_INFORMATION_DETAILS_PATH}"
+SHOW_SEASONS = f"{BASE_ENDPOINT_ADDRESS}{SHOW_SEASONS_PATH}"
+SHOW_CAST = f"{BASE_ENDPOINT_ADDRESS}{SHOW_CAST_PATH}"
+SHOW_EPISODE_DETAILS = f"{BASE_ENDPOINT_ADDRESS}{SHOW_EPISODE_DETAILS_PATH}"
+SHOW_EPISODES = f"{BASE_ENDPOINT_ADDRESS}{SHOW_EPISODES_PATH}"
+# Connections kept alive per host, enough for the default workers of enrich_many and a few more
+DEFAULT_POOL_MAXSIZE = 16
+# TVMaze allows at least 20 calls every 10 seconds for each IP address
+# https://www.tvmaze.com/api#rate-limiting
+RATE_LIMIT_CALLS = 20
+RATE_LIMIT_PERIOD = 10
+# Threads waiting for TVMaze at the same time when many requests are made at once
+# The rate limit is the ceiling, not the threads: after a burst of 20 calls only 2 go every second, which a few
+# threads already keep up with, so more of them would only wait for a token
+DEFAULT_MAX_WORKERS = 4
+# Same for requests of AsyncTVMazeClient.enrich_many awaited at the same time
+DEFAULT_MAX_CONCURRENCY = DEFAULT_MAX_WORKERS
 
 
 @dataclass(frozen=True)
@@ -43,6 +73,9 @@ class Episode:
     runtime: int
     summary: str
     type: str
+    # Where it is in the show, specials have no number. They don't take part in comparisons
+    season: Optional[int] = field(default=None, compare=False)
+    number: Optional[int] = field(default=None, compare=False)
 
 
 @dataclass(frozen=True)
@@ -75,57 +108,71 @@ class Cast:
     person: Person
 
 
-def show_details(identifier: int) -> Optional[Show]:
-    # https://www.tvmaze.com/api#show-main-information
-    with requests_session() as r:
-        url = SHOW_INFORMATION_DETAILS.format(id=identifier)
-        try:
-            response = r.get(url)
-            status_code = response.status_code
-
-            if status_code == 200:
-                body = response.json()
-                # Network object
-                network_details_from_body = body["network"]
-                network = Network(network_details_from_body["name"], network_details_from_body["country"]["name"])
-                # Cleaning summary because it comes as HTML
-                summary_as_html = body["summary"]
-                soup = BeautifulSoup(summary_as_html, "html.parser")
-                summary = soup.text
-                # The final object
-                return Show(body["name"], body["genres"], date.fromisoformat(body["premiered"]), summary, network)
-            if status_code == 404:
-                return None
-
-            raise UnexpectedBehaviorTVMazeAPIException
-        except RequestException as e:
-            """
-            See more details at: https://requests.readthedocs.io/en/latest/user/quickstart/#errors-and-exceptions
-            """
-            logger.error(f"A network, time-out or HTTP error was caught. Details: {e}")
-            raise e
+@dataclass(frozen=True)
+class EpisodeRequest:
+    show_identifier: int
+    season: int
+    episode: int
 
 
-def episode_details(show_identifier: int, season: int, episode: int) -> Optional[Episode]:
-    # https://www.tvmaze.com/api#episode-by-number
-    with requests_session() as r:
-        url = SHOW_EPISODE_DETAILS.format(id=show_identifier, season=season, episode=episode)
+@dataclass(frozen=True)
+class EnrichmentResult:
+    # Both are keyed by (show, season, episode) in the order requests were given; a request is in one of them only
+    episodes: Dict[Tuple[int, int, int], Optional[Episode]]
+    errors: Dict[Tuple[int, int, int], Exception]
+
+
+class TVMazeClient:
+    # It owns one long-lived session, so connections to TVMaze are kept alive and reused by every call 🔌
+    # A single client can be shared across threads, each one borrows a connection from the pool of the session
+    def __init__(
+        self, base_endpoint_address: str = BASE_ENDPOINT_ADDRESS, pool_maxsize: int = DEFAULT_POOL_MAXSIZE, **kwargs
+    ):
+        self.base_endpoint_address = base_endpoint_address
+        self.session = create_session(pool_maxsize=pool_maxsize, **kwargs)
+
+    def __enter__(self) -> "TVMazeClient":
+        return self
+
+    def __exit__(self, *exception_details) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.session.close()
+
+    def show_details(self, identifier: int) -> Optional[Show]:
+        # https://www.tvmaze.com/api#show-main-information
+        body = self._retrieve_body(SHOW_INFORMATION_DETAILS_PATH.format(id=identifier))
+        return _build_show(body) if body is not None else None
+
+    def episode_details(self, show_identifier: int, season: int, episode: int) -> Optional[Episode]:
+        # https://www.tvmaze.com/api#episode-by-number
+        body = self._retrieve_body(SHOW_EPISODE_DETAILS_PATH.format(id=show_identifier, season=season, episode=episode))
+        return _build_episode(body) if body is not None else None
+
+    def all_seasons(self, show_identifier: int) -> Optional[List[Season]]:
+        # https://www.tvmaze.com/api#show-seasons
+        body = self._retrieve_body(SHOW_SEASONS_PATH.format(id=show_identifier))
+        return [_build_season(season) for season in body] if body is not None else None
+
+    def all_episodes(self, season_identifier: int) -> Optional[List[Episode]]:
+        # https://www.tvmaze.com/api#season-episodes
+        body = self._retrieve_body(SHOW_EPISODES_PATH.format(id=season_identifier))
+        return [_build_episode(episode) for episode in body] if body is not None else None
+
+    def main_cast(self, show_identifier: int) -> Optional[List[Cast]]:
+        # https://www.tvmaze.com/api#show-cast
+        body = self._retrieve_body(SHOW_CAST_PATH.format(id=show_identifier))
+        return [_build_cast(cast) for cast in body] if body is not None else None
+
+    def _retrieve_body(self, path: str) -> Optional[Any]:
+        url = f"{self.base_endpoint_address}{path}"
         try:
-            response = r.get(url)
+            response = self.session.get(url)
             status_code = response.status_code
 
             if status_code == 200:
-                body = response.json()
-                # Cleaning summary because it comes as HTML
-                summary_as_html = body["summary"]
-                soup = BeautifulSoup(summary_as_html, "html.parser")
-                summary = soup.text
-                # Transform and validation
-                runtime = body["runtime"]
-                assert type(runtime) is int
-                air_date = date.fromisoformat(body["airdate"])
-                # Final object
-                return Episode(body["name"], air_date, body["runtime"], summary, body["type"])
+                return response.json()
             if status_code == 404:
                 return None
 
@@ -138,120 +185,244 @@ def episode_details(show_identifier: int, season: int, episode: int) -> Optional
             raise e
 
 
-def all_seasons(show_identifier: int) -> Optional[List[Season]]:
-    # https://www.tvmaze.com/api#show-seasons
-    with requests_session() as r:
-        url = SHOW_SEASONS.format(id=show_identifier)
-        try:
-            response = r.get(url)
-            status_code = response.status_code
+def _build_show(body: dict) -> Show:
+    # Network object
+    network_details_from_body = body["network"]
+    network = Network(network_details_from_body["name"], network_details_from_body["country"]["name"])
+    # Cleaning summary because it comes as HTML
+    summary_as_html = body["summary"]
+    summary = html_to_text(summary_as_html)
+    # The final object
+    return Show(body["name"], body["genres"], date.fromisoformat(body["premiered"]), summary, network)
+
+
+def _build_episode(body: dict) -> Episode:
+    # Cleaning summary because it comes as HTML
+    summary_as_html = body["summary"]
+    summary = html_to_text(summary_as_html)
+    # Transform and validation
+    runtime = body["runtime"]
+    assert type(runtime) is int
+    air_date = date.fromisoformat(body["airdate"])
+    # Final object
+    return Episode(
+        body["name"], air_date, body["runtime"], summary, body["type"], body.get("season"), body.get("number")
+    )
+
+
+def _build_season(season: dict) -> Season:
+    # Transform and validation
+    premiered_date = date.fromisoformat(season["premiereDate"])
+    end_date = date.fromisoformat(season["endDate"])
+    season_id = season["id"]
+    season_number = season["number"]
+    number_of_episodes = season["episodeOrder"]
+    assert type(season_id) is int
+    assert type(season_number) is int
+    assert type(number_of_episodes) is int
+    # Final object
+    return Season(season_id, season_number, season["episodeOrder"], premiered_date, end_date)
+
+
+def _build_cast(cast: dict) -> Cast:
+    # Transform and validation
+    character_details = cast["character"]
+    character_id = character_details["id"]
+    assert type(character_id) is int
+    person_details = cast["person"]
+    person_id = person_details["id"]
+    assert type(person_id) is int
+    person_birthday = date.fromisoformat(person_details["birthday"])
+    person_country = person_details["country"]["name"]
+    # Building object
+    character = Character(character_id, character_details["name"])
+    person = Person(person_id, person_details["name"], person_country, person_birthday, person_details["gender"])
+    return Cast(character, person)
+
+
+_default_client: Optional[TVMazeClient] = None
+_default_client_lock = threading.Lock()
+# Every request of the process to TVMaze goes through this one, its counters tell how often TVMaze was pushed back
+rate_limiter = RateLimiter(RATE_LIMIT_CALLS / RATE_LIMIT_PERIOD, RATE_LIMIT_CALLS)
+
+
+def default_client() -> TVMazeClient:
+    # Created on first use and shared by the whole process
+    # Friends metadata hardly ever changes, so its responses come from the HTTP cache unless PYFRIENDS_HTTP_CACHE is off
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = TVMazeClient(cache=http_cache_from_environment(), rate_limiter=rate_limiter)
+        return _default_client
 
-            if status_code == 200:
-                body = response.json()
-                seasons = []
-                for season in body:
-                    # Transform and validation
-                    premiered_date = date.fromisoformat(season["premiereDate"])
-                    end_date = date.fromisoformat(season["endDate"])
-                    season_id = season["id"]
-                    season_number = season["number"]
-                    number_of_episodes = season["episodeOrder"]
-                    assert type(season_id) is int
-                    assert type(season_number) is int
-                    assert type(number_of_episodes) is int
-                    # Final object
-                    season = Season(season_id, season_number, season["episodeOrder"], premiered_date, end_date)
-                    seasons.append(season)
-                return seasons
-            if status_code == 404:
-                return None
 
-            raise UnexpectedBehaviorTVMazeAPIException
-        except RequestException as e:
-            """
-            See more details at: https://requests.readthedocs.io/en/latest/user/quickstart/#errors-and-exceptions
-            """
-            logger.error(f"A network, time-out or HTTP error was caught. Details: {e}")
-            raise e
+def show_details(identifier: int) -> Optional[Show]:
+    return default_client().show_details(identifier)
 
 
-def all_episodes(season_identifier: int) -> Optional[List[Episode]]:
-    # https://www.tvmaze.com/api#season-episodes
-    with requests_session() as r:
-        url = SHOW_EPISODES.format(id=season_identifier)
-        try:
-            response = r.get(url)
-            status_code = response.status_code
+def episode_details(show_identifier: int, season: int, episode: int) -> Optional[Episode]:
+    return default_client().episode_details(show_identifier, season, episode)
 
-            if status_code == 200:
-                body = response.json()
-                episodes = []
-                for episode in body:
-                    # Cleaning summary because it comes as HTML
-                    summary_as_html = episode["summary"]
-                    soup = BeautifulSoup(summary_as_html, "html.parser")
-                    summary = soup.text
-                    # Transform and validation
-                    runtime = episode["runtime"]
-                    assert type(runtime) is int
-                    air_date = date.fromisoformat(episode["airdate"])
-                    # Final object
-                    episode = Episode(episode["name"], air_date, episode["runtime"], summary, episode["type"])
-                    episodes.append(episode)
-                return episodes
-            if status_code == 404:
-                return None
 
-            raise UnexpectedBehaviorTVMazeAPIException
-        except RequestException as e:
-            """
-            See more details at: https://requests.readthedocs.io/en/latest/user/quickstart/#errors-and-exceptions
-            """
-            logger.error(f"A network, time-out or HTTP error was caught. Details: {e}")
-            raise e
+def all_seasons(show_identifier: int) -> Optional[List[Season]]:
+    return default_client().all_seasons(show_identifier)
 
 
-def main_cast(show_identifier: int):
-    # https://www.tvmaze.com/api#show-cast
-    with requests_session() as r:
-        url = SHOW_CAST.format(id=show_identifier)
+def all_episodes(season_identifier: int) -> Optional[List[Episode]]:
+    return default_client().all_episodes(season_identifier)
+
+
+def main_cast(show_identifier: int) -> Optional[List[Cast]]:
+    return default_client().main_cast(show_identifier)
+
+
+def merge_episode_parts(episode_part_1: Episode, episode_part_2: Episode) -> Episode:
+    # Two-part episodes are a single one in the transcripts, only their summaries are joined
+    return replace(episode_part_1, summary=f"{episode_part_1.summary} {episode_part_2.summary}")
+
+
+def build_episode_index(
+    seasons: List[Season],
+    episodes_of_each_season: List[List[Episode]],
+    two_part_numbers: Iterable[Tuple[int, str]] = (),
+) -> Dict[Tuple[int, str], Episode]:
+    # Given all_seasons and all_episodes of each one of them, episodes are found by (season, number) like transcripts
+    # Numbers are like 07. Two-part episodes, like (2, "12/13"), are only there when asked for, with both summaries merged
+    index = {}
+    for season, episodes in zip(seasons, episodes_of_each_season):
+        for episode in episodes:
+            if episode.number is not None:
+                index[(season.number, f"{episode.number:02}")] = episode
+    for season_number, number in two_part_numbers:
+        number_1, number_2 = number.split("/")
+        episode_part_1, episode_part_2 = index.get((season_number, number_1)), index.get((season_number, number_2))
+        if episode_part_1 and episode_part_2:
+            index[(season_number, number)] = merge_episode_parts(episode_part_1, episode_part_2)
+    return index
+
+
+def retrieve_episode_index(
+    show_identifier: int, client: Optional[TVMazeClient] = None, two_part_numbers: Iterable[Tuple[int, str]] = ()
+) -> Dict[Tuple[int, str], Episode]:
+    # One request for the seasons plus one for each season, instead of one for each episode
+    client = client if client is not None else default_client()
+    seasons = client.all_seasons(show_identifier) or []
+    episodes_of_each_season = [client.all_episodes(season.id) or [] for season in seasons]
+    return build_episode_index(seasons, episodes_of_each_season, two_part_numbers)
+
+
+def enrich_many(
+    requests: Iterable[EpisodeRequest], max_workers: int = DEFAULT_MAX_WORKERS, client: Optional[TVMazeClient] = None
+) -> EnrichmentResult:
+    # Details of episodes are requested by a pool of threads sharing the session of the client, so waits overlap ⚡
+    # A failing request doesn't stop the others, its error is kept instead
+    # Requests still go through the rate limiter of the client, for the default one that's the shared rate_limiter,
+    # so max_workers only helps up to what it allows. A client with a limiter of its own (or none) is not bound by it
+    client = client if client is not None else default_client()
+    requests = list(requests)
+
+    def retrieve(request: EpisodeRequest) -> Union[Optional[Episode], Exception]:
         try:
-            response = r.get(url)
-            status_code = response.status_code
-
-            if status_code == 200:
-                body = response.json()
-                casts = []
-                for cast in body:
-                    # Transform and validation
-                    character_details = cast["character"]
-                    character_id = character_details["id"]
-                    assert type(character_id) is int
-                    character_name = character_details["name"]
-                    person_details = cast["person"]
-                    person_id = person_details["id"]
-                    assert type(person_id) is int
-                    person_birthday = date.fromisoformat(person_details["birthday"])
-                    person_country = person_details["country"]["name"]
-                    # Building object
-                    character = Character(character_id, character_details["name"])
-                    person = Person(
-                        person_id, person_details["name"], person_country, person_birthday, person_details["gender"]
-                    )
-                    cast = Cast(character, person)
-                    casts.append(cast)
-
-                return casts
-            if status_code == 404:
-                return None
-
-            raise UnexpectedBehaviorTVMazeAPIException
+            return client.episode_details(request.show_identifier, request.season, request.episode)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tvmaze") as executor:
+        outcomes = list(executor.map(retrieve, requests))
+    return _collect_enrichment(requests, outcomes)
+
+
+async def enrich_many_async(
+    requests: Iterable[EpisodeRequest],
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    client: Optional["AsyncTVMazeClient"] = None,
+) -> EnrichmentResult:
+    # Same as enrich_many from a coroutine. Without a client, one like default_client is opened for these requests only
+    if client is not None:
+        return await client.enrich_many(requests, max_concurrency)
+    async with AsyncTVMazeClient(cache=http_cache_from_environment(), rate_limiter=rate_limiter) as client:
+        return await client.enrich_many(requests, max_concurrency)
+
+
+def _collect_enrichment(
+    requests: List[EpisodeRequest], outcomes: List[Union[Optional[Episode], BaseException]]
+) -> EnrichmentResult:
+    episodes, errors = {}, {}
+    for request, outcome in zip(requests, outcomes):
+        key = (request.show_identifier, request.season, request.episode)
+        if isinstance(outcome, BaseException):
+            errors[key] = outcome
+        else:
+            episodes[key] = outcome
+    return EnrichmentResult(episodes, errors)
+
+
+class AsyncTVMazeClient:
+    # Same calls and dataclasses as TVMazeClient, but awaited over non-blocking connections, so one thread waits for
+    # many answers at once 🚀 Use it as an async context manager: async with AsyncTVMazeClient() as client
+    def __init__(
+        self, base_endpoint_address: str = BASE_ENDPOINT_ADDRESS, pool_maxsize: int = DEFAULT_POOL_MAXSIZE, **kwargs
+    ):
+        self.base_endpoint_address = base_endpoint_address
+        self.http_client = AsyncHTTPClient(pool_maxsize=pool_maxsize, **kwargs)
+
+    async def __aenter__(self) -> "AsyncTVMazeClient":
+        return self
+
+    async def __aexit__(self, *exception_details) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        await self.http_client.close()
+
+    async def show_details(self, identifier: int) -> Optional[Show]:
+        body = await self._retrieve_body(SHOW_INFORMATION_DETAILS_PATH.format(id=identifier))
+        return _build_show(body) if body is not None else None
+
+    async def episode_details(self, show_identifier: int, season: int, episode: int) -> Optional[Episode]:
+        path = SHOW_EPISODE_DETAILS_PATH.format(id=show_identifier, season=season, episode=episode)
+        body = await self._retrieve_body(path)
+        return _build_episode(body) if body is not None else None
+
+    async def all_seasons(self, show_identifier: int) -> Optional[List[Season]]:
+        body = await self._retrieve_body(SHOW_SEASONS_PATH.format(id=show_identifier))
+        return [_build_season(season) for season in body] if body is not None else None
+
+    async def all_episodes(self, season_identifier: int) -> Optional[List[Episode]]:
+        body = await self._retrieve_body(SHOW_EPISODES_PATH.format(id=season_identifier))
+        return [_build_episode(episode) for episode in body] if body is not None else None
+
+    async def main_cast(self, show_identifier: int) -> Optional[List[Cast]]:
+        body = await self._retrieve_body(SHOW_CAST_PATH.format(id=show_identifier))
+        return [_build_cast(cast) for cast in body] if body is not None else None
+
+    async def enrich_many(
+        self, requests: Iterable[EpisodeRequest], max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    ) -> EnrichmentResult:
+        # Every request is gathered at once, the semaphore lets at most max_concurrency of them wait for TVMaze
+        # A failing request doesn't stop the others, its error is kept instead. The rate limiter is still the ceiling
+        requests = list(requests)
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def retrieve(request: EpisodeRequest) -> Optional[Episode]:
+            async with semaphore:
+                return await self.episode_details(request.show_identifier, request.season, request.episode)
+
+        outcomes = await asyncio.gather(*(retrieve(request) for request in requests), return_exceptions=True)
+        return _collect_enrichment(requests, outcomes)
+
+    async def _retrieve_body(self, path: str) -> Optional[Any]:
+        url = f"{self.base_endpoint_address}{path}"
+        try:
+            response = await self.http_client.get(url)
         except RequestException as e:
-            """
-            See more details at: https://requests.readthedocs.io/en/latest/user/quickstart/#errors-and-exceptions
-            """
             logger.error(f"A network, time-out or HTTP error was caught. Details: {e}")
             raise e
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code == 404:
+            return None
+        raise UnexpectedBehaviorTVMazeAPIException
 
 
 class UnexpectedBehaviorTVMazeAPIException(Exception):
@@ -0,0 +1,253 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+
+from collections import Counter
+from collections import deque
+from dataclasses import dataclass
+from datetime import date
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+from typing import Deque
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+
+# Synthetic answers about Friends (show 431), one file per path. They weren't recorded from TVMaze but written by hand
+# in its format, out of what the tests expect, so only their shape and a few values match the real ones
+fixtures_folder = Path(__file__).parent.joinpath("tvmaze_fixtures")
+# Same answer TVMaze gives when something doesn't exist
+not_found_body = {"name": "Not Found", "message": "", "code": 0, "status": 404}
+_episode_by_number_path = re.compile(r"^/shows/(\d+)/episodebynumber$")
+_season_episodes_path = re.compile(r"^/seasons/(\d+)/episodes$")
+
+
+@dataclass(frozen=True)
+class StubBehavior:
+    # Every answer waits latency seconds plus up to jitter seconds more
+    latency: float = 0.0
+    jitter: float = 0.0
+    # Fractions of requests answered with 503 and with 429 whatever they ask for
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    # Like TVMaze, more than rate_limit_calls within rate_limit_period seconds are answered with 429. 0 means no limit
+    rate_limit_calls: int = 0
+    rate_limit_period: float = 10.0
+    retry_after: int = 1
+    # The same seed gives the same sequence of injected failures
+    seed: Optional[int] = None
+
+
+class TVMazeFixtures:
+    # Fixtures are served as they are. Seasons without episode fixtures get placeholder ones built out of the season,
+    # so every (season, episode) of the show can be requested
+    def __init__(self, folder: Path = fixtures_folder):
+        self.bodies: Dict[str, Any] = {}
+        for file in sorted(folder.rglob("*.json")):
+            path = "/" + file.relative_to(folder).with_suffix("").as_posix()
+            self.bodies[path] = json.loads(file.read_text(encoding="utf-8"))
+        self._seasons_by_id: Dict[int, Tuple[int, dict]] = {}
+        for path, body in self.bodies.items():
+            if path.endswith("/seasons"):
+                show_identifier = int(path.split("/")[2])
+                for season in body:
+                    self._seasons_by_id[season["id"]] = show_identifier, season
+
+    def retrieve(self, path: str, query: Dict[str, List[str]]) -> Optional[Any]:
+        if path in self.bodies:
+            return self.bodies[path]
+        match = _season_episodes_path.match(path)
+        if match:
+            return self._season_episodes(int(match.group(1)))
+        match = _episode_by_number_path.match(path)
+        if match:
+            try:
+                season_number, episode_number = int(query["season"][0]), int(query["number"][0])
+            except (KeyError, ValueError):
+                return None
+            return self._episode_by_number(int(match.group(1)), season_number, episode_number)
+        return None
+
+    def _season_episodes(self, season_identifier: int) -> Optional[List[dict]]:
+        if season_identifier not in self._seasons_by_id:
+            return None
+        episodes = self.bodies.get(f"/seasons/{season_identifier}/episodes")
+        if episodes is not None:
+            return episodes
+        _, season = self._seasons_by_id[season_identifier]
+        return [self._placeholder_episode(season, number) for number in range(1, season["episodeOrder"] + 1)]
+
+    def _episode_by_number(self, show_identifier: int, season_number: int, episode_number: int) -> Optional[dict]:
+        for season_identifier, (season_show_identifier, season) in self._seasons_by_id.items():
+            if season_show_identifier == show_identifier and season["number"] == season_number:
+                episodes = self._season_episodes(season_identifier)
+                return next((episode for episode in episodes if episode["number"] == episode_number), None)
+        return None
+
+    @staticmethod
+    def _placeholder_episode(season: dict, number: int) -> dict:
+        # A weekly schedule starting on the premiere of the season, never after its end
+        premiere_date = date.fromisoformat(season["premiereDate"])
+        end_date = date.fromisoformat(season["endDate"])
+        air_date = min(premiere_date + timedelta(weeks=number - 1), end_date)
+        return {
+            "name": f"Season {season['number']}, Episode {number}",
+            "season": season["number"],
+            "number": number,
+            "type": "regular",
+            "airdate": air_date.isoformat(),
+            "runtime": 30,
+            "summary": f"<p>Placeholder summary of episode {number} of season {season['number']}.</p>",
+        }
+
+
+class TVMazeStubServer:
+    # A local stand-in for https://api.tvmaze.com, point TVMAZE_ENDPOINT_API to its address to use it 🎭
+    # Use it as a context manager, or call start and stop. Answered status codes are counted in status_codes
+    def __init__(
+        self,
+        behavior: StubBehavior = StubBehavior(),
+        host: str = "127.0.0.1",
+        port: int = 0,
+        fixtures: Optional[TVMazeFixtures] = None,
+    ):
+        self.behavior = behavior
+        self.fixtures = fixtures if fixtures is not None else TVMazeFixtures()
+        self.status_codes: Counter = Counter()
+        self._random = random.Random(behavior.seed)
+        self._recent_calls: Deque[float] = deque()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._create_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "TVMazeStubServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exception_details) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._server.serve_forever, name="tvmaze-stub", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def serve_forever(self) -> None:
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+
+    def answer(self, raw_path: str) -> Tuple[int, Optional[Any], float]:
+        # Status code, body and how long to wait before answering
+        behavior = self.behavior
+        with self._lock:
+            delay = behavior.latency + self._random.uniform(0, behavior.jitter)
+            draw = self._random.random()
+            status_code = None
+            if self._is_over_rate_limit() or draw < behavior.throttle_rate:
+                status_code = 429
+            elif draw < behavior.throttle_rate + behavior.error_rate:
+                status_code = 503
+            if status_code is None:
+                url = urlsplit(raw_path)
+                body = self.fixtures.retrieve(url.path.rstrip("/"), parse_qs(url.query))
+                status_code = 200 if body is not None else 404
+            self.status_codes[status_code] += 1
+        if status_code == 200:
+            return status_code, body, delay
+        if status_code == 404:
+            return status_code, not_found_body, delay
+        return status_code, None, delay
+
+    def _is_over_rate_limit(self) -> bool:
+        behavior = self.behavior
+        if not behavior.rate_limit_calls:
+            return False
+        now = time.monotonic()
+        while self._recent_calls and now - self._recent_calls[0] >= behavior.rate_limit_period:
+            self._recent_calls.popleft()
+        if len(self._recent_calls) >= behavior.rate_limit_calls:
+            return True
+        self._recent_calls.append(now)
+        return False
+
+    def _create_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                status_code, body, delay = stub.answer(self.path)
+                if delay > 0:
+                    time.sleep(delay)
+                content = json.dumps(body).encode() if body is not None else b""
+                self.send_response(status_code)
+                if status_code in (429, 503):
+                    self.send_header("Retry-After", str(stub.behavior.retry_after))
+                if body is not None:
+                    self.send_header("Content-Type", "application/json; charset=UTF-8")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *arguments):
+                pass
+
+        return Handler
+
+
+def main(arguments: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve synthetic TVMaze answers about Friends locally")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to these seconds are added to the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--rate-limit-calls", type=int, default=0, help="Calls allowed within the period, 0 is off")
+    parser.add_argument("--rate-limit-period", type=float, default=10.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=None)
+    options = parser.parse_args(arguments)
+    behavior = StubBehavior(
+        options.latency,
+        options.jitter,
+        options.error_rate,
+        options.throttle_rate,
+        options.rate_limit_calls,
+        options.rate_limit_period,
+        options.retry_after,
+        options.seed,
+    )
+    server = TVMazeStubServer(behavior, options.host, options.port)
+    print(f"Serving synthetic TVMaze fixtures. Use it with: export TVMAZE_ENDPOINT_API={server.address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
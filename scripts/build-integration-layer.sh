@@ -3,8 +3,6 @@
 # https://www.willianantunes.com/blog/2021/05/production-ready-shell-startup-scripts-the-set-builtin/
 set -eu -o pipefail
 
-# We should be in this folder, otherwise an error will be thrown
-cd ./pyfriends
-
-echo "Running notebooks through ipython 👀"
-ipython -c "%run build_integration_layer.ipynb"
+# Options are given to the CLI as they are, like --incremental to build only episodes whose transcripts have changed
+echo "Running the integration layer pipeline 🏗"
+python -m pyfriends.build "$@"
@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# Tests never touch the cache of whoever runs them: every run gets an empty one, removed once it's over
+_cache_folder = tempfile.TemporaryDirectory(prefix="pyfriends-tests-")
+os.environ["PYFRIENDS_CACHE_FOLDER"] = _cache_folder.name
@@ -0,0 +1,95 @@
+import tempfile
+
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+from unittest import TestCase
+
+from pyfriends.benchmark import BenchmarkCase
+from pyfriends.benchmark import BenchmarkResult
+from pyfriends.benchmark import find_regressions
+from pyfriends.benchmark import load_baseline
+from pyfriends.benchmark import main
+from pyfriends.benchmark import parser_cases
+from pyfriends.benchmark import run_benchmarks
+from pyfriends.benchmark import save_baseline
+
+
+class Benchmarks(TestCase):
+    def setUp(self):
+        temporary_folder = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_folder.cleanup)
+        self.baseline_path = Path(temporary_folder.name).joinpath("baseline.json")
+
+    def test_should_measure_time_and_memory_of_each_case(self):
+        # Arrange
+        calls = []
+        case = BenchmarkCase("allocation", lambda: calls.append(bytearray(1024 * 1024)), rounds=3)
+        # Act
+        results = run_benchmarks([case])
+        # Assert
+        result = results[0]
+        self.assertEqual("allocation", result.name)
+        self.assertEqual(5, len(calls))
+        self.assertLessEqual(result.best_time, result.median_time)
+        self.assertGreaterEqual(result.peak_memory, 1024 * 1024)
+
+    def test_should_report_throughput_given_rounds_tell_how_many_items_they_handled(self):
+        # Arrange
+        case = BenchmarkCase("lines", lambda: len([line.upper() for line in ["a", "b"] * 500]), rounds=2)
+        # Act
+        results = run_benchmarks([case])
+        # Assert
+        self.assertEqual(1000, results[0].items)
+        self.assertAlmostEqual(1000 / results[0].best_time, results[0].throughput)
+
+    def test_should_cover_the_corpus_seasons_pathological_files_and_define_category(self):
+        # Act
+        names = [case.name for case in parser_cases()]
+        # Assert
+        self.assertEqual("corpus", names[0])
+        self.assertEqual([f"season-{season:02}" for season in range(1, 11)], names[1:11])
+        self.assertIn("file-0212-0213", names)
+        self.assertIn("read-0423uncut", names)
+        self.assertIn("read-07outtakes", names)
+        self.assertEqual(["define-category", "classify-lines"], names[-2:])
+
+    def test_should_find_regressions_beyond_thresholds_only(self):
+        # Arrange
+        baseline = {
+            "season-01": BenchmarkResult("season-01", 1.0, 1.1, 1000, 3),
+            "season-02": BenchmarkResult("season-02", 1.0, 1.1, 1000, 3),
+        }
+        results = [
+            BenchmarkResult("season-01", 1.15, 1.2, 1500, 3),
+            BenchmarkResult("season-02", 1.3, 1.4, 1100, 3),
+            BenchmarkResult("season-03", 9.0, 9.0, 9000, 3),
+        ]
+        # Act
+        regressions = find_regressions(results, baseline, time_threshold=0.2, memory_threshold=0.2)
+        # Assert
+        self.assertEqual([("season-01", "memory"), ("season-02", "time")], [(r.name, r.metric) for r in regressions])
+        self.assertAlmostEqual(1.3, regressions[1].ratio)
+
+    def test_should_keep_baselines_of_cases_not_run_again(self):
+        # Arrange
+        save_baseline([BenchmarkResult("corpus", 4.0, 4.1, 100, 1)], self.baseline_path)
+        # Act
+        save_baseline([BenchmarkResult("season-01", 0.4, 0.5, 10, 3)], self.baseline_path)
+        # Assert
+        self.assertEqual(["corpus", "season-01"], sorted(load_baseline(self.baseline_path)))
+
+    def test_should_fail_given_a_case_slower_than_its_baseline(self):
+        # Arrange
+        arguments = ["--cases", "read-07outtakes", "--rounds", "1", "--baseline", str(self.baseline_path)]
+        with redirect_stdout(StringIO()):
+            saved = main([*arguments, "--save-baseline"])
+            tolerant = main([*arguments, "--time-threshold", "100", "--memory-threshold", "100"])
+        save_baseline([BenchmarkResult("read-07outtakes", 1e-9, 1e-9, 1, 1)], self.baseline_path)
+        output = StringIO()
+        # Act
+        with redirect_stdout(output):
+            exit_code = main(arguments)
+        # Assert
+        self.assertEqual((0, 0, 1), (saved, tolerant, exit_code))
+        self.assertIn("Regression in read-07outtakes: time", output.getvalue())
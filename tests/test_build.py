@@ -0,0 +1,49 @@
+import io
+import tempfile
+
+from contextlib import redirect_stdout
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import patch
+
+from pyfriends.build import format_reports
+from pyfriends.build import main
+from pyfriends.pipeline import StageReport
+
+
+class BuildCommand(TestCase):
+    def test_should_build_only_parquet_files_and_report_each_stage(self):
+        with tempfile.TemporaryDirectory() as folder:
+            output = io.StringIO()
+            with redirect_stdout(output):
+                # Act
+                main(["--seasons", "1", "--output", folder, "--skip-database"])
+            # Assert
+            self.assertTrue(Path(folder).joinpath("dialogue.parquet", "SEASON_NUMBER=01", "part-0.parquet").exists())
+        lines = output.getvalue().splitlines()
+        self.assertEqual("Building the whole integration layer 🏗", lines[0])
+        self.assertTrue(lines[1].startswith("Stage"))
+        self.assertEqual(["parse", "parquet"], [line.split()[0] for line in lines[2:]])
+
+    def test_should_build_everything_given_incremental_build_was_asked_but_nothing_was_built_before(self):
+        with tempfile.TemporaryDirectory() as folder:
+            with patch("pyfriends.build.rebuild_integration_layer") as mocked_rebuild_integration_layer:
+                with redirect_stdout(io.StringIO()):
+                    # Act
+                    main(["--seasons", "1", "--output", folder, "--skip-database", "--incremental"])
+            # Assert
+            mocked_rebuild_integration_layer.assert_not_called()
+            self.assertTrue(Path(folder).joinpath("manifest.json").exists())
+
+    def test_should_format_reports_as_a_table(self):
+        # Arrange
+        reports = [StageReport("parse", 3.456, 2 * 1024**2), StageReport("load", 10, 512 * 1024)]
+        # Act
+        table = format_reports(reports)
+        # Assert
+        expected_table = (
+            "Stage        Wall time   Peak memory\n"
+            "parse           3.46 s       2.0 MiB\n"
+            "load           10.00 s       0.5 MiB"
+        )
+        self.assertEqual(expected_table, table)
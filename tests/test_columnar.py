@@ -0,0 +1,87 @@
+from typing import Dict
+from typing import List
+from unittest import TestCase
+
+from pyfriends.columnar import character_schema
+from pyfriends.columnar import dialogue_schema
+from pyfriends.columnar import episode_schema
+from pyfriends.columnar import retrieve_corpus_tables
+from pyfriends.columnar import scene_schema
+from pyfriends.core import retrieve_episode_details
+
+
+def rows_of(table) -> List[Dict]:
+    # Table.to_pylist is newer than the pyarrow pinned in Pipfile.lock
+    columns = table.to_pydict()
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+class CorpusTables(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.season = 1
+        cls.tables = retrieve_corpus_tables([cls.season], use_cache=False)
+        cls.episodes = sorted(retrieve_episode_details(cls.season, use_cache=False), key=lambda episode: episode.number)
+
+    def test_should_retrieve_tables_with_their_schemas(self):
+        self.assertEqual(episode_schema, self.tables.episode.schema)
+        self.assertEqual(dialogue_schema, self.tables.dialogue.schema)
+        self.assertEqual(scene_schema, self.tables.scene.schema)
+        self.assertEqual(character_schema, self.tables.character.schema)
+
+    def test_should_retrieve_one_row_per_episode(self):
+        # Act
+        rows = rows_of(self.tables.episode)
+        # Assert
+        self.assertEqual(len(self.episodes), len(rows))
+        blackout = next(row for row in rows if row["NUMBER"] == "07")
+        expected_row = {
+            "SEASON_NUMBER": 1,
+            "NUMBER": "07",
+            "TITLE": "The One With the Blackout",
+            "TWO_PART_EPISODE": False,
+            "TOTAL_SCENES": 21,
+            "HAS_BEFORE_OPENING": True,
+            "HAS_AFTER_CLOSING_CREDITS": True,
+        }
+        self.assertEqual(expected_row, blackout)
+
+    def test_should_retrieve_one_row_per_transcription_in_order(self):
+        # Arrange
+        episode = self.episodes[0]
+        first_scene = episode.scenes[0]
+        # Act
+        rows = rows_of(self.tables.dialogue)
+        # Assert
+        number_of_transcriptions = sum(
+            len(scene.transcriptions) for parsed_episode in self.episodes for scene in parsed_episode.scenes
+        )
+        self.assertEqual(number_of_transcriptions, len(rows))
+        expected_row = {
+            "SEASON_NUMBER": 1,
+            "EPISODE_NUMBER": episode.number,
+            "CHARACTER_NAME": first_scene.transcriptions[1].character.upper(),
+            "TRANSCRIPTION_ORDER": 2,
+            "TRANSCRIPTION_ORDER_PER_SCENE": 2,
+            "TRANSCRIPTION_LINE": first_scene.transcriptions[1].line,
+            "SCENE_DESCRIPTION": first_scene.description,
+            "SCENE_CATEGORY": first_scene.category.name,
+            "SCENE_ORDER": 1,
+        }
+        self.assertEqual(expected_row, rows[1])
+
+    def test_should_retrieve_scenes_which_have_transcriptions(self):
+        # Act
+        rows = rows_of(self.tables.scene)
+        # Assert
+        number_of_scenes = sum(1 for episode in self.episodes for scene in episode.scenes if scene.transcriptions)
+        self.assertEqual(number_of_scenes, len(rows))
+
+    def test_should_retrieve_each_character_once_telling_whether_it_is_a_main_one(self):
+        # Act
+        rows = rows_of(self.tables.character)
+        # Assert
+        names = [row["NAME"] for row in rows]
+        self.assertEqual(len(set(names)), len(names))
+        main_names = sorted(row["NAME"] for row in rows if row["IS_MAIN"])
+        self.assertEqual(["CHANDLER", "JOEY", "MONICA", "PHOEBE", "RACHEL", "ROSS"], main_names)
@@ -1,10 +1,28 @@
+import gc
+import os
+import shutil
+import tempfile
+import warnings
+
+from pathlib import Path
 from typing import Union
 from unittest import TestCase
+from unittest.mock import patch
 
 from pyfriends.core import Episode
+from pyfriends.core import LineKind
+from pyfriends.core import Paragraph
+from pyfriends.core import ParseProfiler
+from pyfriends.core import ParserEngine
 from pyfriends.core import Scene
 from pyfriends.core import SceneCategory
+from pyfriends.core import _classify_line
+from pyfriends.core import _read_episode_document
+from pyfriends.core import _StreamingEpisodeParser
+from pyfriends.core import folder_seasons
+from pyfriends.core import memory_report
 from pyfriends.core import retrieve_episode_details
+from pyfriends.core import retrieve_episode_details_in_parallel
 
 allow_list_may_have_zero_transcription = [(1, "03"), (1, "09"), (4, "21"), (5, "23"), (9, "09"), (4, "02"), (6, "24")]
 
@@ -40,6 +58,269 @@ class AllSeasons(TestCase):
                         assert transcription.line, error_message
 
 
+class ParallelParsing(TestCase):
+    def test_should_retrieve_the_same_episodes_in_the_same_order_as_sequential_parsing(self):
+        # Arrange
+        season = 1
+        # Act
+        episodes = list(retrieve_episode_details_in_parallel(season, max_workers=2))
+        # Assert
+        expected_episodes = list(retrieve_episode_details(season))
+        self.assertEqual(expected_episodes, episodes)
+
+    def test_should_retrieve_episodes_as_they_are_finished(self):
+        # Arrange
+        season = 2
+        # Act
+        episodes = list(retrieve_episode_details_in_parallel(season, max_workers=2, ordered=False))
+        # Assert
+        expected_episodes = list(retrieve_episode_details(season))
+        self.assertEqual(len(expected_episodes), len(episodes))
+        sort_key = lambda episode: episode.number
+        self.assertEqual(sorted(expected_episodes, key=sort_key), sorted(episodes, key=sort_key))
+
+
+class ParseCache(TestCase):
+    def setUp(self):
+        self.cache_folder = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.cache_folder)
+        cache_folder_patcher = patch("pyfriends.cache_utils.cache_folder", self.cache_folder)
+        cache_folder_patcher.start()
+        self.addCleanup(cache_folder_patcher.stop)
+
+    def test_should_load_episode_from_cache_without_parsing_it_again(self):
+        # Arrange
+        season, episode_number = 1, 7
+        expected_episodes = list(retrieve_episode_details(season, episode_number))
+        # Act
+        with patch("pyfriends.core._read_episode_document", side_effect=AssertionError("It should not be parsed")):
+            episodes = list(retrieve_episode_details(season, episode_number))
+        # Assert
+        self.assertEqual(expected_episodes, episodes)
+        self.assertEqual(expected_episodes, list(retrieve_episode_details(season, episode_number, use_cache=False)))
+
+    def test_should_parse_episode_again_given_its_file_has_changed(self):
+        # Arrange
+        raw_layer_folder = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, raw_layer_folder)
+        episode_path = raw_layer_folder.joinpath("0107.html")
+        shutil.copy(folder_seasons.joinpath("0107.html"), episode_path)
+        with patch("pyfriends.core.folder_seasons", raw_layer_folder):
+            original_episode = list(retrieve_episode_details(1, 7))[0]
+            content = episode_path.read_text(encoding="iso-8859-1")
+            episode_path.write_text(content.replace("the Blackout", "the Power Outage"), encoding="iso-8859-1")
+            # Act
+            changed_episode = list(retrieve_episode_details(1, 7))[0]
+        # Assert
+        self.assertEqual("The One With the Blackout", original_episode.title)
+        self.assertEqual("The One With the Power Outage", changed_episode.title)
+
+    def test_should_keep_episode_number_of_each_file_given_files_have_the_same_content(self):
+        # Arrange
+        raw_layer_folder = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, raw_layer_folder)
+        shutil.copy(folder_seasons.joinpath("0107.html"), raw_layer_folder.joinpath("0107.html"))
+        shutil.copy(folder_seasons.joinpath("0107.html"), raw_layer_folder.joinpath("0108.html"))
+        with patch("pyfriends.core.folder_seasons", raw_layer_folder):
+            expected_numbers = [episode.number for episode in retrieve_episode_details(1, use_cache=False)]
+            list(retrieve_episode_details(1))
+            # Act
+            numbers = [episode.number for episode in retrieve_episode_details(1)]
+        # Assert
+        self.assertEqual(sorted(expected_numbers), sorted(numbers))
+        self.assertEqual(["07", "08"], sorted(numbers))
+
+
+class ParserEngines(TestCase):
+    def test_every_engine_should_retrieve_the_same_episodes_as_html_parser_engine_for_the_whole_show(self):
+        # Arrange
+        expected_episodes = {
+            season: list(retrieve_episode_details(season, use_cache=False, engine=ParserEngine.HTML_PARSER))
+            for season in range(1, 11)
+        }
+        for engine in ParserEngine:
+            for season in range(1, 11):
+                # Act
+                episodes = list(retrieve_episode_details(season, use_cache=False, engine=engine))
+                # Assert
+                self.assertEqual(expected_episodes[season], episodes, f"{engine.value}, season {season}")
+
+    def test_should_choose_engine_through_environment_variable(self):
+        # Arrange
+        season, episode_number = 1, 7
+        with patch.dict(os.environ, {"PYFRIENDS_PARSER_ENGINE": "html.parser"}):
+            with patch("pyfriends.core._StreamingEpisodeParser", side_effect=AssertionError("It should not be used")):
+                # Act
+                episodes = list(retrieve_episode_details(season, episode_number, use_cache=False))
+        # Assert
+        self.assertEqual(1, len(episodes))
+        self.assertEqual("The One With the Blackout", episodes[0].title)
+
+    def test_should_raise_error_given_engine_is_unknown(self):
+        with self.assertRaises(ValueError):
+            list(retrieve_episode_details(1, 7, engine="html5lib"))
+
+    def test_streaming_engine_should_hand_over_paragraphs_without_keeping_the_whole_document(self):
+        # Arrange
+        parser = _StreamingEpisodeParser()
+        parser.feed("<html><head><title>The One With The Stream</title></head><body>")
+        parser.feed("<p><b>Opening Credits</b></p>")
+        parser.feed("<p><b>Ross:</b> Hi!</p>" * 5000)
+        # Act
+        paragraphs = parser.take_ready_paragraphs()
+        # Assert
+        self.assertEqual("The One With The Stream", parser.title)
+        self.assertEqual(5001, len(paragraphs))
+        self.assertEqual(Paragraph("Opening Credits"), paragraphs[0])
+        self.assertEqual(Paragraph("Ross: Hi!", SceneCategory.MAIN), paragraphs[1])
+        self.assertEqual(Paragraph("Ross: Hi!"), paragraphs[-1])
+        self.assertLess(len(parser.strings), 2000)
+
+    def test_streaming_engine_should_leave_no_file_open_given_paragraphs_are_never_read(self):
+        # Arrange
+        episode_path = folder_seasons.joinpath("0107.html")
+        with warnings.catch_warnings(record=True) as caught_warnings:
+            warnings.simplefilter("always", ResourceWarning)
+            # Act
+            document = _read_episode_document(episode_path, ParserEngine.STREAMING)
+            title = document.title
+            del document
+            gc.collect()
+        # Assert
+        self.assertEqual("The One With the Blackout", title)
+        self.assertEqual([], [warning for warning in caught_warnings if warning.category is ResourceWarning])
+
+    def test_html_parser_engine_should_find_keys_split_across_tags(self):
+        # Arrange
+        markup = (
+            "<html><head><title>The One With The Split Key</title></head><body>"
+            "<p>Monica: Hi!</p><div><b>Closing</b>\n<i>CREDITS</i></div><p>Ross: Bye!</p>"
+            "<p>Joey: How you doin'?</p></body></html>"
+        )
+        with tempfile.TemporaryDirectory() as temporary_folder:
+            episode_path = Path(temporary_folder).joinpath("0101.html")
+            episode_path.write_text(markup, encoding="iso-8859-1")
+            # Act
+            document = _read_episode_document(episode_path, ParserEngine.HTML_PARSER)
+        # Assert
+        self.assertEqual("The One With The Split Key", document.title)
+        expected_paragraphs = [
+            Paragraph("Monica: Hi!"),
+            Paragraph("Ross: Bye!", SceneCategory.AFTER_CLOSING_CREDITS),
+            Paragraph("Joey: How you doin'?"),
+        ]
+        self.assertEqual(expected_paragraphs, list(document.paragraphs))
+
+
+class CompactRepresentation(TestCase):
+    def test_should_share_character_names_among_episodes_parsed_by_worker_processes(self):
+        # Act
+        episodes = list(retrieve_episode_details_in_parallel(1, use_cache=False))
+        # Assert
+        first_episode, last_episode = episodes[0], episodes[-1]
+        self.assertFalse(hasattr(first_episode, "__dict__"))
+        self.assertFalse(hasattr(first_episode.scenes[0], "__dict__"))
+        self.assertFalse(hasattr(first_episode.scenes[0].transcriptions[0], "__dict__"))
+
+        def find_character(episode: Episode, name: str) -> str:
+            characters = (transcription.character for scene in episode.scenes for transcription in scene.transcriptions)
+            return next(character for character in characters if character == name)
+
+        self.assertIs(find_character(first_episode, "Ross"), find_character(last_episode, "Ross"))
+
+    def test_should_report_memory_taken_by_episodes(self):
+        # Arrange
+        episodes = list(retrieve_episode_details(1, 7, use_cache=False))
+        # Act
+        report = memory_report(episodes)
+        # Assert
+        self.assertEqual(1, report.episodes)
+        self.assertEqual(21, report.scenes)
+        self.assertEqual(sum(len(scene.transcriptions) for scene in episodes[0].scenes), report.transcriptions)
+        self.assertLess(report.compact_size, report.expanded_size)
+
+
+class ParseProfiling(TestCase):
+    def test_should_profile_each_phase_of_each_episode_parsed_within_it(self):
+        # Act
+        with ParseProfiler() as profiler:
+            episodes = list(retrieve_episode_details(2, 12, use_cache=False))
+            episodes += list(retrieve_episode_details(1, 1, use_cache=False))
+        # Assert
+        fallback_profile, regular_profile = profiler.profiles
+        self.assertEqual(["0212-0213.html", "0101.html"], [profile.file_name for profile in profiler.profiles])
+        self.assertGreater(fallback_profile.timings["fallback"], 0)
+        self.assertNotIn("fallback", regular_profile.timings)
+        self.assertEqual(1, regular_profile.counters["disallowed"])
+        self.assertEqual(2, regular_profile.counters["look_back"])
+        transcriptions = sum(len(scene.transcriptions) for scene in episodes[1].scenes)
+        self.assertEqual(transcriptions, regular_profile.counters["transcriptions"])
+        self.assertAlmostEqual(regular_profile.total_time, sum(regular_profile.timings.values()))
+        table_lines = profiler.table().splitlines()
+        self.assertEqual(4, len(table_lines))
+        self.assertTrue(table_lines[-1].startswith("all"))
+
+    def test_should_split_soup_construction_from_finding_paragraphs(self):
+        # Act
+        with ParseProfiler() as profiler:
+            list(retrieve_episode_details(1, 1, use_cache=False, engine=ParserEngine.HTML_PARSER))
+        # Assert
+        row = profiler.rows()[0]
+        self.assertEqual("html.parser", row["engine"])
+        self.assertGreater(row["soup"], 0)
+        self.assertGreater(row["find_all"], 0)
+        self.assertEqual(343, row["paragraphs"])
+
+    def test_should_record_nothing_out_of_it(self):
+        # Arrange
+        with ParseProfiler() as outer_profiler:
+            with ParseProfiler() as inner_profiler:
+                list(retrieve_episode_details(1, 1, use_cache=False))
+            # Act
+            list(retrieve_episode_details(1, 2, use_cache=False))
+        list(retrieve_episode_details(1, 3, use_cache=False))
+        # Assert
+        self.assertEqual(["0101.html"], [profile.file_name for profile in inner_profiler.profiles])
+        self.assertEqual(["0102.html"], [profile.file_name for profile in outer_profiler.profiles])
+
+
+class LineClassification(TestCase):
+    def test_should_sort_lines_out_in_the_same_order_the_parser_checks_them(self):
+        # Arrange
+        lines = [
+            "",
+            "Written By: Marta Kauffman & David Crane",
+            "Monica: Transcribed by Eric",
+            "[Scene: Central Perk, Chandler, Joey, Phoebe, and Monica are there.]",
+            "[scene: Monica's Apartment]",
+            "Monica: There's nothing to tell! He's just some guy I work with!",
+            "Joey:C'mon, you're going out with the guy!",
+            "Transcriber's Note: this is not a line",
+            f"{'A' * 41}: too long to be a character",
+            "Commercial Break",
+        ]
+        # Act
+        classified_lines = [_classify_line(line) for line in lines]
+        # Assert
+        kinds = [kind for kind, _ in classified_lines]
+        expected_kinds = [
+            LineKind.EMPTY,
+            LineKind.DISALLOWED,
+            LineKind.DISALLOWED,
+            LineKind.SCENE_DETAILS,
+            LineKind.SCENE_DETAILS,
+            LineKind.DIALOGUE,
+            LineKind.DIALOGUE,
+            LineKind.REJECTED,
+            LineKind.REJECTED,
+            LineKind.OTHER,
+        ]
+        self.assertEqual(expected_kinds, kinds)
+        self.assertEqual("Monica's Apartment", classified_lines[4][1].group("description"))
+        self.assertEqual("Joey", classified_lines[6][1].group("character"))
+        self.assertEqual("C'mon, you're going out with the guy!", classified_lines[6][1].group("phrase"))
+
+
 class CustomTestCase(TestCase):
     def general_episode_validation(
         self,
@@ -1,9 +1,28 @@
 import unittest
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 from unittest import TestCase
+from unittest.mock import MagicMock
+from unittest.mock import patch
 
+import pyarrow as pa
+
+from sqlalchemy import create_engine
+from sqlalchemy import text
+
+from pyfriends.database_utils import _forget_shared_engines_after_fork
+from pyfriends.database_utils import copy_rows
+from pyfriends.database_utils import dispose_shared_engines
 from pyfriends.database_utils import execute_query
+from pyfriends.database_utils import generate_connection
+from pyfriends.database_utils import reserve_identifiers
+from pyfriends.database_utils import retrieve_character_ids
+from pyfriends.database_utils import retrieve_season_ids
+from pyfriends.database_utils import retrieve_shared_engine
+from pyfriends.database_utils import stream_query
+from pyfriends.database_utils import stream_query_record_batches
+from pyfriends.database_utils import stream_query_rows
 
 
 class TestModulePathResolution(TestCase):
@@ -40,3 +59,160 @@ class TestModulePathResolution(TestCase):
         # Assert
         expected_object = [(4,)]
         self.assertEqual(expected_object, result)
+
+
+class ConnectionPooling(TestCase):
+    def setUp(self):
+        self.addCleanup(dispose_shared_engines)
+
+    def test_should_share_one_pooled_engine_among_threads(self):
+        # Act
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            engines = list(executor.map(lambda _: retrieve_shared_engine(pool_size=3, pool_recycle=60), range(32)))
+        # Assert
+        engine = engines[0]
+        self.assertTrue(all(other_engine is engine for other_engine in engines))
+        self.assertEqual(3, engine.pool.size())
+        self.assertEqual(60, engine.pool._recycle)
+        self.assertTrue(engine.pool._pre_ping)
+        self.assertIsNot(engine, retrieve_shared_engine(pool_size=4))
+
+    def test_should_borrow_a_connection_from_the_pool_and_give_it_back(self):
+        # Arrange
+        engine = MagicMock()
+        pooled_connection = engine.raw_connection.return_value
+        with patch("pyfriends.database_utils.retrieve_shared_engine", return_value=engine):
+            # Act
+            with self.assertRaises(ValueError):
+                with generate_connection() as connection:
+                    self.assertIs(pooled_connection.connection, connection)
+                    raise ValueError("Something went wrong while loading")
+        # Assert
+        pooled_connection.close.assert_called_once()
+        engine.dispose.assert_not_called()
+
+    def test_should_give_forked_processes_an_empty_pool_without_closing_inherited_connections(self):
+        # Arrange
+        engine = retrieve_shared_engine()
+        inherited_pool = engine.pool
+        # Act
+        with patch.object(inherited_pool, "dispose", side_effect=AssertionError("It should not be disposed")):
+            _forget_shared_engines_after_fork()
+        # Assert
+        self.assertIsNot(inherited_pool, engine.pool)
+        self.assertEqual(inherited_pool.size(), engine.pool.size())
+        self.assertIsNot(engine, retrieve_shared_engine())
+
+    def test_should_keep_the_shared_engine_after_executing_a_query(self):
+        # Arrange
+        engine = MagicMock()
+        with patch("pyfriends.database_utils.retrieve_shared_engine", return_value=engine):
+            # Act
+            execute_query("SELECT 1")
+            execute_query("SELECT 1")
+        # Assert
+        self.assertEqual(2, engine.connect.call_count)
+        engine.dispose.assert_not_called()
+
+
+class BulkLoading(TestCase):
+    def test_should_stream_rows_to_copy_in_its_text_format(self):
+        # Arrange
+        cursor = MagicMock()
+        copied_chunks = []
+
+        def copy_expert(statement, file):
+            # PostgreSQL reads small chunks until there is nothing left
+            while chunk := file.read(8):
+                copied_chunks.append(chunk)
+
+        cursor.copy_expert.side_effect = copy_expert
+        rows = [(1, "Hi!", None), (2, "Tab\there,\nnew line and \\ backslash", "")]
+        # Act
+        copy_rows(cursor, "dialogue", ["number", "text", "scene_id"], rows)
+        # Assert
+        statement = cursor.copy_expert.call_args.args[0]
+        self.assertEqual("COPY dialogue (number, text, scene_id) FROM STDIN", statement)
+        expected_data = "1\tHi!\t\\N\n2\tTab\\there,\\nnew line and \\\\ backslash\t\n"
+        self.assertEqual(expected_data, "".join(copied_chunks))
+        self.assertTrue(all(len(chunk) <= 8 for chunk in copied_chunks))
+
+    def test_should_reserve_identifiers_from_the_identity_sequence(self):
+        # Arrange
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [(10,), (11,), (12,)]
+        # Act
+        identifiers = reserve_identifiers(cursor, "scene", 3)
+        # Assert
+        self.assertEqual([10, 11, 12], identifiers)
+        self.assertEqual(("scene", 3), cursor.execute.call_args.args[1])
+
+
+class KeyResolution(TestCase):
+    def test_should_resolve_all_keys_with_a_single_prepared_statement(self):
+        # Arrange
+        cursor = MagicMock()
+        cursor.fetchall.side_effect = [[(1, 10), (2, 11)], [(3, 12)]]
+        # Act
+        first_season_ids = retrieve_season_ids(cursor, [1, 2])
+        second_season_ids = retrieve_season_ids(cursor, [3])
+        # Assert
+        self.assertEqual({1: 10, 2: 11}, first_season_ids)
+        self.assertEqual({3: 12}, second_season_ids)
+        statements = [call.args[0] for call in cursor.execute.call_args_list]
+        self.assertEqual(1, len([statement for statement in statements if statement.startswith("PREPARE")]))
+        self.assertIn("= ANY($1)", statements[0])
+        self.assertEqual("EXECUTE retrieve_season_ids (%s)", statements[1])
+        self.assertEqual([[1, 2]], cursor.execute.call_args_list[1].args[1])
+
+    def test_should_prepare_statements_again_on_another_connection(self):
+        # Arrange
+        first_cursor, second_cursor = MagicMock(), MagicMock()
+        first_cursor.fetchall.return_value = [(1, 10)]
+        second_cursor.fetchall.side_effect = [[("MONICA", 4)], [(1, 10)]]
+        # Act
+        season_ids = retrieve_season_ids(first_cursor, [1])
+        character_ids = retrieve_character_ids(second_cursor, ["MONICA"])
+        retrieve_season_ids(second_cursor, [1])
+        # Assert
+        self.assertEqual({1: 10}, season_ids)
+        self.assertEqual({"MONICA": 4}, character_ids)
+        second_statements = [call.args[0] for call in second_cursor.execute.call_args_list]
+        self.assertEqual(4, len(second_statements))
+        self.assertTrue(second_statements[2].startswith("PREPARE retrieve_season_ids (SMALLINT[])"))
+
+
+class StreamingQueries(TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        self.addCleanup(self.engine.dispose)
+        with self.engine.begin() as connection:
+            connection.execute(text("CREATE TABLE dialogue (number INT, text TEXT)"))
+            rows = [{"number": number, "text": f"Line {number}"} for number in range(1, 8)]
+            connection.execute(text("INSERT INTO dialogue VALUES (:number, :text)"), rows)
+        self.raw_query = "SELECT number, text FROM dialogue WHERE number >= :first_number ORDER BY number"
+
+    def test_should_stream_rows_in_batches(self):
+        # Act
+        batches = list(stream_query(self.raw_query, self.engine, {"first_number": 2}, batch_size=4))
+        # Assert
+        self.assertEqual([4, 2], [len(rows) for rows in batches])
+        self.assertEqual((2, "Line 2"), tuple(batches[0][0]))
+
+    def test_should_stream_one_row_at_a_time(self):
+        # Act
+        rows = stream_query_rows(self.raw_query, self.engine, {"first_number": 6}, batch_size=1)
+        # Assert
+        self.assertEqual((6, "Line 6"), tuple(next(rows)))
+        self.assertEqual([(7, "Line 7")], [tuple(row) for row in rows])
+
+    def test_should_stream_record_batches(self):
+        # Arrange
+        schema = pa.schema([("number", pa.int16()), ("text", pa.string())])
+        # Act
+        batches = list(stream_query_record_batches(self.raw_query, self.engine, {"first_number": 1}, 5, schema))
+        # Assert
+        self.assertEqual([5, 2], [batch.num_rows for batch in batches])
+        self.assertEqual(schema, batches[0].schema)
+        table = pa.Table.from_batches(batches)
+        self.assertEqual(list(range(1, 8)), table["number"].to_pylist())
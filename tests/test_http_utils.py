@@ -0,0 +1,324 @@
+import asyncio
+import tempfile
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from unittest import IsolatedAsyncioTestCase
+from unittest import TestCase
+from unittest.mock import patch
+
+from requests import ConnectionError as RequestsConnectionError
+
+from pyfriends.http_utils import AsyncHTTPClient
+from pyfriends.http_utils import HTTPCache
+from pyfriends.http_utils import OfflineCacheMissException
+from pyfriends.http_utils import RateLimiter
+from pyfriends.http_utils import parse_retry_after
+from pyfriends.http_utils import requests_session
+
+
+class CachedSession(TestCase):
+    def setUp(self):
+        temporary_folder = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_folder.cleanup)
+        self.cache_folder = Path(temporary_folder.name)
+        cache_folder_patcher = patch("pyfriends.cache_utils.cache_folder", self.cache_folder)
+        cache_folder_patcher.start()
+        self.addCleanup(cache_folder_patcher.stop)
+        received_requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                received_requests.append((self.path, self.headers.get("If-None-Match")))
+                if self.headers.get("If-None-Match") == '"v1"':
+                    self.send_response(304)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                content = b'{"name": "Friends"}' if self.path == "/shows/431" else b"{}"
+                self.send_response(200 if self.path == "/shows/431" else 404)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("ETag", '"v1"')
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *arguments):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.address = f"http://127.0.0.1:{server.server_port}"
+        self.received_requests = received_requests
+
+    def test_should_not_go_to_the_network_given_a_fresh_entry(self):
+        # Arrange
+        with requests_session(cache=HTTPCache()) as session:
+            session.get(f"{self.address}/shows/431")
+            session.get(f"{self.address}/shows/-10")
+        with requests_session(cache=HTTPCache()) as session:
+            # Act
+            show_response = session.get(f"{self.address}/shows/431")
+            missing_show_response = session.get(f"{self.address}/shows/-10")
+        # Assert
+        self.assertEqual(2, len(self.received_requests))
+        self.assertEqual({"name": "Friends"}, show_response.json())
+        self.assertEqual('"v1"', show_response.headers["etag"])
+        self.assertEqual(404, missing_show_response.status_code)
+
+    def test_should_revalidate_a_stale_entry_with_its_etag(self):
+        # Arrange
+        with requests_session(cache=HTTPCache(ttl=0)) as session:
+            session.get(f"{self.address}/shows/431")
+            # Act
+            response = session.get(f"{self.address}/shows/431")
+        # Assert
+        self.assertEqual([("/shows/431", None), ("/shows/431", '"v1"')], self.received_requests)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({"name": "Friends"}, response.json())
+
+    def test_should_answer_only_from_the_cache_given_it_is_offline(self):
+        # Arrange
+        with requests_session(cache=HTTPCache()) as session:
+            session.get(f"{self.address}/shows/431")
+        with requests_session(cache=HTTPCache(ttl=0, offline=True)) as session:
+            # Act
+            response = session.get(f"{self.address}/shows/431")
+            # Assert
+            self.assertEqual({"name": "Friends"}, response.json())
+            with self.assertRaises(OfflineCacheMissException):
+                session.get(f"{self.address}/shows/1")
+        self.assertEqual(1, len(self.received_requests))
+
+    def test_should_go_to_the_network_given_a_corrupted_entry(self):
+        # Arrange
+        with requests_session(cache=HTTPCache()) as session:
+            session.get(f"{self.address}/shows/431")
+        [entry_path] = [path for path in self.cache_folder.rglob("*") if path.is_file()]
+        for corrupted_entry in [b'{"status_code": 200, "rea', b'{"status_code": 200}\n{"name": "Friends"}']:
+            entry_path.write_bytes(corrupted_entry)
+            with requests_session(cache=HTTPCache()) as session:
+                # Act
+                response = session.get(f"{self.address}/shows/431")
+            # Assert
+            self.assertEqual({"name": "Friends"}, response.json())
+        self.assertEqual(3, len(self.received_requests))
+        with requests_session(cache=HTTPCache()) as session:
+            self.assertEqual({"name": "Friends"}, session.get(f"{self.address}/shows/431").json())
+        self.assertEqual(3, len(self.received_requests))
+
+    def test_should_not_cache_anything_given_no_cache(self):
+        # Act
+        with requests_session() as session:
+            session.get(f"{self.address}/shows/431")
+            session.get(f"{self.address}/shows/431")
+        # Assert
+        self.assertEqual(2, len(self.received_requests))
+
+
+class RateLimiting(TestCase):
+    def setUp(self):
+        # Each path answers with the status codes listed in it, one by one, the last one forever
+        received_requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                received_requests.append(self.path)
+                status_codes = self.path.strip("/").split("/")
+                status_code = int(status_codes[min(received_requests.count(self.path), len(status_codes)) - 1])
+                self.send_response(status_code)
+                if status_code == 429:
+                    self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *arguments):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.address = f"http://127.0.0.1:{server.server_port}"
+        self.received_requests = received_requests
+
+    def test_should_throttle_requests_beyond_the_capacity_of_the_bucket(self):
+        # Arrange
+        rate_limiter = RateLimiter(rate=20, capacity=2)
+        started_at = time.monotonic()
+        # Act
+        with requests_session(rate_limiter=rate_limiter) as session:
+            status_codes = [session.get(f"{self.address}/200").status_code for _ in range(4)]
+        # Assert
+        self.assertEqual([200] * 4, status_codes)
+        self.assertEqual(2, rate_limiter.throttled)
+        self.assertEqual(0, rate_limiter.retried)
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.09)
+
+    def test_should_share_the_bucket_with_tasks(self):
+        # Arrange
+        rate_limiter = RateLimiter(rate=20, capacity=1)
+
+        async def acquire_many():
+            await asyncio.gather(*(rate_limiter.acquire_async() for _ in range(3)))
+
+        started_at = time.monotonic()
+        # Act
+        asyncio.run(acquire_many())
+        # Assert
+        self.assertEqual(2, rate_limiter.throttled)
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.09)
+
+    def test_should_wait_what_retry_after_says_given_too_many_requests(self):
+        # Arrange
+        rate_limiter = RateLimiter(rate=100, capacity=10)
+        started_at = time.monotonic()
+        # Act
+        with requests_session(rate_limiter=rate_limiter) as session:
+            response = session.get(f"{self.address}/429/200")
+        # Assert
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(["/429/200", "/429/200"], self.received_requests)
+        self.assertEqual(1, rate_limiter.retried)
+        self.assertEqual(1, rate_limiter.throttled)
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.95)
+
+    def test_should_give_up_after_max_retries_given_server_errors(self):
+        # Arrange
+        rate_limiter = RateLimiter(rate=100, capacity=10, max_retries=2, backoff_factor=0.01)
+        # Act
+        with requests_session(rate_limiter=rate_limiter) as session:
+            response = session.get(f"{self.address}/503")
+        # Assert
+        self.assertEqual(503, response.status_code)
+        self.assertEqual(3, len(self.received_requests))
+        self.assertEqual(2, rate_limiter.retried)
+
+    def test_should_not_retry_anything_given_no_rate_limiter(self):
+        # Act
+        with requests_session() as session:
+            response = session.get(f"{self.address}/503/200")
+        # Assert
+        self.assertEqual(503, response.status_code)
+        self.assertEqual(1, len(self.received_requests))
+
+    def test_should_parse_retry_after_as_seconds_or_http_date(self):
+        # Act
+        seconds = parse_retry_after("120")
+        past_date = parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT")
+        invalid = parse_retry_after("soon")
+        # Assert
+        self.assertEqual(120.0, seconds)
+        self.assertEqual(0.0, past_date)
+        self.assertIsNone(invalid)
+
+
+class AsyncRequests(IsolatedAsyncioTestCase):
+    def setUp(self):
+        temporary_folder = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_folder.cleanup)
+        cache_folder_patcher = patch("pyfriends.cache_utils.cache_folder", Path(temporary_folder.name))
+        cache_folder_patcher.start()
+        self.addCleanup(cache_folder_patcher.stop)
+        # Paths made of status codes answer them one by one like in RateLimiting, /chunked sends its body in pieces
+        received_requests = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                received_requests.append((self.path, self.client_address[1]))
+                if self.path == "/chunked":
+                    self.send_response(200)
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for chunk in [b'{"name": ', b'"Friends"}', b""]:
+                        self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                    return
+                if self.path == "/shows/431":
+                    status_code, content = 200, b'{"name": "Friends"}'
+                else:
+                    status_codes = self.path.strip("/").split("/")
+                    count = len([path for path, _ in received_requests if path == self.path])
+                    status_code, content = int(status_codes[min(count, len(status_codes)) - 1]), b""
+                self.send_response(status_code)
+                if status_code == 429:
+                    self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *arguments):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.address = f"http://127.0.0.1:{server.server_port}"
+        self.received_requests = received_requests
+
+    async def test_should_keep_connections_alive_and_read_chunked_bodies(self):
+        # Arrange
+        async with AsyncHTTPClient() as client:
+            # Act
+            responses = [await client.get(f"{self.address}{path}") for path in ["/shows/431", "/chunked", "/404"]]
+        # Assert
+        self.assertEqual([200, 200, 404], [response.status_code for response in responses])
+        self.assertEqual({"name": "Friends"}, responses[0].json())
+        self.assertEqual({"name": "Friends"}, responses[1].json())
+        self.assertEqual(1, len({client_port for _, client_port in self.received_requests}))
+
+    async def test_should_wait_for_many_answers_at_once(self):
+        # Arrange
+        async with AsyncHTTPClient() as client:
+            # Act
+            responses = await asyncio.gather(*(client.get(f"{self.address}/shows/431") for _ in range(6)))
+        # Assert
+        self.assertEqual([200] * 6, [response.status_code for response in responses])
+        # None of them waited for another one to be answered, thus each one had a connection of its own
+        self.assertEqual(6, len({client_port for _, client_port in self.received_requests}))
+
+    async def test_should_share_the_cache_with_sessions(self):
+        # Arrange
+        with requests_session(cache=HTTPCache()) as session:
+            session.get(f"{self.address}/shows/431")
+        async with AsyncHTTPClient(cache=HTTPCache(ttl=0, offline=True)) as client:
+            # Act
+            response = await client.get(f"{self.address}/shows/431")
+            # Assert
+            self.assertEqual({"name": "Friends"}, response.json())
+            with self.assertRaises(OfflineCacheMissException):
+                await client.get(f"{self.address}/chunked")
+        self.assertEqual(1, len(self.received_requests))
+
+    async def test_should_retry_busy_answers_through_the_rate_limiter(self):
+        # Arrange
+        rate_limiter = RateLimiter(rate=100, capacity=10)
+        started_at = time.monotonic()
+        async with AsyncHTTPClient(rate_limiter=rate_limiter) as client:
+            # Act
+            response = await client.get(f"{self.address}/429/200")
+        # Assert
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, len(self.received_requests))
+        self.assertEqual(1, rate_limiter.retried)
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.95)
+
+    async def test_should_raise_a_connection_error_given_nobody_answers(self):
+        # Arrange
+        async with AsyncHTTPClient(retries=1, backoff_factor=0) as client:
+            # Act
+            with self.assertRaises(RequestsConnectionError) as context:
+                await client.get("http://127.0.0.1:9/shows/431")
+        # Assert
+        self.assertIsInstance(context.exception.__cause__, OSError)
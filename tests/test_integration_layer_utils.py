@@ -0,0 +1,184 @@
+import shutil
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from pyfriends.columnar import dialogue_schema
+from pyfriends.columnar import retrieve_corpus_frames
+from pyfriends.columnar import retrieve_corpus_tables
+from pyfriends.columnar import retrieve_episode_tables
+from pyfriends.core import folder_seasons
+from pyfriends.integration_layer_utils import ParquetOptions
+from pyfriends.integration_layer_utils import load_corpus_frames
+from pyfriends.integration_layer_utils import load_manifest
+from pyfriends.integration_layer_utils import read_integration_table
+from pyfriends.integration_layer_utils import rebuild_integration_layer
+from pyfriends.integration_layer_utils import retrieve_current_manifest
+from pyfriends.integration_layer_utils import save_manifest
+from pyfriends.integration_layer_utils import write_integration_layer
+
+
+class IncrementalRebuild(TestCase):
+    def setUp(self):
+        temporary_folder = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_folder.cleanup)
+        self.raw_layer_folder = Path(temporary_folder.name).joinpath("raw_layer")
+        self.raw_layer_folder.mkdir()
+        for episode_path in folder_seasons.glob("01*.html"):
+            shutil.copy(episode_path, self.raw_layer_folder)
+        for target in ["pyfriends.core.folder_seasons", "pyfriends.integration_layer_utils.folder_seasons"]:
+            folder_patcher = patch(target, self.raw_layer_folder)
+            folder_patcher.start()
+            self.addCleanup(folder_patcher.stop)
+        self.integration_layer_folder = Path(temporary_folder.name).joinpath("integration_layer")
+        self.integration_layer_folder.mkdir()
+        self.build_whole_layer(self.integration_layer_folder)
+
+    def build_whole_layer(self, folder: Path):
+        episode_paths = sorted(self.raw_layer_folder.glob("*.html"))
+        write_integration_layer(retrieve_episode_tables(episode_paths), folder)
+        save_manifest(retrieve_current_manifest(), folder)
+
+    def assert_same_layer(self, expected_folder: Path, folder: Path):
+        for table_name in ["episode", "scene", "dialogue", "character"]:
+            expected_table = pq.read_table(expected_folder.joinpath(f"{table_name}.parquet"))
+            table = pq.read_table(folder.joinpath(f"{table_name}.parquet"))
+            self.assertTrue(expected_table.equals(table), table_name)
+
+    def test_should_not_parse_anything_given_no_episode_has_changed(self):
+        # Arrange
+        with patch("pyfriends.integration_layer_utils.retrieve_episode_tables") as mocked_retrieve_episode_tables:
+            # Act
+            changes = rebuild_integration_layer(self.integration_layer_folder)
+        # Assert
+        self.assertEqual([], changes.changed_entries)
+        self.assertEqual([], changes.removed_entries)
+        mocked_retrieve_episode_tables.assert_not_called()
+
+    def test_should_parse_only_the_changed_episode_and_rewrite_its_season(self):
+        # Arrange
+        episode_path = self.raw_layer_folder.joinpath("0107.html")
+        episode_path.write_bytes(episode_path.read_bytes().replace(b"Blackout", b"Power Outage"))
+        with patch(
+            "pyfriends.integration_layer_utils.retrieve_episode_tables", wraps=retrieve_episode_tables
+        ) as spied_retrieve_episode_tables:
+            # Act
+            changes = rebuild_integration_layer(self.integration_layer_folder)
+        # Assert
+        self.assertEqual(["0107.html"], changes.changed_file_names)
+        self.assertEqual({(1, "07")}, changes.affected_episodes)
+        self.assertEqual([episode_path], spied_retrieve_episode_tables.call_args.args[0])
+        episode_table = pq.read_table(self.integration_layer_folder.joinpath("episode.parquet"))
+        self.assertEqual("The One With the Power Outage", episode_table["TITLE"].to_pylist()[6])
+        with tempfile.TemporaryDirectory() as expected_folder:
+            self.build_whole_layer(Path(expected_folder))
+            self.assert_same_layer(Path(expected_folder), self.integration_layer_folder)
+        self.assertEqual(retrieve_current_manifest(), load_manifest(self.integration_layer_folder))
+
+    def test_should_remove_rows_of_episodes_whose_files_are_gone(self):
+        # Arrange
+        self.raw_layer_folder.joinpath("0124.html").unlink()
+        # Act
+        changes = rebuild_integration_layer(self.integration_layer_folder)
+        # Assert
+        self.assertEqual([], changes.changed_entries)
+        self.assertEqual({(1, "24")}, changes.affected_episodes)
+        with tempfile.TemporaryDirectory() as expected_folder:
+            self.build_whole_layer(Path(expected_folder))
+            self.assert_same_layer(Path(expected_folder), self.integration_layer_folder)
+
+    def test_should_raise_error_given_the_layer_was_never_built(self):
+        # Arrange
+        self.integration_layer_folder.joinpath("manifest.json").unlink()
+        # Act and assert
+        with self.assertRaises(FileNotFoundError):
+            rebuild_integration_layer(self.integration_layer_folder)
+
+
+class PartitionedParquet(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        temporary_folder = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(temporary_folder.cleanup)
+        cls.folder = Path(temporary_folder.name)
+        cls.tables = retrieve_corpus_tables([1, 2], use_cache=False)
+        cls.options = ParquetOptions(compression="gzip", row_group_size=1000)
+        write_integration_layer(cls.tables, cls.folder, cls.options)
+
+    def test_should_write_one_partition_per_season(self):
+        # Act
+        partitions = sorted(path.name for path in self.folder.joinpath("dialogue.parquet").iterdir())
+        # Assert
+        self.assertEqual(["SEASON_NUMBER=01", "SEASON_NUMBER=02"], partitions)
+
+    def test_should_read_only_the_partition_of_the_requested_season(self):
+        # Act
+        dialogue = read_integration_table("dialogue", self.folder, seasons=[2])
+        # Assert
+        expected_dialogue = self.tables.dialogue.filter(pc.equal(self.tables.dialogue["SEASON_NUMBER"], 2))
+        self.assertTrue(expected_dialogue.equals(dialogue.cast(dialogue_schema)))
+
+    def test_should_keep_repetitive_columns_as_dictionaries(self):
+        # Act
+        schema = pq.read_schema(self.folder.joinpath("dialogue.parquet", "SEASON_NUMBER=01", "part-0.parquet"))
+        dialogue_df = pd.read_parquet(self.folder.joinpath("dialogue.parquet"), filters=[("SEASON_NUMBER", "==", 1)])
+        # Assert
+        self.assertTrue(pa.types.is_dictionary(schema.field("CHARACTER_NAME").type))
+        self.assertTrue(pa.types.is_dictionary(schema.field("SCENE_CATEGORY").type))
+        self.assertEqual(pa.string(), schema.field("TRANSCRIPTION_LINE").type)
+        self.assertEqual("category", dialogue_df["CHARACTER_NAME"].dtype.name)
+        self.assertEqual({1}, set(dialogue_df["SEASON_NUMBER"]))
+
+    def test_should_write_row_groups_with_the_given_options(self):
+        # Act
+        metadata = pq.read_metadata(self.folder.joinpath("dialogue.parquet", "SEASON_NUMBER=01", "part-0.parquet"))
+        # Assert
+        self.assertGreater(metadata.num_row_groups, 1)
+        for row_group_index in range(metadata.num_row_groups):
+            row_group = metadata.row_group(row_group_index)
+            self.assertLessEqual(row_group.num_rows, 1000)
+            self.assertEqual("GZIP", row_group.column(0).compression)
+
+
+class BulkDatabaseLoad(TestCase):
+    def test_should_load_a_whole_season_with_a_handful_of_statements(self):
+        # Arrange
+        frames = retrieve_corpus_frames(retrieve_corpus_tables([1], use_cache=False))
+        character_ids = {name: identifier for identifier, name in enumerate(frames.character["NAME"], start=1)}
+        scene_ids = list(range(100, 100 + len(frames.scene)))
+        cursor = MagicMock()
+        cursor.fetchall.side_effect = [
+            list(character_ids.items()),
+            [(1, 7)],
+            [(scene_id,) for scene_id in scene_ids],
+        ]
+        upserted_episodes = [(7, number, identifier) for identifier, number in enumerate(frames.episode["NUMBER"])]
+        copied_rows = {}
+
+        def copy_rows(_, table_name, column_names, rows):
+            copied_rows[table_name] = [dict(zip(column_names, row)) for row in rows]
+
+        with patch(
+            "pyfriends.integration_layer_utils.execute_values", return_value=upserted_episodes
+        ) as mocked_execute:
+            with patch("pyfriends.integration_layer_utils.copy_rows", side_effect=copy_rows):
+                # Act
+                load_corpus_frames(cursor, frames)
+        # Assert
+        statements = [call.args[0] for call in cursor.execute.call_args_list]
+        self.assertEqual(5, len([statement for statement in statements if not statement.startswith("PREPARE")]))
+        self.assertEqual(1, mocked_execute.call_count)
+        self.assertEqual(len(frames.episode), len(mocked_execute.call_args.args[2]))
+        self.assertEqual(scene_ids, [row["id"] for row in copied_rows["scene"]])
+        self.assertEqual(len(frames.dialogue), len(copied_rows["dialogue"]))
+        first_dialogue = copied_rows["dialogue"][0]
+        self.assertEqual(scene_ids[0], first_dialogue["scene_id"])
+        self.assertEqual(character_ids[frames.dialogue["CHARACTER_NAME"][0]], first_dialogue["character_id"])
@@ -0,0 +1,106 @@
+import tempfile
+import tracemalloc
+
+from datetime import date
+from pathlib import Path
+from unittest import TestCase
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pandas as pd
+
+from pyfriends.integration_layer_utils import load_manifest
+from pyfriends.integration_layer_utils import rebuild_integration_layer
+from pyfriends.pipeline import StageProfiler
+from pyfriends.pipeline import run_pipeline
+from pyfriends.tvmaze import Episode
+
+
+class Profiler(TestCase):
+    def test_should_sum_up_wall_time_and_keep_the_highest_peak_memory_of_each_stage(self):
+        # Arrange
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        profiler = StageProfiler()
+        # Act
+        for size in [1024, 1024 * 1024]:
+            with profiler.stage("parse"):
+                memory = bytearray(size)
+            with profiler.stage("parquet"):
+                del memory
+        # Assert
+        parse_report, parquet_report = profiler.reports
+        self.assertEqual("parse", parse_report.name)
+        self.assertEqual("parquet", parquet_report.name)
+        self.assertGreater(parse_report.wall_time, 0)
+        self.assertGreaterEqual(parse_report.peak_memory, 1024 * 1024)
+        self.assertLess(parquet_report.peak_memory, 1024)
+
+
+class Pipeline(TestCase):
+    def setUp(self):
+        temporary_folder = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_folder.cleanup)
+        self.folder = Path(temporary_folder.name)
+
+    def test_should_build_parquet_files_and_manifest_given_there_is_no_database(self):
+        # Act
+        reports = run_pipeline([1, 2], self.folder)
+        # Assert
+        self.assertEqual(["parse", "parquet"], [report.name for report in reports])
+        dialogue_files = sorted(path.name for path in self.folder.joinpath("dialogue.parquet").iterdir())
+        self.assertEqual(["SEASON_NUMBER=01", "SEASON_NUMBER=02"], dialogue_files)
+        episode_df = pd.read_parquet(self.folder.joinpath("episode.parquet"))
+        self.assertEqual([1, 2], sorted(episode_df["SEASON_NUMBER"].unique()))
+        character_df = pd.read_parquet(self.folder.joinpath("character.parquet"))
+        self.assertEqual(6, character_df["IS_MAIN"].sum())
+        manifest = load_manifest(self.folder)
+        self.assertEqual(len(episode_df), len(manifest.entries))
+
+    def test_should_find_nothing_to_rebuild_given_only_some_seasons_were_built(self):
+        # Arrange
+        run_pipeline([1, 2], self.folder)
+        # Act
+        changes = rebuild_integration_layer(self.folder)
+        # Assert
+        self.assertEqual([1, 2], load_manifest(self.folder).seasons)
+        self.assertEqual([], changes.changed_entries)
+        self.assertEqual([], changes.removed_entries)
+
+    def test_should_create_database_tables_before_loading_the_first_season(self):
+        # Arrange
+        connection = MagicMock()
+        calls = []
+        with patch("pyfriends.pipeline.create_database_tables", side_effect=lambda _: calls.append("ddl")):
+            with patch("pyfriends.pipeline.load_show_and_seasons", side_effect=lambda _: calls.append("show")):
+                with patch("pyfriends.pipeline.load", side_effect=lambda _, frames, __: calls.append(frames)):
+                    # Act
+                    reports = run_pipeline([1, 2], self.folder, connection)
+        # Assert
+        self.assertEqual(["parse", "frames", "parquet", "ddl", "load"], [report.name for report in reports])
+        self.assertEqual(["ddl", "show"], calls[:2])
+        first_season_frames, second_season_frames = calls[2:]
+        self.assertEqual({1}, set(first_season_frames.episode["SEASON_NUMBER"]))
+        self.assertEqual({2}, set(second_season_frames.dialogue["SEASON_NUMBER"]))
+
+
+class Enrichment(TestCase):
+    def setUp(self):
+        temporary_folder = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary_folder.cleanup)
+        self.folder = Path(temporary_folder.name)
+
+    def test_should_retrieve_the_episode_index_once_and_give_it_to_every_season(self):
+        # Arrange
+        episode_index = {(1, "01"): Episode("The One Where Monica Gets a Roommate", date(1994, 9, 22), 30, "", "")}
+        loaded_indexes = []
+        with patch("pyfriends.pipeline.create_database_tables"), patch("pyfriends.pipeline.load_show_and_seasons"):
+            with patch("pyfriends.tvmaze.retrieve_episode_index", return_value=episode_index) as mocked_retrieve:
+                with patch("pyfriends.pipeline.load", side_effect=lambda _, __, index: loaded_indexes.append(index)):
+                    # Act
+                    run_pipeline([1, 2], self.folder, MagicMock(), enrich_episodes=True)
+        # Assert
+        mocked_retrieve.assert_called_once_with(
+            431, two_part_numbers=[(2, "12/13"), (6, "15/16"), (9, "23/24"), (10, "17/18")]
+        )
+        self.assertEqual([episode_index, episode_index], loaded_indexes)
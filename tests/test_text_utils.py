@@ -0,0 +1,46 @@
+from unittest import TestCase
+
+from bs4 import BeautifulSoup
+
+from pyfriends.text_utils import clean_line
+from pyfriends.text_utils import html_to_text
+from pyfriends.text_utils import newline_or_nbsp_to_space
+
+
+class HTMLToText(TestCase):
+    def test_should_give_the_same_text_as_beautiful_soup_given_tvmaze_summaries(self):
+        # Arrange
+        summaries = [
+            '<p>Monica and the gang introduce Rachel to the "real world" after she leaves her fiancé at the altar.</p>',
+            "<p><b>Ross</b> finds out his ex-wife is pregnant. Rachel returns her engagement ring to Barry.</p>",
+            "<p>Joey &amp; Chandler&#39;s new neighbor is &quot;Ugly Naked Guy&quot;&#x2026; or is he&nbsp;?</p>",
+            "<p>Part one.</p>\n<p>Part <i>two</i>.<br/>The end</p>",
+            '<a href="https://www.tvmaze.com" title="a > b">TVMaze</a> says a < b',
+            "<!-- <p>hidden</p> -->Shown &eacute;&#150;&euro;",
+            "Plain summary without markup",
+            "",
+        ]
+        # Act
+        texts = [html_to_text(summary) for summary in summaries]
+        # Assert
+        self.assertEqual([BeautifulSoup(summary, "html.parser").text for summary in summaries], texts)
+
+    def test_should_keep_references_without_semicolon_as_they_are(self):
+        # Act
+        text = html_to_text("<p>Tom &amp Jerry &unknown; AT&T</p>")
+        # Assert
+        self.assertEqual("Tom &amp Jerry &unknown; AT&T", text)
+
+
+class Lines(TestCase):
+    def test_should_turn_each_newline_or_nbsp_into_one_space(self):
+        # Act
+        texts = [newline_or_nbsp_to_space(value) for value in ["Ross:\r\nHi", "a\r\r\nb\n\rc", "x\xa0y", "plain"]]
+        # Assert
+        self.assertEqual(["Ross: Hi", "a  b  c", "x y", "plain"], texts)
+
+    def test_should_clean_lines_before_they_are_classified(self):
+        # Act
+        text = clean_line("\r\n\xa0 Monica: Okay!\t\n")
+        # Assert
+        self.assertEqual("Monica: Okay!", text)
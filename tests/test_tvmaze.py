@@ -1,18 +1,40 @@
+import json
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Optional
+from unittest import IsolatedAsyncioTestCase
 from unittest import TestCase
+from unittest.mock import MagicMock
+from unittest.mock import patch
 
+from pyfriends.http_utils import RateLimiter
+from pyfriends.tvmaze import AsyncTVMazeClient
 from pyfriends.tvmaze import Cast
 from pyfriends.tvmaze import Character
 from pyfriends.tvmaze import Episode
+from pyfriends.tvmaze import EpisodeRequest
 from pyfriends.tvmaze import Network
 from pyfriends.tvmaze import Person
 from pyfriends.tvmaze import Season
 from pyfriends.tvmaze import Show
+from pyfriends.tvmaze import TVMazeClient
+from pyfriends.tvmaze import UnexpectedBehaviorTVMazeAPIException
 from pyfriends.tvmaze import all_episodes
 from pyfriends.tvmaze import all_seasons
+from pyfriends.tvmaze import build_episode_index
+from pyfriends.tvmaze import enrich_many
+from pyfriends.tvmaze import enrich_many_async
 from pyfriends.tvmaze import episode_details
 from pyfriends.tvmaze import main_cast
+from pyfriends.tvmaze import retrieve_episode_index
 from pyfriends.tvmaze import show_details
+from pyfriends.tvmaze_stub import StubBehavior
+from pyfriends.tvmaze_stub import TVMazeStubServer
 
 
 class TestTVMaze(TestCase):
@@ -327,3 +349,269 @@ class TestTVMaze(TestCase):
             ),
         ]
         self.assertEqual(expected_list, main_characters)
+
+
+class TestTVMazeClient(TestCase):
+    def setUp(self):
+        opened_connections = []
+        episode_body = {
+            "name": "The One Where Monica Gets a Roommate",
+            "airdate": "1994-09-22",
+            "runtime": 30,
+            "summary": "<p>Monica's old friend Rachel moves in with her after leaving her fiancé.</p>",
+            "type": "regular",
+        }
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                opened_connections.append(self.client_address)
+
+            def do_GET(self):
+                status_code, body = {
+                    "/shows/431/episodebynumber?season=1&number=1": (200, episode_body),
+                    "/shows/431/episodebynumber?season=1&number=99": (404, {}),
+                }.get(self.path, (500, {}))
+                content = json.dumps(body).encode()
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *arguments):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.opened_connections = opened_connections
+        self.client = TVMazeClient(f"http://127.0.0.1:{server.server_port}", retries=0)
+        self.addCleanup(self.client.close)
+
+    def test_should_keep_the_connection_alive_between_calls(self):
+        # Act
+        episodes = [self.client.episode_details(431, 1, 1) for _ in range(5)]
+        # Assert
+        self.assertEqual(1, len(self.opened_connections))
+        self.assertEqual("Monica's old friend Rachel moves in with her after leaving her fiancé.", episodes[-1].summary)
+
+    def test_should_be_shared_across_threads_without_opening_a_connection_per_call(self):
+        # Act
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            episodes = list(executor.map(lambda _: self.client.episode_details(431, 1, 1), range(40)))
+        # Assert
+        self.assertEqual(40, len(episodes))
+        self.assertLessEqual(len(self.opened_connections), 4)
+
+    def test_should_retrieve_nothing_given_not_found_and_raise_error_given_unexpected_status(self):
+        # Act and assert
+        self.assertIsNone(self.client.episode_details(431, 1, 99))
+        with self.assertRaises(UnexpectedBehaviorTVMazeAPIException):
+            self.client.show_details(431)
+
+
+class TestEpisodeIndex(TestCase):
+    def setUp(self):
+        self.seasons = [
+            Season(1716, 1, 3, date(1994, 9, 22), date(1995, 5, 18)),
+            Season(1717, 2, 2, date(1995, 9, 21), date(1996, 5, 16)),
+        ]
+        self.episodes_of_each_season = [
+            [
+                Episode("Part 2", date(1995, 2, 23), 30, "Second part.", "regular", 1, 17),
+                Episode("Part 1", date(1995, 2, 23), 30, "First part.", "regular", 1, 16),
+                Episode("Behind the scenes", date(1995, 3, 1), 30, "Special.", "significant_special", 1, None),
+                Episode("Poker", date(1995, 3, 2), 30, "Poker.", "regular", 1, 18),
+            ],
+            [Episode("Ross's New Girlfriend", date(1995, 9, 21), 30, "Ross returns.", "regular", 2, 1)],
+        ]
+
+    def test_should_index_episodes_by_season_and_number_including_two_part_ones_given_their_transcripts(self):
+        # Act
+        index = build_episode_index(self.seasons, self.episodes_of_each_season, [(1, "16/17"), (2, "01/02")])
+        # Assert
+        self.assertEqual({(1, "16"), (1, "17"), (1, "18"), (1, "16/17"), (2, "01")}, set(index))
+        self.assertEqual("Poker", index[(1, "18")].title)
+        two_part_episode = index[(1, "16/17")]
+        self.assertEqual("Part 1", two_part_episode.title)
+        self.assertEqual("First part. Second part.", two_part_episode.summary)
+
+    def test_should_retrieve_the_index_with_one_request_per_season(self):
+        # Arrange
+        client = MagicMock()
+        client.all_seasons.return_value = self.seasons
+        client.all_episodes.side_effect = self.episodes_of_each_season
+        # Act
+        index = retrieve_episode_index(431, client)
+        # Assert
+        client.all_seasons.assert_called_once_with(431)
+        self.assertEqual([1716, 1717], [call.args[0] for call in client.all_episodes.call_args_list])
+        self.assertEqual("Ross's New Girlfriend", index[(2, "01")].title)
+
+
+class TestEnrichMany(TestCase):
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.requests_in_flight = 0
+        self.max_requests_in_flight = 0
+
+    def fake_episode_details(self, show_identifier: int, season: int, episode: int) -> Optional[Episode]:
+        with self.lock:
+            self.requests_in_flight += 1
+            self.max_requests_in_flight = max(self.max_requests_in_flight, self.requests_in_flight)
+        # Just like waiting for TVMaze
+        time.sleep(0.05)
+        with self.lock:
+            self.requests_in_flight -= 1
+        if episode == 13:
+            raise UnexpectedBehaviorTVMazeAPIException
+        if episode == 99:
+            return None
+        return Episode(f"Episode {season}x{episode}", date(1994, 9, 22), 30, "Summary", "regular", season, episode)
+
+    def test_should_retrieve_episodes_concurrently_in_request_order_and_collect_errors(self):
+        # Arrange
+        requests = [EpisodeRequest(431, season, episode) for season in (2, 1) for episode in (1, 13, 2, 99, 3, 4)]
+        with patch("pyfriends.tvmaze.TVMazeClient.episode_details", side_effect=self.fake_episode_details):
+            # Act
+            result = enrich_many(requests, max_workers=4)
+        # Assert
+        expected_keys = [(431, season, episode) for season in (2, 1) for episode in (1, 2, 99, 3, 4)]
+        self.assertEqual(expected_keys, list(result.episodes))
+        self.assertEqual("Episode 2x3", result.episodes[(431, 2, 3)].title)
+        self.assertIsNone(result.episodes[(431, 1, 99)])
+        self.assertEqual([(431, 2, 13), (431, 1, 13)], list(result.errors))
+        self.assertIsInstance(result.errors[(431, 1, 13)], UnexpectedBehaviorTVMazeAPIException)
+        self.assertEqual(4, self.max_requests_in_flight)
+
+    def test_should_keep_the_same_episode_of_different_shows_apart(self):
+        # Arrange
+        requests = [EpisodeRequest(431, 1, 1), EpisodeRequest(526, 1, 1), EpisodeRequest(526, 1, 13)]
+        with patch("pyfriends.tvmaze.TVMazeClient.episode_details", side_effect=self.fake_episode_details):
+            # Act
+            result = enrich_many(requests)
+        # Assert
+        self.assertEqual([(431, 1, 1), (526, 1, 1)], list(result.episodes))
+        self.assertEqual([(526, 1, 13)], list(result.errors))
+
+
+class TestAsyncTVMazeClient(IsolatedAsyncioTestCase):
+    async def test_should_retrieve_the_same_objects_as_the_blocking_client(self):
+        # Arrange
+        with TVMazeStubServer() as stub_server, TVMazeClient(stub_server.address) as client:
+            expected_objects = [
+                client.show_details(431),
+                client.show_details(-10),
+                client.all_seasons(431),
+                client.all_episodes(1716),
+                client.episode_details(431, 1, 1),
+                client.main_cast(431),
+            ]
+            async with AsyncTVMazeClient(stub_server.address) as async_client:
+                # Act
+                objects = [
+                    await async_client.show_details(431),
+                    await async_client.show_details(-10),
+                    await async_client.all_seasons(431),
+                    await async_client.all_episodes(1716),
+                    await async_client.episode_details(431, 1, 1),
+                    await async_client.main_cast(431),
+                ]
+        # Assert
+        self.assertEqual(expected_objects, objects)
+        self.assertIsNone(objects[1])
+        self.assertEqual(10, len(objects[2]))
+
+    async def test_should_enrich_episodes_concurrently_without_going_over_max_concurrency(self):
+        # Arrange
+        behavior = StubBehavior(latency=0.2)
+        requests = [EpisodeRequest(431, 1, episode) for episode in range(1, 13)] + [EpisodeRequest(431, 1, 99)]
+        with TVMazeStubServer(behavior) as stub_server:
+            async with AsyncTVMazeClient(stub_server.address) as client:
+                started_at = time.monotonic()
+                # Act
+                result = await enrich_many_async(requests, max_concurrency=4, client=client)
+                elapsed_time = time.monotonic() - started_at
+        # Assert
+        self.assertEqual([(431, 1, episode) for episode in [*range(1, 13), 99]], list(result.episodes))
+        self.assertEqual((1, 12), (result.episodes[(431, 1, 12)].season, result.episodes[(431, 1, 12)].number))
+        self.assertIsNone(result.episodes[(431, 1, 99)])
+        self.assertEqual({}, result.errors)
+        # 13 answers taking 0.2 seconds each, 4 at a time
+        self.assertGreaterEqual(elapsed_time, 4 * 0.2)
+        self.assertLess(elapsed_time, 8 * 0.2)
+
+    async def test_should_keep_the_error_of_each_failing_request(self):
+        # Arrange
+        behavior = StubBehavior(error_rate=0.4, seed=7)
+        requests = [EpisodeRequest(431, 1, episode) for episode in range(1, 11)]
+        with TVMazeStubServer(behavior) as stub_server:
+            async with AsyncTVMazeClient(stub_server.address) as client:
+                # Act
+                result = await client.enrich_many(requests)
+            status_codes = stub_server.status_codes
+        # Assert
+        self.assertEqual(status_codes[503], len(result.errors))
+        self.assertGreater(len(result.errors), 0)
+        self.assertEqual(10, len(result.episodes) + len(result.errors))
+        self.assertTrue(
+            all(isinstance(error, UnexpectedBehaviorTVMazeAPIException) for error in result.errors.values())
+        )
+        self.assertTrue(all(episode.number == number for (_, _, number), episode in result.episodes.items()))
+
+
+class TestTVMazeStubServer(TestCase):
+    def test_should_serve_placeholder_episodes_for_seasons_without_episode_fixtures(self):
+        # Arrange
+        with TVMazeStubServer() as stub_server, TVMazeClient(stub_server.address) as client:
+            # Act
+            seasons = client.all_seasons(431)
+            episodes = client.all_episodes(seasons[9].id)
+            episode = client.episode_details(431, 10, 18)
+            missing_episode = client.episode_details(431, 10, 19)
+        # Assert
+        self.assertEqual(18, len(episodes))
+        self.assertEqual((10, 18), (episode.season, episode.number))
+        self.assertEqual(episodes[-1], episode)
+        self.assertLessEqual(episode.air_date, seasons[9].end_date)
+        self.assertIsNone(missing_episode)
+
+    def test_should_inject_latency_and_failures_reproducibly(self):
+        # Arrange
+        behavior = StubBehavior(latency=0.02, error_rate=0.3, throttle_rate=0.2, seed=7)
+        outcomes = []
+        started_at = time.monotonic()
+        # Act
+        for _ in range(2):
+            with TVMazeStubServer(behavior) as stub_server, TVMazeClient(stub_server.address, retries=0) as client:
+                for _ in range(10):
+                    try:
+                        outcomes.append(client.show_details(431).name)
+                    except UnexpectedBehaviorTVMazeAPIException:
+                        outcomes.append(None)
+                status_codes = stub_server.status_codes
+        # Assert
+        self.assertGreaterEqual(time.monotonic() - started_at, 20 * 0.02)
+        self.assertEqual(outcomes[:10], outcomes[10:])
+        self.assertEqual(10, sum(status_codes.values()))
+        self.assertEqual(status_codes[200], outcomes[10:].count("Friends"))
+        self.assertGreater(status_codes[429], 0)
+        self.assertGreater(status_codes[503], 0)
+
+    def test_should_throttle_like_tvmaze_and_be_handled_by_the_rate_limiter(self):
+        # Arrange
+        behavior = StubBehavior(rate_limit_calls=3, rate_limit_period=0.5, retry_after=1)
+        limiter = RateLimiter(rate=100, capacity=10)
+        with TVMazeStubServer(behavior) as stub_server:
+            with TVMazeClient(stub_server.address, rate_limiter=limiter) as client:
+                # Act
+                episodes = [client.episode_details(431, 1, number) for number in range(1, 6)]
+            status_codes = stub_server.status_codes
+        # Assert
+        self.assertEqual(5, len([episode for episode in episodes if episode is not None]))
+        self.assertEqual(1, status_codes[429])
+        self.assertEqual(1, limiter.retried)